@@ -0,0 +1,43 @@
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def append_result(path: Path, benchmark: str, results: dict):
+    """
+    Append a run to a JSON results file, a list of runs with enough context to compare them later
+    :param path:
+    :param benchmark:
+    :param results:
+    :return:
+    """
+    runs = json.loads(path.read_text()) if path.exists() else []
+    runs.append(
+        {
+            "benchmark": benchmark,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "results": results,
+        }
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(runs, indent=2))
@@ -0,0 +1,217 @@
+"""
+Benchmarks for the catalog, carry-forward and encryption hot paths.
+
+Catalogs are synthetic and held in an in-memory session, so these measure quoco's own overhead rather than storage or
+network. Every run is appended to the results file so regressions can be compared:
+
+    python benchmarks/hot_paths.py [--sizes 1000,100000,1000000] [--output benchmarks/results/hot_paths.json]
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import quocofs
+
+from common import append_result
+from quoco.plan import (
+    PLAN_CATALOG_ENTRIES_KEY,
+    PLAN_CATALOG_NAME,
+    PLAN_DATE_FORMAT,
+    CachePlan,
+    Catalog,
+    DayPlan,
+    DecisionStreamPlan,
+    JournalPlan,
+    carry_forward_content,
+)
+from tests.quoco.conftest import MemoryManager
+from tests.quocofs.test_encryption import chunk_boundary_sizes
+
+_SEED = 6_283185307
+_LOOKUPS = 1000
+_DATED_TYPES = [DayPlan, CachePlan, JournalPlan, DecisionStreamPlan]
+_FIRST_DATE = date(1800, 1, 1)
+
+
+def time_call(function: Callable, repeat: int = 5) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"median_s": statistics.median(timings), "min_s": min(timings)}
+
+
+def _synthetic_catalog_data(size: int) -> dict:
+    random.seed(_SEED)
+    entries = {}
+    for i in range(size):
+        entry_type = _DATED_TYPES[i % len(_DATED_TYPES)]
+        hex_id = random.randbytes(16).hex()
+        entries[hex_id] = {
+            "type": entry_type.type_name,
+            "date": (_FIRST_DATE + timedelta(days=i // len(_DATED_TYPES))).strftime(
+                PLAN_DATE_FORMAT
+            ),
+            "id": hex_id,
+        }
+    return {"version": 3, PLAN_CATALOG_ENTRIES_KEY: entries}
+
+
+def _catalog_manager(size: int) -> MemoryManager:
+    manager = MemoryManager()
+    catalog_id = manager.session.create_object(
+        json.dumps(_synthetic_catalog_data(size)).encode("utf-8")
+    )
+    manager.session.set_object_name(catalog_id, PLAN_CATALOG_NAME)
+    return manager
+
+
+def catalog_memory(size: int) -> int:
+    """
+    :param size:
+    :return: Bytes held by a `Catalog` built from parsed JSON data, not counting the data itself
+    """
+    data = _synthetic_catalog_data(size)
+    tracemalloc.start()
+    catalog = Catalog(data, None)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del catalog
+    return memory
+
+
+def benchmark_catalog(size: int) -> dict:
+    manager = _catalog_manager(size)
+    catalog = Catalog.from_quocofs(manager)
+    days = size // len(_DATED_TYPES)
+
+    random.seed(_SEED)
+    lookups = [
+        random.choice(_DATED_TYPES)(
+            datetime.combine(_FIRST_DATE, datetime.min.time())
+            + timedelta(days=random.randrange(days or 1))
+        )
+        for _ in range(_LOOKUPS)
+    ]
+    nths = [
+        (random.choice(_DATED_TYPES), random.randrange(days or 1))
+        for _ in range(_LOOKUPS)
+    ]
+
+    def put_and_save():
+        put_catalog = Catalog.from_quocofs(manager)
+        for i in range(_LOOKUPS):
+            put_catalog.put(
+                DayPlan(datetime(9000, 1, 1) + timedelta(days=i)),
+                random.randbytes(16),
+            )
+        put_catalog.save(manager)
+
+    repeat = 3 if size >= 1_000_000 else 5
+    return {
+        "from_quocofs": time_call(lambda: Catalog.from_quocofs(manager), repeat),
+        f"get_id_x{_LOOKUPS}": time_call(
+            lambda: [catalog.get_id(entry) for entry in lookups], repeat
+        ),
+        f"get_nth_x{_LOOKUPS}": time_call(
+            lambda: [catalog.get_nth(entry_type, n) for entry_type, n in nths], repeat
+        ),
+        # Includes loading the catalog, since every call mutates it
+        f"put_x{_LOOKUPS}_and_save": time_call(put_and_save, repeat),
+        "json_dumps": time_call(lambda: json.dumps(catalog.data), repeat),
+        "memory_bytes": catalog_memory(size),
+    }
+
+
+def benchmark_carry_forward(lines: int) -> dict:
+    manager = MemoryManager()
+    random.seed(_SEED)
+    document = "# day plan\n\n\n" + "\n".join(
+        f"- {random.randbytes(24).hex()}" for _ in range(lines)
+    )
+    id = manager.create_object(document.encode("utf-8"))
+    carry_forward_content(manager, id)
+
+    return {
+        "cached": time_call(lambda: carry_forward_content(manager, id)),
+        "uncached": time_call(
+            lambda: carry_forward_content(
+                manager, manager.create_object(document.encode("utf-8"))
+            )
+        ),
+    }
+
+
+def benchmark_encryption(sizes: List[int]) -> dict:
+    random.seed(_SEED)
+    key = quocofs.key(random.randbytes(20).hex(), random.randbytes(quocofs.SALT_LENGTH))
+    results = {}
+    for size in sizes:
+        data = random.randbytes(size)
+        encrypted = quocofs.dumps(data, key)
+        dumps = time_call(lambda: quocofs.dumps(data, key), 20)
+        loads = time_call(lambda: quocofs.loads(encrypted, key), 20)
+        results[str(size)] = {
+            "dumps": dumps,
+            "loads": loads,
+            "dumps_mb_per_s": size / dumps["median_s"] / 1e6 if size else None,
+            "loads_mb_per_s": size / loads["median_s"] / 1e6 if size else None,
+        }
+    return results
+
+
+def benchmark_key() -> dict:
+    random.seed(_SEED)
+    salt = random.randbytes(quocofs.SALT_LENGTH)
+    return time_call(lambda: quocofs.key(random.randbytes(20).hex(), salt), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default="1000,100000,1000000",
+        help="comma-separated catalog sizes",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path(__file__).parent / "results" / "hot_paths.json",
+    )
+    args = parser.parse_args()
+
+    results = {"catalog": {}, "carry_forward": {}}
+    for size in map(int, args.sizes.split(",")):
+        print(f"catalog: {size} entries", file=sys.stderr)
+        results["catalog"][str(size)] = benchmark_catalog(size)
+    for lines in (100, 10_000):
+        print(f"carry forward: {lines} lines", file=sys.stderr)
+        results["carry_forward"][str(lines)] = benchmark_carry_forward(lines)
+
+    # A few bytes either side of the first boundaries, and of some bigger multiples of CHUNK_LENGTH
+    encryption_sizes = chunk_boundary_sizes(padding=2) + [
+        chunks * quocofs.CHUNK_LENGTH + offset
+        for chunks in (16, 256)
+        for offset in (-1, 0, 1)
+    ]
+    print("encryption", file=sys.stderr)
+    results["encryption"] = benchmark_encryption(encryption_sizes)
+    print("key derivation", file=sys.stderr)
+    results["key"] = benchmark_key()
+
+    print(json.dumps(results, indent=2))
+    append_result(args.output, "hot_paths", results)
+
+
+if __name__ == "__main__":
+    main()
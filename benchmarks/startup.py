@@ -0,0 +1,115 @@
+"""
+Cold-start time of `python -m quoco.app` per command, and which heavy modules each command ends up importing.
+
+Every run appends a record to the results file, so startup regressions can be spotted over time:
+
+    python benchmarks/startup.py [--runs 20] [--output benchmarks/results/startup.json]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import append_result
+
+# Modules that are slow to import and that cheap commands shouldn't need
+TRACKED_MODULES = [
+    "quocofs",
+    "dateutil",
+    "tomli",
+    "xdg",
+    "quoco.plan",
+    "quoco.quocofs_manager",
+    "quoco.quocofs_migration",
+]
+
+
+def _commands(scratch_dir: Path) -> dict:
+    # None of these prompt for a password or need a session
+    return {
+        "help": ["-m", "quoco.app", "--help"],
+        "decrypt-nothing": [
+            "-m",
+            "quoco.app",
+            "--decrypt",
+            str(scratch_dir / "*.missing"),
+        ],
+        "lock-no-agent": ["-m", "quoco.app", "--lock"],
+        "stop-daemon-no-daemon": ["-m", "quoco.app", "--stop-daemon"],
+        # What the default `plan` path imports before it asks for a password
+        "import-plan": ["-c", "import quoco.plan"],
+    }
+
+
+def _imported_modules(importtime_output: str) -> set:
+    modules = set()
+    for line in importtime_output.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip())
+    return modules
+
+
+def measure(arguments: list, runs: int, env: dict) -> dict:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *arguments],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False,
+        )
+        timings.append(time.perf_counter() - start)
+
+    importtime = subprocess.run(
+        [sys.executable, "-X", "importtime", *arguments],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=False,
+    )
+    imported = _imported_modules(importtime.stderr)
+
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "imports": [module for module in TRACKED_MODULES if module in imported],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path(__file__).parent / "results" / "startup.json",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        env = dict(os.environ)
+        # Keep a real daemon or key agent from answering
+        env["XDG_RUNTIME_DIR"] = scratch_dir
+        env["PYTHONPATH"] = os.pathsep.join(
+            filter(None, [str(Path(__file__).parent.parent), env.get("PYTHONPATH")])
+        )
+
+        results = {}
+        for name, arguments in _commands(Path(scratch_dir)).items():
+            results[name] = measure(arguments, args.runs, env)
+            print(
+                f"{name:24} {results[name]['median_ms']:8.1f}ms  imports: {', '.join(results[name]['imports']) or '-'}"
+            )
+
+    append_result(args.output, "startup", results)
+
+
+if __name__ == "__main__":
+    main()
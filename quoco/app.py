@@ -1,72 +1,403 @@
 import json
-from base64 import b64decode
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from pathlib import Path
+from typing import Callable, List, Optional
 
-import quocofs
-
-from quoco.quocofs_manager import QuocoFsManager
-from .plan import whats_the_plan
-from .quocofs_migration import migrate_plan
+from .daemon import run_client
+from .util import trace
 import argparse
 
+# Everything past the daemon client is imported by the commands that need it, so that `plan` talking to a running
+# daemon, and simple commands like --decrypt, don't pay for importing quocofs, the plan module, dateutil or the
+# migration code. `benchmarks/startup.py` keeps track of this.
+
+
+def _key(check: Optional[bytes] = None) -> bytes:
+    """
+    :param check: Ciphertext to check a typed password against when no session has left one in the config directory
+    :return:
+    """
+    from .quocofs_manager import QuocoFsManager, load_config
+
+    config_path = QuocoFsManager.default_config_path()
+    config = load_config(config_path)
+    check = QuocoFsManager.read_key_check(config_path) or check
+    key = QuocoFsManager.key_interactive(config, QuocoFsManager.DEFAULT_SALT, check)
+    # Typed passwords are checked by `key_interactive`, so only a stale key from the agent gets here
+    if check is not None and not QuocoFsManager.key_decrypts(key, check):
+        _forget_key()
+        key = QuocoFsManager.key_interactive(config, QuocoFsManager.DEFAULT_SALT, check)
+    return key
+
+
+def _forget_key():
+    """Drop the key from the agent after it turned out to be wrong, so the next run asks for the password again"""
+    from .key_agent import agent_forget_key
+    from .quocofs_manager import QuocoFsManager
 
-def decrypt(filename):
-    key = quocofs.key(
-        QuocoFsManager.prompt_password(), b64decode(QuocoFsManager.DEFAULT_SALT)
+    agent_forget_key(QuocoFsManager.DEFAULT_SALT)
+
+
+DECRYPTED_SUFFIX = ".decrypted"
+
+
+def _batch_paths(pattern: str, select: Callable[[Path], bool]) -> List[Path]:
+    """
+    Expand a file, directory (searched recursively) or glob into the files to process. Directories and globs only
+    yield files accepted by `select`; a single file is always used as is.
+    """
+    path = Path(pattern)
+    if path.is_file():
+        return [path]
+
+    candidates = (
+        path.rglob("*") if path.is_dir() else map(Path, glob(pattern, recursive=True))
     )
-    with open(filename, "rb") as rfile:
-        with open(f"{filename}.decrypted", "wb") as wfile:
-            wfile.write(quocofs.loads(rfile.read(), key))
+    return sorted(p for p in candidates if p.is_file() and select(p))
+
+
+def _output_paths(
+    paths: List[Path], name: Callable[[str], str], output_dir: Optional[str]
+) -> List[Path]:
+    """
+    :param name: Output file name for an input file name
+    :param output_dir: Directory to write to, keeping the inputs' layout below the directory they have in common.
+    Without it each output goes next to its input.
+    :return:
+    """
+    if output_dir is None:
+        return [path.with_name(name(path.name)) for path in paths]
+
+    base = Path(os.path.commonpath([path.parent.absolute() for path in paths]))
+    return [
+        Path(output_dir, path.parent.absolute().relative_to(base), name(path.name))
+        for path in paths
+    ]
+
+
+def _decrypt_file(path: Path, output_path: Path, key: bytes) -> Path:
+    import quocofs
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_bytes(quocofs.loads(path.read_bytes(), key))
+    return output_path
+
+
+def _encrypt_file(path: Path, output_path: Path, key: bytes) -> Path:
+    import quocofs
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_bytes(quocofs.dumps(path.read_bytes(), key))
+    return output_path
+
+
+def _run_batch(
+    verb: str,
+    paths: List[Path],
+    output_paths: List[Path],
+    process: Callable[[Path, Path, bytes], Path],
+    jobs: int,
+    check: Optional[Path] = None,
+):
+    if not paths:
+        print(f"nothing to {verb}", file=sys.stderr)
+        return
 
+    import quocofs
 
-def encrypt(filename):
-    key = quocofs.key(
-        QuocoFsManager.prompt_password(), b64decode(QuocoFsManager.DEFAULT_SALT)
+    # Derive the key once for the whole batch
+    key = _key(check.read_bytes() if check is not None else None)
+    # Workers read and write the files themselves, so only paths cross process boundaries and at most `jobs` files
+    # are in memory at once
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(process, path, output_path, key): path
+            for path, output_path in zip(paths, output_paths)
+        }
+        failed = 0
+        undecryptable = 0
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except quocofs.DecryptionError:
+                failed += 1
+                undecryptable += 1
+                print(f"couldn't decrypt {futures[future]}", file=sys.stderr)
+            except OSError as e:
+                failed += 1
+                print(f"couldn't {verb} {futures[future]}: {e}", file=sys.stderr)
+
+    # One bad file is more likely corrupt than a sign of the wrong key
+    if undecryptable == len(paths):
+        _forget_key()
+    print(f"{verb}ed {len(paths) - failed} of {len(paths)} files", file=sys.stderr)
+
+
+def decrypt(pattern, jobs=None, output_dir=None):
+    from .quocofs_manager import QuocoFsManager
+
+    paths = _batch_paths(pattern, lambda p: not p.name.endswith(DECRYPTED_SUFFIX))
+    output_paths = _output_paths(paths, lambda n: f"{n}{DECRYPTED_SUFFIX}", output_dir)
+    data_path = QuocoFsManager.default_data_path().resolve()
+    if any(data_path in path.resolve().parents for path in output_paths):
+        print(
+            f"refusing to write plaintext into the data directory {data_path}, pass --output with a directory"
+            " outside of it",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    # Without a key check from a previous session, the first file is the only ciphertext to check the password against
+    _run_batch(
+        "decrypt",
+        paths,
+        output_paths,
+        _decrypt_file,
+        jobs,
+        paths[0] if paths else None,
     )
-    with open(filename, "rb") as rfile:
-        with open(filename.replace(".decrypted", ""), "wb") as wfile:
-            wfile.write(quocofs.dumps(rfile.read(), key))
 
 
-def decrypt_hashes(filename):
-    key = quocofs.key(
-        QuocoFsManager.prompt_password(), b64decode(QuocoFsManager.DEFAULT_SALT)
+def encrypt(pattern, jobs=None, output_dir=None):
+    paths = _batch_paths(pattern, lambda p: p.name.endswith(DECRYPTED_SUFFIX))
+    output_paths = _output_paths(
+        paths, lambda n: n.replace(DECRYPTED_SUFFIX, ""), output_dir
     )
+    _run_batch("encrypt", paths, output_paths, _encrypt_file, jobs)
+
+
+def decrypt_hashes(filename):
+    import quocofs
+
+    key = _key()
     with open(filename, "rb") as rfile:
-        with open(f"{filename}.decrypted", "w") as wfile:
-            json.dump(
-                {
-                    bytes.hex(k): bytes.hex(v)
-                    for k, v in quocofs.hashes.loads(rfile.read(), key).items()
-                },
-                wfile,
-            )
+        try:
+            hashes = quocofs.hashes.loads(rfile.read(), key)
+        except quocofs.DecryptionError:
+            _forget_key()
+            raise
+    with open(f"{filename}.decrypted", "w") as wfile:
+        json.dump({bytes.hex(k): bytes.hex(v) for k, v in hashes.items()}, wfile)
+
+
+def convert_catalog():
+    from .quocofs_manager import QuocoFsManager
+
+    manager = QuocoFsManager(
+        QuocoFsManager.default_data_path(),
+        QuocoFsManager.default_config_path(),
+        QuocoFsManager.DEFAULT_SALT,
+    )
+    if manager.config["plan"]["catalog"] == "partitioned":
+        from .partitioned_catalog import convert_json_catalog
+    else:
+        from .sqlite_catalog import convert_json_catalog
+
+    with manager:
+        convert_json_catalog(manager)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Quoco CLI")
-    parser.add_argument("--decrypt")
-    parser.add_argument("--encrypt")
+    parser.add_argument(
+        "--decrypt", help="decrypt a file, or every file in a directory or glob"
+    )
+    parser.add_argument(
+        "--encrypt",
+        help="encrypt a file, or every .decrypted file in a directory or glob",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="DIR",
+        help="directory to write --decrypt/--encrypt output to (default: next to each file); --decrypt won't write into"
+        " the data directory",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        help="number of files to --decrypt/--encrypt/--export/--ingest at once (default: CPU count)",
+    )
+    parser.add_argument(
+        "--range",
+        nargs=3,
+        metavar=("TYPE", "FROM", "TO"),
+        help="write every plan of a dated TYPE (like d) from FROM to TO (mm.dd.yyyy, inclusive) to stdout",
+    )
+    parser.add_argument(
+        "--search", metavar="QUERY", help="search plans with the search index"
+    )
+    parser.add_argument(
+        "--reindex",
+        action="store_true",
+        help="create or update the search index, re-reading only changed documents",
+    )
+    parser.add_argument(
+        "--export",
+        metavar="PATH",
+        help="write every plan to a tar archive at PATH (- for stdout)",
+    )
+    parser.add_argument(
+        "--encrypted",
+        action="store_true",
+        help="with --export, keep the archive's contents encrypted",
+    )
+    parser.add_argument(
+        "--import",
+        dest="import_path",
+        metavar="PATH",
+        help="restore plans from an --export archive (- for stdin)",
+    )
     parser.add_argument("--decrypt-hashes")
+    parser.add_argument(
+        "--diff-hashes",
+        nargs=2,
+        metavar=("LEFT", "RIGHT"),
+        help="compare two hashes files (perc catalogs or quocofs hashes), or a hashes file and a data directory",
+    )
     parser.add_argument("--migrate")
+    parser.add_argument(
+        "--ingest",
+        metavar="DIR",
+        help="create plans from the markdown files under DIR, named like day_5_3_2022.md; resumes if interrupted",
+    )
+    parser.add_argument(
+        "--convert-catalog",
+        action="store_true",
+        help='convert the JSON plan catalog into the partitioned catalog if plan.catalog is "partitioned", '
+        "otherwise into the SQLite catalog",
+    )
+    parser.add_argument(
+        "--lock", action="store_true", help="make the key agent forget the key"
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep a session open in the foreground for later plan invocations to use",
+    )
+    parser.add_argument(
+        "--stop-daemon", action="store_true", help="stop a running daemon"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"time each phase, printing a summary to stderr and writing a Chrome trace to a temp file; also enabled "
+        f"by {trace.PROFILE_ENV_VAR}=PATH, or {trace.PROFILE_ENV_VAR}=1",
+    )
+    parser.add_argument(
+        "--profile-output",
+        metavar="PATH",
+        help="with --profile, write the trace to PATH (implies --profile)",
+    )
     args, unknown = parser.parse_known_args()
 
+    if args.profile_output:
+        trace.enable(args.profile_output)
+    else:
+        trace.enable_from_env(always=args.profile)
+
+    try:
+        _run(args, unknown)
+    finally:
+        trace.finish()
+
+
+def _run(args: argparse.Namespace, unknown: List[str]):
     if args.decrypt:
-        decrypt(args.decrypt)
+        decrypt(args.decrypt, args.jobs, args.output)
         return
 
     if args.encrypt:
-        encrypt(args.encrypt)
+        encrypt(args.encrypt, args.jobs, args.output)
+        return
+
+    if args.range:
+        from .plan import export_plan_range
+
+        export_plan_range(*args.range)
+        return
+
+    if args.search:
+        from .search import search_plans
+
+        search_plans(args.search)
+        return
+
+    if args.reindex:
+        from .search import reindex_plans
+
+        reindex_plans()
+        return
+
+    if args.export:
+        from .backup import export_store
+
+        export_store(args.export, args.encrypted, args.jobs)
+        return
+
+    if args.import_path:
+        from .backup import import_store
+
+        import_store(args.import_path)
         return
 
     if args.decrypt_hashes:
         decrypt_hashes(args.decrypt_hashes)
         return
 
+    if args.diff_hashes:
+        from .hashes_diff import print_hashes_diff
+
+        if not print_hashes_diff(*args.diff_hashes, _key, args.jobs):
+            sys.exit(1)
+        return
+
     if args.migrate:
+        from .quocofs_migration import migrate_plan
+
         migrate_plan(args.migrate)
         return
 
-    whats_the_plan(" ".join(unknown) if len(unknown) else None)
+    if args.ingest:
+        from .quocofs_migration import ingest_directory
+
+        ingest_directory(args.ingest, args.jobs)
+        return
+
+    if args.convert_catalog:
+        convert_catalog()
+        return
+
+    if args.lock:
+        from .key_agent import stop_agent
+
+        if not stop_agent():
+            print("key agent isn't running", file=sys.stderr)
+        return
+
+    if args.daemon:
+        from .daemon import run_daemon
+
+        run_daemon()
+        return
+
+    if args.stop_daemon:
+        from .daemon import stop_daemon
+
+        if not stop_daemon():
+            print("daemon isn't running", file=sys.stderr)
+        return
+
+    plan_args = " ".join(unknown) if len(unknown) else None
+    # A running daemon would do the work in another process, out of sight of the profile
+    if not trace.is_enabled() and run_client(plan_args):
+        return
+
+    from .plan import whats_the_plan
+
+    whats_the_plan(plan_args)
 
 
 if __name__ == "__main__":
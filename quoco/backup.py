@@ -0,0 +1,216 @@
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from .plan import PlanEntry, entry_from_serialized, load_catalog
+from .quocofs_manager import QuocoFsManager
+
+# Archive layout: a manifest first, so that imports can stream the archive, then one member per document.
+#     manifest.json: {"version": 1, "encrypted": <bool>, "documents": {<member name>: <serialized entry>}}
+#     plans/<PlanEntry.name()>.md
+# In encrypted archives each member (the manifest included) is encrypted on its own with the store's key and gets a
+# `.quoco` suffix.
+BACKUP_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+DOCUMENTS_DIR = "plans"
+ENCRYPTED_SUFFIX = ".quoco"
+
+
+def _member_name(name: str, encrypted: bool) -> str:
+    return f"{name}{ENCRYPTED_SUFFIX}" if encrypted else name
+
+
+def _add_member(archive: tarfile.TarFile, name: str, data: bytes, mtime: float):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(mtime)
+    info.mode = 0o600
+    archive.addfile(info, io.BytesIO(data))
+
+
+def _document_names(entries: List[Tuple[str, PlanEntry]]) -> List[str]:
+    names = []
+    used = set()
+    for hex_id, entry in entries:
+        name = f"{DOCUMENTS_DIR}/{entry.name()}.md"
+        if name in used:
+            # Some names (like weeks within a month) aren't unique
+            name = f"{DOCUMENTS_DIR}/{entry.name()}_{hex_id[:8]}.md"
+        used.add(name)
+        names.append(name)
+    return names
+
+
+def write_backup(
+    manager: QuocoFsManager,
+    catalog,
+    output: BinaryIO,
+    encrypted: bool = False,
+    jobs: Optional[int] = None,
+) -> int:
+    """
+    Stream every document in the catalog into a tar archive. Documents are read one at a time, since reads go through
+    the session one at a time anyway. For encrypted archives they're re-encrypted on a thread pool, with at most a few
+    per worker held in memory while they wait to be written in order.
+    :param manager:
+    :param catalog:
+    :param output: Writable binary stream; doesn't need to be seekable
+    :param encrypted: Keep the archive's contents encrypted with the store's key
+    :param jobs: Encryption worker count, defaults to the CPU count
+    :return: Number of documents written
+    """
+    entries = list(catalog.entries())
+    names = _document_names(entries)
+    now = time.time()
+
+    manifest = json.dumps(
+        {
+            "version": BACKUP_VERSION,
+            "encrypted": encrypted,
+            "documents": {
+                name: entry.serialize() for name, (_, entry) in zip(names, entries)
+            },
+        }
+    ).encode("utf-8")
+
+    jobs = jobs or os.cpu_count() or 1
+    with tarfile.open(fileobj=output, mode="w|") as archive, ThreadPoolExecutor(
+        max_workers=jobs
+    ) as executor:
+        _add_member(
+            archive,
+            _member_name(MANIFEST_NAME, encrypted),
+            manager.encrypt(manifest) if encrypted else manifest,
+            now,
+        )
+
+        pending = deque()
+        for name, (hex_id, _) in zip(names, entries):
+            data = manager.read_object(bytes.fromhex(hex_id))
+            if not encrypted:
+                _add_member(archive, name, data, now)
+                continue
+            pending.append((name, executor.submit(manager.encrypt, data)))
+            if len(pending) >= jobs * 2:
+                name, future = pending.popleft()
+                _add_member(
+                    archive, _member_name(name, encrypted), future.result(), now
+                )
+        while pending:
+            name, future = pending.popleft()
+            _add_member(archive, _member_name(name, encrypted), future.result(), now)
+
+    return len(entries)
+
+
+def read_backup(manager: QuocoFsManager, catalog, input: BinaryIO) -> Tuple[int, int]:
+    """
+    Restore documents from an archive written by `write_backup`. Plans that the catalog already has are left alone.
+    The catalog is only put to; saving it is up to the caller.
+    :param manager:
+    :param catalog:
+    :param input: Readable binary stream; doesn't need to be seekable
+    :return: (documents restored, documents skipped)
+    """
+    restored = 0
+    skipped = 0
+    with tarfile.open(fileobj=input, mode="r|*") as archive:
+        manifest: Optional[dict] = None
+        encrypted = False
+        documents: Dict[str, dict] = {}
+
+        for member in archive:
+            if not member.isfile():
+                continue
+            data = archive.extractfile(member).read()
+
+            if manifest is None:
+                encrypted = member.name == _member_name(MANIFEST_NAME, True)
+                if member.name not in (
+                    MANIFEST_NAME,
+                    _member_name(MANIFEST_NAME, True),
+                ):
+                    raise ValueError(f"{member.name} isn't a quoco backup manifest")
+                manifest = json.loads(manager.decrypt(data) if encrypted else data)
+                if manifest.get("version") != BACKUP_VERSION:
+                    raise ValueError(
+                        f"can't import backup version {manifest.get('version')}, expected {BACKUP_VERSION}"
+                    )
+                documents = manifest["documents"]
+                continue
+
+            name = (
+                member.name[: -len(ENCRYPTED_SUFFIX)]
+                if encrypted and member.name.endswith(ENCRYPTED_SUFFIX)
+                else member.name
+            )
+            if name not in documents:
+                continue
+
+            entry = entry_from_serialized(documents[name])
+            if catalog.get_id(entry) is not None:
+                skipped += 1
+                continue
+
+            document_id = manager.create_object(
+                manager.decrypt(data) if encrypted else data
+            )
+            catalog.put(entry, document_id)
+            restored += 1
+
+    return restored, skipped
+
+
+def _default_manager() -> QuocoFsManager:
+    return QuocoFsManager(
+        QuocoFsManager.default_data_path(),
+        QuocoFsManager.default_config_path(),
+        QuocoFsManager.DEFAULT_SALT,
+    )
+
+
+def export_store(path: str, encrypted: bool = False, jobs: Optional[int] = None):
+    """
+    :param path: Archive path, or "-" for stdout
+    :param encrypted:
+    :param jobs:
+    :return:
+    """
+    manager = _default_manager()
+    with manager:
+        catalog = load_catalog(manager)
+        if path == "-":
+            count = write_backup(manager, catalog, sys.stdout.buffer, encrypted, jobs)
+            sys.stdout.buffer.flush()
+        else:
+            # The archive holds every plan, in plaintext unless `encrypted`, so only the user gets to read it
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as output:
+                count = write_backup(manager, catalog, output, encrypted, jobs)
+    print(f"exported {count} documents", file=sys.stderr)
+
+
+def import_store(path: str):
+    """
+    :param path: Archive path, or "-" for stdin
+    :return:
+    """
+    manager = _default_manager()
+    with manager:
+        catalog = load_catalog(manager)
+        if path == "-":
+            restored, skipped = read_backup(manager, catalog, sys.stdin.buffer)
+        else:
+            with open(path, "rb") as input:
+                restored, skipped = read_backup(manager, catalog, input)
+        catalog.save(manager)
+    print(
+        f"imported {restored} documents, skipped {skipped} that already exist",
+        file=sys.stderr,
+    )
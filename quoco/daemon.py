@@ -0,0 +1,202 @@
+import json
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+from .util.sockets import (
+    connect_private_socket,
+    listen_private_socket,
+    peer_is_same_user,
+    runtime_socket_path,
+)
+
+_CONNECT_TIMEOUT = 1
+
+# Long-running process that keeps a session open, so that `plan` can skip the password prompt and session startup.
+# The catalog is loaded again for every request, because commands that don't go through the daemon (--range, --ingest,
+# --profile and so on) write it too, and saving a stale copy would overwrite their delta log slots. Clients keep their
+# connection open for the whole edit, which means edits are handled one at a time:
+#     client: {"op": "open", "args": <plan arguments or null>}
+#     daemon: {"command": <editor command to run>} | {"error": <message>}
+#     client: {"op": "done"} (or disconnects)
+#     daemon: {"ok": true}
+# {"op": "stop"} makes the daemon close its session and exit.
+
+
+def default_socket_path() -> Path:
+    return runtime_socket_path("daemon.sock")
+
+
+def _send(connection: socket.socket, message: dict):
+    connection.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+def _handle_edit(manager, connection_file, connection, args):
+    from .plan import load_catalog, resolve_plan_documents
+    from .search import update_search_index
+
+    catalog = load_catalog(manager)
+    document_ids = resolve_plan_documents(manager, catalog, args)
+    # Record new documents right away rather than waiting on the editor
+    catalog.save(manager)
+
+    temp_paths = manager.materialize_documents(document_ids)
+    try:
+        _send(connection, {"command": manager.vim_command(temp_paths)})
+
+        # Wait for the client's editor to exit. A client that disconnects without saying it's done still gets its
+        # edits written back, the same as if it had.
+        connection.settimeout(None)
+        connection_file.readline()
+    finally:
+        # Also deletes the plaintext temp files
+        changed_ids = manager.commit_documents(document_ids, temp_paths)
+    manager.report_materialize_timings()
+    update_search_index(manager, changed_ids)
+    _send(connection, {"ok": True})
+
+
+def _serve(manager, connection: socket.socket) -> bool:
+    """
+    Handle one client connection
+    :param manager:
+    :param connection:
+    :return: False if the client asked the daemon to stop
+    """
+    with connection.makefile("r") as connection_file:
+        connection.settimeout(_CONNECT_TIMEOUT)
+        try:
+            request = json.loads(connection_file.readline())
+        except (socket.timeout, ValueError):
+            return True
+
+        if not isinstance(request, dict):
+            _send(connection, {"error": "unknown request"})
+            return True
+
+        if request.get("op") == "open":
+            try:
+                _handle_edit(manager, connection_file, connection, request.get("args"))
+            except Exception as e:
+                # Bad plan arguments, like c+x, shouldn't take the daemon down with them
+                print(f"request failed: {e!r}", file=sys.stderr)
+                try:
+                    _send(connection, {"error": str(e)})
+                except OSError:
+                    pass
+        elif request.get("op") == "stop":
+            _send(connection, {"ok": True})
+            return False
+        else:
+            _send(connection, {"error": "unknown request"})
+    return True
+
+
+def run_daemon(socket_path: Optional[Path] = None):
+    from .quocofs_manager import QuocoFsManager
+
+    manager = QuocoFsManager(
+        QuocoFsManager.default_data_path(),
+        QuocoFsManager.default_config_path(),
+        QuocoFsManager.DEFAULT_SALT,
+    )
+
+    socket_path = socket_path or default_socket_path()
+    idle_timeout = manager.config["daemon"]["idle_timeout"]
+
+    # Edits are only pushed when the session closes. Closing the terminal or logging out sends SIGHUP or SIGTERM,
+    # which would otherwise kill the daemon without closing it.
+    previous_handlers = {
+        signum: signal.signal(signum, _exit_on_signal)
+        for signum in (signal.SIGTERM, signal.SIGHUP)
+    }
+    try:
+        with manager:
+            _accept_loop(manager, socket_path, idle_timeout)
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+
+
+def _exit_on_signal(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+def _accept_loop(manager, socket_path: Path, idle_timeout: float):
+    server = listen_private_socket(socket_path)
+    print(f"quoco daemon listening on {socket_path}", file=sys.stderr)
+
+    last_request = time.monotonic()
+    try:
+        while True:
+            remaining = idle_timeout - (time.monotonic() - last_request)
+            if remaining <= 0:
+                break
+            server.settimeout(remaining)
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                continue
+
+            with connection:
+                if peer_is_same_user(connection) and not _serve(manager, connection):
+                    break
+            last_request = time.monotonic()
+    finally:
+        server.close()
+        socket_path.unlink(missing_ok=True)
+
+
+def run_client(args: Optional[str], socket_path: Optional[Path] = None) -> bool:
+    """
+    Open plan documents through a running daemon
+    :param args: Plan arguments, as for `plan.whats_the_plan`
+    :param socket_path:
+    :return: False if there's no daemon to talk to
+    """
+    try:
+        connection = connect_private_socket(
+            socket_path or default_socket_path(), _CONNECT_TIMEOUT
+        )
+    except OSError:
+        return False
+
+    with connection, connection.makefile("r") as connection_file:
+        connection.settimeout(None)
+        _send(connection, {"op": "open", "args": args})
+        response_line = connection_file.readline()
+        if not response_line:
+            print("quoco daemon closed the connection", file=sys.stderr)
+            return True
+
+        response = json.loads(response_line)
+        if "error" in response:
+            print(response["error"], file=sys.stderr)
+            return True
+
+        subprocess.call(response["command"], shell=True)
+        _send(connection, {"op": "done"})
+        connection_file.readline()
+    return True
+
+
+def stop_daemon(socket_path: Optional[Path] = None) -> bool:
+    """
+    :return: Whether there was a daemon to stop
+    """
+    try:
+        connection = connect_private_socket(
+            socket_path or default_socket_path(), _CONNECT_TIMEOUT
+        )
+    except OSError:
+        return False
+
+    with connection, connection.makefile("r") as connection_file:
+        connection.settimeout(None)
+        _send(connection, {"op": "stop"})
+        connection_file.readline()
+    return True
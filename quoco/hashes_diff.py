@@ -0,0 +1,172 @@
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from hashlib import sha256
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+import quocofs
+
+from .perc_catalog import PERC_HEADER, PercReader
+
+_OBJECT_NAME_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+@dataclass
+class HashesDiff:
+    # Ids only in the left hashes, e.g. objects a sync would have to fetch
+    only_left: List[bytes] = field(default_factory=list)
+    # Ids only in the right hashes
+    only_right: List[bytes] = field(default_factory=list)
+    # Ids in both with different hashes
+    mismatched: List[bytes] = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.only_left or self.only_right or self.mismatched)
+
+
+def diff_hashes(
+    left: Iterable[Tuple[bytes, bytes]], right: Iterable[Tuple[bytes, bytes]]
+) -> HashesDiff:
+    """
+    Sort-merge two streams of (id, hash) pairs
+    :param left: Sorted by id
+    :param right: Sorted by id
+    :return:
+    """
+    diff = HashesDiff()
+    left = iter(left)
+    right = iter(right)
+    left_record = next(left, None)
+    right_record = next(right, None)
+
+    while left_record is not None and right_record is not None:
+        left_id, left_hash = left_record
+        right_id, right_hash = right_record
+        if left_id < right_id:
+            diff.only_left.append(left_id)
+            left_record = next(left, None)
+        elif right_id < left_id:
+            diff.only_right.append(right_id)
+            right_record = next(right, None)
+        else:
+            if left_hash != right_hash:
+                diff.mismatched.append(left_id)
+            left_record = next(left, None)
+            right_record = next(right, None)
+
+    while left_record is not None:
+        diff.only_left.append(left_record[0])
+        left_record = next(left, None)
+    while right_record is not None:
+        diff.only_right.append(right_record[0])
+        right_record = next(right, None)
+
+    return diff
+
+
+def _perc_records(path: Path) -> List[Tuple[bytes, bytes]]:
+    # Sorted here rather than required of the file, since older catalogs weren't written in order
+    with PercReader(path) as reader:
+        reader.validate()
+        records = []
+        for id, hash in reader:
+            records.append((bytes(id), bytes(hash)))
+            id.release()
+            hash.release()
+    return sorted(records)
+
+
+def _plaintext_hash(path: Path, key: bytes) -> str:
+    """
+    :param path:
+    :param key:
+    :return: Hex sha256 of an object's plaintext, or "" if it doesn't decrypt, so that it shows up as different
+    """
+    try:
+        return sha256(quocofs.loads(path.read_bytes(), key)).hexdigest()
+    except quocofs.DecryptionError:
+        return ""
+
+
+def local_hashes(
+    data_path: Union[str, Path], key: bytes, jobs: Optional[int] = None
+) -> List[Tuple[bytes, bytes]]:
+    """
+    Decrypt and hash the objects in a local data directory. Hashes are of plaintext, the same as the perc catalogs
+    that `create_hashes` builds from plan documents, which is what quoco takes quocofs hashes files to record too.
+    :param data_path:
+    :param key:
+    :param jobs:
+    :return: (id, sha256 of the plaintext) pairs, sorted by id
+    """
+    object_paths = sorted(
+        path
+        for path in Path(data_path).iterdir()
+        if path.is_file() and _OBJECT_NAME_PATTERN.fullmatch(path.name)
+    )
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        hashes = executor.map(
+            partial(_plaintext_hash, key=key), object_paths, chunksize=16
+        )
+        return [
+            (bytes.fromhex(path.name), bytes.fromhex(hash))
+            for path, hash in zip(object_paths, hashes)
+        ]
+
+
+def load_hashes(
+    path: Union[str, Path], key: Callable[[], bytes], jobs: Optional[int] = None
+) -> Iterable[Tuple[bytes, bytes]]:
+    """
+    :param path: A perc catalog, an encrypted quocofs hashes file, or a local data directory
+    :param key: Called for the key if `path` is an encrypted hashes file or a data directory
+    :param jobs: Worker count for hashing a data directory
+    :return: (id, hash) pairs, sorted by id
+    """
+    path = Path(path)
+    if path.is_dir():
+        return local_hashes(path, key(), jobs)
+
+    with open(path, "rb") as hashes_file:
+        header = hashes_file.read(len(PERC_HEADER))
+    if header == PERC_HEADER:
+        return _perc_records(path)
+
+    return sorted(quocofs.hashes.loads(path.read_bytes(), key()).items())
+
+
+def print_hashes_diff(
+    left: str, right: str, key: Callable[[], bytes], jobs: Optional[int] = None
+) -> bool:
+    """
+    :param left:
+    :param right:
+    :param key:
+    :param jobs:
+    :return: Whether the hashes match
+    """
+    cached_key = []
+
+    def key_once() -> bytes:
+        if not cached_key:
+            cached_key.append(key())
+        return cached_key[0]
+
+    diff = diff_hashes(
+        load_hashes(left, key_once, jobs), load_hashes(right, key_once, jobs)
+    )
+    for prefix, ids in (
+        ("-", diff.only_left),
+        ("+", diff.only_right),
+        ("~", diff.mismatched),
+    ):
+        for id in ids:
+            print(f"{prefix} {id.hex()}")
+
+    print(
+        f"{len(diff.only_left)} only in {left}, {len(diff.only_right)} only in {right}, "
+        f"{len(diff.mismatched)} different"
+    )
+    return not diff
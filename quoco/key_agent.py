@@ -0,0 +1,210 @@
+import argparse
+import ctypes
+import ctypes.util
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from .util.sockets import (
+    connect_private_socket,
+    listen_private_socket,
+    peer_is_same_user,
+    runtime_socket_path,
+)
+
+_CONNECT_TIMEOUT = 1
+_START_TIMEOUT = 2
+_PR_SET_DUMPABLE = 4
+
+
+def default_socket_path() -> Path:
+    return runtime_socket_path("agent.sock")
+
+
+class _LockedKeys:
+    """Keys stored in mlocked buffers that are zeroed when they're dropped"""
+
+    def __init__(self):
+        self._keys: Dict[str, bytearray] = {}
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True) if libc_name else None
+
+    def _buffer_address(self, buffer: bytearray) -> int:
+        return ctypes.addressof((ctypes.c_char * len(buffer)).from_buffer(buffer))
+
+    def get(self, salt: str) -> Optional[bytes]:
+        key = self._keys.get(salt)
+        return bytes(key) if key is not None else None
+
+    def put(self, salt: str, key: bytes):
+        self.forget(salt)
+        buffer = bytearray(key)
+        # Best effort: without CAP_IPC_LOCK this can fail once RLIMIT_MEMLOCK is used up
+        if self._libc is not None:
+            self._libc.mlock(
+                ctypes.c_void_p(self._buffer_address(buffer)),
+                ctypes.c_size_t(len(buffer)),
+            )
+        self._keys[salt] = buffer
+
+    def forget(self, salt: str):
+        buffer = self._keys.pop(salt, None)
+        if buffer is None:
+            return
+        buffer[:] = bytes(len(buffer))
+        if self._libc is not None:
+            self._libc.munlock(
+                ctypes.c_void_p(self._buffer_address(buffer)),
+                ctypes.c_size_t(len(buffer)),
+            )
+
+    def forget_all(self):
+        for salt in list(self._keys):
+            self.forget(salt)
+
+
+# ssh-agent style process that holds derived keys so that `plan` doesn't have to prompt for the password and run the
+# (deliberately slow) KDF on every launch. Keys are kept in locked memory and handed out over a Unix socket that only
+# the current user can connect to; they're wiped when the agent exits after `idle_timeout` seconds without a request.
+#
+# One request line per connection, one response line back:
+#     GET <salt>           -> KEY <hex key> | NONE
+#     PUT <salt> <hex key> -> OK
+#     FORGET <salt>        -> OK
+#     STOP                 -> OK (wipes keys and exits)
+def run_agent(socket_path: Path, idle_timeout: float):
+    # Keep keys out of core dumps and away from ptrace by other processes
+    libc_name = ctypes.util.find_library("c")
+    if libc_name and sys.platform.startswith("linux"):
+        ctypes.CDLL(libc_name).prctl(_PR_SET_DUMPABLE, 0, 0, 0, 0)
+
+    keys = _LockedKeys()
+    server = listen_private_socket(socket_path)
+
+    last_request = time.monotonic()
+    try:
+        while True:
+            remaining = idle_timeout - (time.monotonic() - last_request)
+            if remaining <= 0:
+                break
+            server.settimeout(remaining)
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                continue
+
+            with connection:
+                if not peer_is_same_user(connection):
+                    continue
+                last_request = time.monotonic()
+                connection.settimeout(_CONNECT_TIMEOUT)
+                try:
+                    request = connection.makefile("r").readline().split()
+                except (socket.timeout, UnicodeDecodeError):
+                    continue
+
+                if request[:1] == ["GET"] and len(request) == 2:
+                    key = keys.get(request[1])
+                    response = f"KEY {key.hex()}" if key is not None else "NONE"
+                elif request[:1] == ["PUT"] and len(request) == 3:
+                    try:
+                        keys.put(request[1], bytes.fromhex(request[2]))
+                        response = "OK"
+                    except ValueError:
+                        response = "ERROR"
+                elif request[:1] == ["FORGET"] and len(request) == 2:
+                    keys.forget(request[1])
+                    response = "OK"
+                elif request == ["STOP"]:
+                    connection.sendall(b"OK\n")
+                    break
+                else:
+                    response = "ERROR"
+                connection.sendall(f"{response}\n".encode("ascii"))
+    finally:
+        keys.forget_all()
+        server.close()
+        socket_path.unlink(missing_ok=True)
+
+
+def _request(socket_path: Path, request: str) -> Optional[str]:
+    """
+    :return: The agent's response, or None if there's no agent to talk to
+    """
+    try:
+        with connect_private_socket(socket_path, _CONNECT_TIMEOUT) as client:
+            client.sendall(f"{request}\n".encode("ascii"))
+            return client.makefile("r").readline().strip()
+    except OSError:
+        return None
+
+
+def agent_key(salt: str, socket_path: Optional[Path] = None) -> Optional[bytes]:
+    response = _request(socket_path or default_socket_path(), f"GET {salt}")
+    if response is None or not response.startswith("KEY "):
+        return None
+    return bytes.fromhex(response[4:])
+
+
+def agent_store_key(
+    salt: str, key: bytes, idle_timeout: float, socket_path: Optional[Path] = None
+) -> bool:
+    """
+    Hand a key to the agent, starting the agent if it isn't running
+    :return: Whether the agent took the key
+    """
+    socket_path = socket_path or default_socket_path()
+    if _request(socket_path, f"PUT {salt} {key.hex()}") == "OK":
+        return True
+
+    subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "quoco.key_agent",
+            "--socket",
+            str(socket_path),
+            "--idle-timeout",
+            str(idle_timeout),
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + _START_TIMEOUT
+    while time.monotonic() < deadline:
+        if _request(socket_path, f"PUT {salt} {key.hex()}") == "OK":
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def agent_forget_key(salt: str, socket_path: Optional[Path] = None) -> bool:
+    """
+    Make the agent drop a key that turned out to be wrong
+    :return: Whether there was an agent to tell
+    """
+    return _request(socket_path or default_socket_path(), f"FORGET {salt}") == "OK"
+
+
+def stop_agent(socket_path: Optional[Path] = None) -> bool:
+    """
+    :return: Whether there was an agent to stop
+    """
+    return _request(socket_path or default_socket_path(), "STOP") == "OK"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="quoco key agent")
+    parser.add_argument("--socket", type=Path, default=default_socket_path())
+    parser.add_argument("--idle-timeout", type=float, default=900)
+    args = parser.parse_args()
+    run_agent(args.socket, args.idle_timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import json
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Type
+
+from .plan import (
+    DEFAULT_PLAN_CATALOG_DATA,
+    PLAN_CATALOG_ENTRIES_KEY,
+    PLAN_CATALOG_NAME,
+    PLAN_TYPES_BY_NAME,
+    Catalog,
+    PlanEntry,
+    PlanEntryWithDate,
+    entry_from_serialized,
+)
+from .quocofs_manager import QuocoFsManager
+from .util.trace import span, traced
+
+PLAN_CATALOG_PARTITIONED_NAME = "plan_catalog_partitioned"
+PARTITIONED_CATALOG_VERSION = 1
+_PARTITIONS_KEY = "partitions"
+
+
+def _partition_name(serialized: dict) -> str:
+    """
+    Dated entries are partitioned by type and year, like "day/2022". Undated entries get a partition per type.
+    :param serialized: An entry as it's stored in the catalog
+    :return:
+    """
+    if "date" in serialized:
+        # Dates are stored as DD-MM-YYYY
+        return f"{serialized['type']}/{serialized['date'][-4:]}"
+    return serialized["type"]
+
+
+def _empty_partition() -> Catalog:
+    return Catalog({"version": 3, PLAN_CATALOG_ENTRIES_KEY: {}}, None)
+
+
+class PartitionedCatalog:
+    """
+    Catalog engine that splits entries into one encrypted quocofs object per plan type and year, listed in a small
+    root manifest. Partitions are only decrypted when a lookup needs them, so old years cost nothing to start up.
+
+    Each partition is a `plan.Catalog` without a delta log. Has the same API as `plan.Catalog`.
+    """
+
+    def __init__(
+        self, manager: QuocoFsManager, manifest: dict, id: Optional[bytes] = None
+    ):
+        if manifest.get("version") != PARTITIONED_CATALOG_VERSION:
+            raise ValueError(
+                f"can't read partitioned catalog version {manifest.get('version')}, expected "
+                f"{PARTITIONED_CATALOG_VERSION}"
+            )
+
+        self._manager = manager
+        self.manifest = manifest
+        self.id = id
+        # Partition name -> catalog, for partitions that have been decrypted or created
+        self._partitions: Dict[str, Catalog] = {}
+        self._dirty: set = set()
+
+    @staticmethod
+    def from_json_data(
+        manager: QuocoFsManager, data: dict, id: Optional[bytes] = None
+    ) -> "PartitionedCatalog":
+        """
+        Build a catalog from version 3 JSON catalog data. Every partition is dirty, so the first save writes them all.
+        :param manager:
+        :param data:
+        :param id:
+        :return:
+        """
+        if data.get("version") != 3:
+            raise ValueError(
+                f"can't convert JSON catalog version {data.get('version')}, expected 3"
+            )
+
+        catalog = PartitionedCatalog(
+            manager, {"version": PARTITIONED_CATALOG_VERSION, _PARTITIONS_KEY: {}}, id
+        )
+        partition_entries: Dict[str, dict] = {}
+        for hex_id, serialized in data[PLAN_CATALOG_ENTRIES_KEY].items():
+            partition_entries.setdefault(_partition_name(serialized), {})[
+                hex_id
+            ] = serialized
+
+        for name, entries in partition_entries.items():
+            partition = Catalog({"version": 3, PLAN_CATALOG_ENTRIES_KEY: entries}, None)
+            catalog._add_partition(name, next(iter(entries.values())), partition)
+        return catalog
+
+    def merge_json_data(self, data: dict) -> int:
+        """
+        Add the entries of version 3 JSON catalog data that this catalog doesn't have yet. Entries already here win,
+        like in `plan.Catalog`. Entries of types this version of quoco doesn't know are skipped.
+        :param data:
+        :return: Number of entries added
+        """
+        if data.get("version") != 3:
+            raise ValueError(
+                f"can't convert JSON catalog version {data.get('version')}, expected 3"
+            )
+
+        entries = [
+            (entry_from_serialized(serialized), bytes.fromhex(hex_id))
+            for hex_id, serialized in data[PLAN_CATALOG_ENTRIES_KEY].items()
+            if serialized["type"] in PLAN_TYPES_BY_NAME
+        ]
+        self._load_partitions(
+            _partition_name(entry.serialize()) for entry, _ in entries
+        )
+        count = self._count()
+        for entry, id in entries:
+            self.put(entry, id)
+        return self._count() - count
+
+    def _count(self) -> int:
+        return sum(info["count"] for info in self.manifest[_PARTITIONS_KEY].values())
+
+    @staticmethod
+    @traced("PartitionedCatalog.from_quocofs")
+    def from_quocofs(manager: QuocoFsManager) -> "PartitionedCatalog":
+        catalog_id = manager.session.object_id_with_name(PLAN_CATALOG_PARTITIONED_NAME)
+        if catalog_id:
+            with span("decrypt_manifest"):
+                manifest = json.loads(manager.session.object(catalog_id))
+            return PartitionedCatalog(manager, manifest, catalog_id)
+
+        return convert_json_catalog(manager)
+
+    def _add_partition(self, name: str, serialized: dict, partition: Catalog):
+        self.manifest[_PARTITIONS_KEY][name] = {
+            "type": serialized["type"],
+            "year": int(serialized["date"][-4:]) if "date" in serialized else None,
+            "id": None,
+            "count": len(partition),
+        }
+        self._partitions[name] = partition
+        self._dirty.add(name)
+
+    def _decrypt_partition(self, name: str) -> Catalog:
+        hex_id = self.manifest[_PARTITIONS_KEY][name]["id"]
+        with span("decrypt_partition", partition=name):
+            data = json.loads(self._manager.read_object(bytes.fromhex(hex_id)))
+        return Catalog(data, bytes.fromhex(hex_id))
+
+    def _load_partitions(self, names: Iterable[str]) -> None:
+        """
+        Decrypt the named partitions that are in the manifest and haven't been loaded yet
+        :param names:
+        :return:
+        """
+        for name in dict.fromkeys(names):
+            if name not in self._partitions and name in self.manifest[_PARTITIONS_KEY]:
+                self._partitions[name] = self._decrypt_partition(name)
+
+    def _partition(self, name: str) -> Optional[Catalog]:
+        self._load_partitions([name])
+        return self._partitions.get(name)
+
+    def _type_partitions(self, type_name: str) -> List[tuple[int, str]]:
+        """
+        :param type_name:
+        :return: (year, partition name) for every partition of a dated type, oldest first
+        """
+        return sorted(
+            (info["year"], name)
+            for name, info in self.manifest[_PARTITIONS_KEY].items()
+            if info["type"] == type_name and info["year"] is not None
+        )
+
+    def get_id(self, entry: PlanEntry) -> Optional[bytes]:
+        partition = self._partition(_partition_name(entry.serialize()))
+        return partition.get_id(entry) if partition is not None else None
+
+    def get_ids(self, entries: List[PlanEntry]) -> List[Optional[bytes]]:
+        self._load_partitions(_partition_name(entry.serialize()) for entry in entries)
+        return [self.get_id(entry) for entry in entries]
+
+    def entries(self) -> Iterator[tuple[str, PlanEntry]]:
+        """
+        :return: (hex id, entry) for every document in the catalog
+        """
+        self._load_partitions(list(self.manifest[_PARTITIONS_KEY]))
+        for partition in self._partitions.values():
+            yield from partition.entries()
+
+    def put(self, entry: PlanEntry, id: bytes):
+        serialized = entry.serialize()
+        name = _partition_name(serialized)
+        partition = self._partition(name)
+        if partition is None:
+            partition = _empty_partition()
+            self._add_partition(name, serialized, partition)
+        if partition.get_id(entry) is not None:
+            return
+
+        partition.put(entry, id)
+        self.manifest[_PARTITIONS_KEY][name]["count"] += 1
+        self._dirty.add(name)
+
+    def get_nth(
+        self, entry_type: Type[PlanEntryWithDate], n: int
+    ) -> Optional[tuple[str, PlanEntryWithDate]]:
+        # Counts in the manifest say which year the entry is in, so only that year is decrypted
+        for _, name in reversed(self._type_partitions(entry_type.type_name)):
+            count = self.manifest[_PARTITIONS_KEY][name]["count"]
+            if n < count:
+                return self._partition(name).get_nth(entry_type, n)
+            n -= count
+        return None
+
+    def get_range(
+        self, entry_type: Type[PlanEntryWithDate], start: date, end: date
+    ) -> List[tuple[str, PlanEntryWithDate]]:
+        """
+        Entries of a type dated from `start` to `end`, inclusive
+        :param entry_type:
+        :param start:
+        :param end:
+        :return: (hex id, entry) pairs, oldest first
+        """
+        names = [
+            name
+            for year, name in self._type_partitions(entry_type.type_name)
+            if start.year <= year <= end.year
+        ]
+        self._load_partitions(names)
+        return [
+            id_entry
+            for name in names
+            for id_entry in self._partitions[name].get_range(entry_type, start, end)
+        ]
+
+    @traced("PartitionedCatalog.save")
+    def save(self, manager: QuocoFsManager):
+        """
+        Write changed partitions, then the manifest. Writes nothing if nothing was put since the last save, unless the
+        manifest hasn't been written yet.
+        :param manager:
+        :return:
+        """
+        if not self._dirty and self.id is not None:
+            return
+
+        for name in sorted(self._dirty):
+            partition = self._partitions[name]
+            data = json.dumps(partition.data).encode("utf-8")
+            if partition.id is None:
+                partition.id = manager.session.create_object(data)
+                self.manifest[_PARTITIONS_KEY][name]["id"] = partition.id.hex()
+            else:
+                manager.session.modify_object(partition.id, data)
+
+        manifest = json.dumps(self.manifest).encode("utf-8")
+        if self.id is None:
+            self.id = manager.session.create_object(manifest)
+            manager.session.set_object_name(self.id, PLAN_CATALOG_PARTITIONED_NAME)
+        else:
+            manager.session.modify_object(self.id, manifest)
+        self._dirty = set()
+
+
+def convert_json_catalog(manager: QuocoFsManager) -> PartitionedCatalog:
+    """
+    Convert the version 3 JSON catalog, including its delta log, into a partitioned catalog. If there already is a
+    partitioned catalog, JSON entries it doesn't have are merged into it, so entries added through the partitioned
+    engine since an earlier conversion are kept. The JSON catalog is left untouched.
+    :param manager:
+    :return:
+    """
+    json_data = (
+        Catalog.from_quocofs(manager).data
+        if manager.session.object_id_with_name(PLAN_CATALOG_NAME)
+        else DEFAULT_PLAN_CATALOG_DATA
+    )
+
+    if manager.session.object_id_with_name(PLAN_CATALOG_PARTITIONED_NAME):
+        catalog = PartitionedCatalog.from_quocofs(manager)
+        catalog.merge_json_data(json_data)
+    else:
+        catalog = PartitionedCatalog.from_json_data(manager, json_data)
+    catalog.save(manager)
+    return catalog
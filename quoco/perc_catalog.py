@@ -0,0 +1,178 @@
+import mmap
+import os
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple, Union
+
+# Binary hashes catalog: a header, then fixed-width records sorted by id
+#     b"perc\0" (<16-byte id> b"\0" <32-byte sha256>)*
+# Catalogs written before records were sorted can be in any order. They can still be read in full, but lookups by id
+# need `sort_perc_catalog` first.
+PERC_HEADER = b"perc\0"
+ID_LENGTH = 16
+HASH_LENGTH = 32
+_SEPARATOR = b"\0"
+RECORD_LENGTH = ID_LENGTH + len(_SEPARATOR) + HASH_LENGTH
+
+
+class PercWriter:
+    """Streams records to a file; they have to be written in id order"""
+
+    def __init__(self, file: BinaryIO):
+        self._file = file
+        self._last_id: Optional[bytes] = None
+        self._file.write(PERC_HEADER)
+
+    def write(self, id: bytes, hash: bytes):
+        if len(id) != ID_LENGTH or len(hash) != HASH_LENGTH:
+            raise ValueError(
+                f"expected a {ID_LENGTH}-byte id and a {HASH_LENGTH}-byte hash"
+            )
+        id = bytes(id)
+        if self._last_id is not None and id <= self._last_id:
+            raise ValueError(f"record {id.hex()} is out of order")
+        self._last_id = id
+        self._file.write(id + _SEPARATOR + hash)
+
+
+def write_perc_catalog(
+    path: Union[str, Path], records: Iterable[Tuple[bytes, bytes]]
+) -> int:
+    """
+    :param path:
+    :param records: (id, hash) pairs, in any order
+    :return: Number of records written
+    """
+    count = 0
+    with open(path, "wb") as perc_file:
+        writer = PercWriter(perc_file)
+        for id, hash in sorted(records):
+            writer.write(id, hash)
+            count += 1
+    return count
+
+
+class PercReader:
+    """
+    Memory-mapped view of a perc catalog. Records are handed out as memoryviews into the map, so nothing is copied
+    until asked; they're only valid while the reader is open, and have to be released (or copied with `bytes()`)
+    before it's closed.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._mmap: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+
+        with open(self.path, "rb") as perc_file:
+            if perc_file.read(len(PERC_HEADER)) != PERC_HEADER:
+                raise ValueError(f"{self.path} isn't a perc catalog")
+            self._mmap = mmap.mmap(perc_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._view = memoryview(self._mmap)[len(PERC_HEADER) :]
+        if len(self._view) % RECORD_LENGTH:
+            self.close()
+            raise ValueError(f"{self.path} ends with a partial record")
+        self._length = len(self._view) // RECORD_LENGTH
+        self._sorted: Optional[bool] = None
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _id_bytes(self, index: int) -> bytes:
+        offset = len(PERC_HEADER) + index * RECORD_LENGTH
+        return self._mmap[offset : offset + ID_LENGTH]
+
+    def __getitem__(self, index: int) -> Tuple[memoryview, memoryview]:
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        offset = index * RECORD_LENGTH
+        return (
+            self._view[offset : offset + ID_LENGTH],
+            self._view[offset + ID_LENGTH + 1 : offset + RECORD_LENGTH],
+        )
+
+    def __iter__(self) -> Iterator[Tuple[memoryview, memoryview]]:
+        for index in range(self._length):
+            yield self[index]
+
+    def is_sorted(self) -> bool:
+        """
+        :return: Whether records are sorted by unique ids, which lookups by id need
+        """
+        if self._sorted is None:
+            self._sorted = all(
+                self._id_bytes(index - 1) < self._id_bytes(index)
+                for index in range(1, self._length)
+            )
+        return self._sorted
+
+    def index(self, id: bytes) -> Optional[int]:
+        """
+        Binary search for a record
+        :param id:
+        :return: The record's index, or None if there isn't one
+        """
+        if not self.is_sorted():
+            raise ValueError(
+                f"{self.path} isn't sorted by id, rewrite it with sort_perc_catalog first"
+            )
+        id = bytes(id)
+        low, high = 0, self._length
+        while low < high:
+            middle = (low + high) // 2
+            if self._id_bytes(middle) < id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._length and self._id_bytes(low) == id:
+            return low
+        return None
+
+    def get(self, id: bytes) -> Optional[memoryview]:
+        """
+        :param id:
+        :return: The hash recorded for `id`
+        """
+        index = self.index(id)
+        return self[index][1] if index is not None else None
+
+    def validate(self):
+        """
+        Check that every record has its separator. Records don't have to be sorted, see `is_sorted`.
+        :return:
+        """
+        for index in range(self._length):
+            offset = index * RECORD_LENGTH
+            if self._view[offset + ID_LENGTH] != _SEPARATOR[0]:
+                raise ValueError(f"record {index} has no separator")
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self) -> "PercReader":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def sort_perc_catalog(path: Union[str, Path]) -> int:
+    """
+    Rewrite a catalog with its records sorted by id, e.g. one written before records were sorted
+    :param path:
+    :return: Number of records
+    """
+    path = Path(path)
+    with PercReader(path) as reader:
+        reader.validate()
+        records = [(bytes(id), bytes(hash)) for id, hash in reader]
+
+    sorted_path = path.with_name(f"{path.name}.sorted")
+    count = write_perc_catalog(sorted_path, records)
+    os.replace(sorted_path, path)
+    return count
@@ -1,18 +1,25 @@
+import copy
 import json
 import sys
 from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
 from dataclasses import dataclass
 from datetime import datetime, timedelta, date
-from typing import List, Optional, Type
-
-from dateutil.relativedelta import *
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Type
 
 from .quocofs_manager import QuocoFsManager
+from .util.trace import span, traced
 
 PLAN_CATALOG_NAME = "plan_catalog"
 PLAN_DATE_FORMAT = "%d-%m-%Y"
 PLAN_CATALOG_ENTRIES_KEY = "entries"
 DEFAULT_PLAN_CATALOG_DATA = {"version": 3, PLAN_CATALOG_ENTRIES_KEY: {}}
+# Catalog changes are appended to a log of small delta objects named `plan_catalog.log.<slot>` instead of rewriting the
+# whole catalog. Once every slot is used, the next save compacts the log into the catalog object and bumps the
+# generation, which invalidates the old deltas so their slots can be reused.
+PLAN_CATALOG_LOG_GENERATION_KEY = "log_generation"
+PLAN_CATALOG_LOG_LENGTH = 32
 
 
 @dataclass
@@ -38,6 +45,13 @@ class PlanEntry(ABC):
     def serialize(self) -> dict:
         return {"type": self.type_name}
 
+    def catalog_key(self) -> tuple:
+        """
+        Key that uniquely identifies this entry in a `Catalog`
+        :return:
+        """
+        return (self.type_name,)
+
 
 @dataclass
 class PlanEntryWithDate(PlanEntry, ABC):
@@ -70,6 +84,11 @@ class PlanEntryWithDate(PlanEntry, ABC):
             "date": self.plan_date_from_date().strftime(PLAN_DATE_FORMAT),
         }
 
+    def catalog_key(self) -> tuple:
+        return super().catalog_key() + (
+            self.plan_date_from_date().strftime(PLAN_DATE_FORMAT),
+        )
+
 
 class CachePlan(PlanEntryWithDate):
     type_name = "cache"
@@ -250,6 +269,8 @@ class MonthPlan(PlanEntryWithDate):
         return f"# {pretty_name}\n\n\n"
 
     def date_add(self, n):
+        from dateutil.relativedelta import relativedelta
+
         return self.plan_date + relativedelta(months=n)
 
 
@@ -343,6 +364,8 @@ class YearPlan(PlanEntryWithDate):
         return f"# {pretty_name}\n\n\n"
 
     def date_add(self, n):
+        from dateutil.relativedelta import relativedelta
+
         return self.plan_date + relativedelta(years=n)
 
 
@@ -375,7 +398,7 @@ class ClutterPlan(PlanEntry):
 
 class PersistentWeeklyPlan(PlanEntry):
     type_name = "persistent_weekly"
-    char_name = "x"
+    char_name = "p"
 
     def name(self):
         return self.type_name
@@ -399,81 +422,575 @@ PLAN_TYPES: List[Type[PlanEntry]] = [
 ]
 
 
+def _dispatch_table(plan_types: List[Type[PlanEntry]]) -> Dict[str, Type[PlanEntry]]:
+    table: Dict[str, Type[PlanEntry]] = {}
+    for plan_type in plan_types:
+        claimed_by = table.setdefault(plan_type.char_name, plan_type)
+        if claimed_by is not plan_type:
+            raise ValueError(
+                f'plan types {claimed_by.__name__} and {plan_type.__name__} both use char_name "{plan_type.char_name}"'
+            )
+    return table
+
+
+PLAN_TYPES_BY_CHAR = _dispatch_table(PLAN_TYPES)
+PLAN_TYPES_BY_NAME = {plan_type.type_name: plan_type for plan_type in PLAN_TYPES}
+
+# Layouts are names for lists of plan arguments. They're expanded wherever they appear as a whole argument, and can be
+# added to or overridden in the `layouts` config section. "k" is the layout opened when no arguments are given.
+DEFAULT_LAYOUT_NAME = "k"
+LAYOUTS = {
+    DEFAULT_LAYOUT_NAME: "p d s c c+1",
+    # Cache triad
+    "C": "c-1 c c+1",
+    # Telescope
+    "t": "d w m y l",
+}
+PLAN_ARGS_DATE_FORMAT = "%m.%d.%Y"
+
+
+# Undated entries (like `LifePlan`) are stored with this ordinal; real date ordinals start at 1
+_UNDATED_ORDINAL = 0
+_ID_LENGTH = 16
+
+
+def entry_from_serialized(serialized: dict) -> PlanEntry:
+    """
+    Inverse of `PlanEntry.serialize`
+    :param serialized:
+    :return:
+    """
+    entry_type = PLAN_TYPES_BY_NAME[serialized["type"]]
+    if "date" in serialized:
+        # noinspection PyArgumentList
+        return entry_type(datetime.strptime(serialized["date"], PLAN_DATE_FORMAT))
+    return entry_type()
+
+
+def _date_ordinal(date_string: str) -> int:
+    """
+    Faster equivalent of `datetime.strptime(date_string, PLAN_DATE_FORMAT).toordinal()`
+    :param date_string:
+    :return:
+    """
+    day, month, year = date_string.split("-")
+    return date(int(year), int(month), int(day)).toordinal()
+
+
+def _ordinal_date_string(ordinal: int) -> str:
+    """
+    Inverse of `_date_ordinal`
+    :param ordinal:
+    :return:
+    """
+    plan_date = date.fromordinal(ordinal)
+    return f"{plan_date.day:02}-{plan_date.month:02}-{plan_date.year:04}"
+
+
+def _entry_ordinal(entry: PlanEntry) -> int:
+    if isinstance(entry, PlanEntryWithDate):
+        return entry.plan_date_from_date().toordinal()
+    return _UNDATED_ORDINAL
+
+
 class Catalog:
+    """
+    The plan catalog, stored as version 3 JSON. In memory, entries are kept as columns rather than dicts: ids are
+    packed into one bytearray, types are small codes and dates are int32 ordinals, so that catalogs with millions of
+    entries stay small. JSON is only produced when the catalog is saved.
+    """
+
     def __init__(self, data: dict, id: bytes):
-        self.data = data
         self.id = id
-        self.order_cache = {}
+        # Everything in the JSON object except the entries, like the version and log generation
+        self._header = {
+            key: value for key, value in data.items() if key != PLAN_CATALOG_ENTRIES_KEY
+        }
+        # Type code -> type name. Known types get stable codes, and unknown ones are kept so they survive a save.
+        self._type_names: List[str] = [plan_type.type_name for plan_type in PLAN_TYPES]
+        self._type_codes = {name: code for code, name in enumerate(self._type_names)}
+
+        # One row per entry, in catalog order
+        entries = data[PLAN_CATALOG_ENTRIES_KEY]
+        self._ids = bytearray.fromhex("".join(entries))
+        if len(self._ids) != len(entries) * _ID_LENGTH:
+            raise ValueError(
+                "catalog has entries that aren't keyed by a 16 byte hex id"
+            )
+        self._types = array(
+            "B",
+            [self._type_code(serialized["type"]) for serialized in entries.values()],
+        )
+        # Several types share each date, so parse each date string once
+        date_ordinals: Dict[str, int] = {}
+        self._ordinals = array("i")
+        for serialized in entries.values():
+            date_string = serialized.get("date")
+            if date_string is None:
+                self._ordinals.append(_UNDATED_ORDINAL)
+                continue
+            ordinal = date_ordinals.get(date_string)
+            if ordinal is None:
+                ordinal = date_ordinals[date_string] = _date_ordinal(date_string)
+            self._ordinals.append(ordinal)
+
+        # Type code -> (ordinals, rows), sorted by date, oldest first. Only the first row for a (type, date) pair is
+        # here, which is what the old linear scan found.
+        self._orders: Dict[int, Tuple[array, array]] = {}
+        rows_by_type: Dict[int, List[int]] = {}
+        for row, code in enumerate(self._types):
+            rows_by_type.setdefault(code, []).append(row)
+        for code, rows in rows_by_type.items():
+            # Stable, so the first of several rows with the same date comes first
+            rows.sort(key=self._ordinals.__getitem__)
+            ordinals = array("i", map(self._ordinals.__getitem__, rows))
+            if len(set(ordinals)) != len(ordinals):
+                rows = [
+                    row
+                    for i, row in enumerate(rows)
+                    if i == 0 or ordinals[i - 1] != ordinals[i]
+                ]
+                ordinals = array("i", map(self._ordinals.__getitem__, rows))
+            self._orders[code] = (ordinals, array("I", rows))
+
+        # Number of log slots holding deltas of the current generation
+        self._log_length = 0
+        # Rows put since the last save
+        self._pending: List[int] = []
 
     @staticmethod
+    @traced("Catalog.from_quocofs")
     def from_quocofs(manager: QuocoFsManager):
         catalog_id = manager.session.object_id_with_name(PLAN_CATALOG_NAME)
         if catalog_id:
-            catalog_data = json.loads(manager.session.object(catalog_id))
+            with span("decrypt_catalog"):
+                catalog_object = manager.session.object(catalog_id)
+            with span("parse_catalog", bytes=len(catalog_object)):
+                catalog_data = json.loads(catalog_object)
         else:
+            catalog_data = copy.deepcopy(DEFAULT_PLAN_CATALOG_DATA)
             catalog_id = manager.session.create_object(
-                json.dumps(DEFAULT_PLAN_CATALOG_DATA).encode("utf-8")
+                json.dumps(catalog_data).encode("utf-8")
             )
             manager.session.set_object_name(catalog_id, PLAN_CATALOG_NAME)
-            catalog_data = DEFAULT_PLAN_CATALOG_DATA
-        return Catalog(catalog_data, catalog_id)
+        with span("index_catalog"):
+            catalog = Catalog(catalog_data, catalog_id)
+        with span("replay_log"):
+            catalog._load_log(manager)
+        return catalog
 
-    def _get(self, entry: PlanEntry) -> tuple[Optional[bytes], Optional[dict]]:
-        return next(
-            (
-                (bytes.fromhex(x[0]), x[1])
-                for x in self.data[PLAN_CATALOG_ENTRIES_KEY].items()
-                # https://stackoverflow.com/a/41579450/1979008
-                if entry.serialize().items() <= x[1].items()
-            ),
-            (None, None),
-        )
+    @staticmethod
+    def _log_slot_name(slot: int) -> str:
+        return f"{PLAN_CATALOG_NAME}.log.{slot}"
+
+    @property
+    def _log_generation(self) -> int:
+        return self._header.get(PLAN_CATALOG_LOG_GENERATION_KEY, 0)
+
+    def _load_log(self, manager: QuocoFsManager):
+        for slot in range(PLAN_CATALOG_LOG_LENGTH):
+            delta_id = manager.session.object_id_with_name(self._log_slot_name(slot))
+            if not delta_id:
+                break
+
+            delta = json.loads(manager.session.object(delta_id))
+            # Slots are filled in order, so the first stale delta ends the log
+            if delta[PLAN_CATALOG_LOG_GENERATION_KEY] != self._log_generation:
+                break
+
+            for hex_id, serialized in delta[PLAN_CATALOG_ENTRIES_KEY].items():
+                self._insert(
+                    bytes.fromhex(hex_id),
+                    self._type_code(serialized["type"]),
+                    _date_ordinal(serialized["date"])
+                    if "date" in serialized
+                    else _UNDATED_ORDINAL,
+                )
+            self._log_length = slot + 1
 
-    def get_id(self, entry: PlanEntry):
-        return self._get(entry)[0]
+    def _type_code(self, type_name: str) -> int:
+        code = self._type_codes.get(type_name)
+        if code is None:
+            code = self._type_codes[type_name] = len(self._type_names)
+            self._type_names.append(type_name)
+        return code
 
-    def put(self, entry: PlanEntry, id: bytes):
-        if self.get_id(entry) is not None:
-            return
+    def _find(self, code: int, ordinal: int) -> Optional[int]:
+        """
+        :param code:
+        :param ordinal:
+        :return: Row of the entry with a type and date
+        """
+        order = self._orders.get(code)
+        if order is None:
+            return None
 
-        hex_id = id.hex()
-        self.data[PLAN_CATALOG_ENTRIES_KEY][hex_id] = entry.serialize() | {"id": hex_id}
+        ordinals, rows = order
+        position = bisect_left(ordinals, ordinal)
+        if position < len(ordinals) and ordinals[position] == ordinal:
+            return rows[position]
+        return None
 
-    # TODO: Use SQLite instead of JSON and make everything more and more and more and more efficient
-    def _order_for_date_type(self, entry_type: Type[PlanEntryWithDate]):
-        order = self.order_cache.get(entry_type.type_name)
-        if order is not None:
-            return order
+    def _insert(self, id: bytes, code: int, ordinal: int) -> Optional[int]:
+        """
+        :param id:
+        :param code:
+        :param ordinal:
+        :return: The new row, or None if the catalog already has an entry with the same type and date
+        """
+        ordinals, rows = self._orders.setdefault(code, (array("i"), array("I")))
+        position = bisect_left(ordinals, ordinal)
+        if position < len(ordinals) and ordinals[position] == ordinal:
+            return None
 
-        order = sorted(
-            (
-                (id, datetime.strptime(e["date"], PLAN_DATE_FORMAT))
-                for id, e in self.data[PLAN_CATALOG_ENTRIES_KEY].items()
-                if e["type"] == entry_type.type_name
-            ),
-            reverse=True,
-            key=lambda a: a[1],
-        )
+        row = len(self._types)
+        self._ids += id
+        self._types.append(code)
+        self._ordinals.append(ordinal)
+        ordinals.insert(position, ordinal)
+        rows.insert(position, row)
+        return row
+
+    def _hex_id(self, row: int) -> str:
+        return self._ids[row * _ID_LENGTH : (row + 1) * _ID_LENGTH].hex()
+
+    def _serialize(self, row: int, hex_id: str) -> dict:
+        serialized = {"type": self._type_names[self._types[row]]}
+        if self._ordinals[row] != _UNDATED_ORDINAL:
+            serialized["date"] = _ordinal_date_string(self._ordinals[row])
+        serialized["id"] = hex_id
+        return serialized
+
+    def _entry(
+        self, entry_type: Type[PlanEntryWithDate], row: int
+    ) -> tuple[str, PlanEntryWithDate]:
+        # noinspection PyArgumentList
+        return self._hex_id(row), entry_type(datetime.fromordinal(self._ordinals[row]))
+
+    @property
+    def data(self) -> dict:
+        """
+        :return: The catalog as version 3 JSON data
+        """
+        hex_ids = self._ids.hex()
+        entries = {}
+        for row in range(len(self._types)):
+            hex_id = hex_ids[row * 2 * _ID_LENGTH : (row + 1) * 2 * _ID_LENGTH]
+            entries[hex_id] = self._serialize(row, hex_id)
+        return self._header | {PLAN_CATALOG_ENTRIES_KEY: entries}
+
+    def __len__(self):
+        """
+        :return: Number of distinct entries
+        """
+        return sum(len(ordinals) for ordinals, _ in self._orders.values())
+
+    def get_id(self, entry: PlanEntry) -> Optional[bytes]:
+        code = self._type_codes.get(entry.type_name)
+        row = self._find(code, _entry_ordinal(entry)) if code is not None else None
+        if row is None:
+            return None
+        return bytes(self._ids[row * _ID_LENGTH : (row + 1) * _ID_LENGTH])
+
+    def get_ids(self, entries: List[PlanEntry]) -> List[Optional[bytes]]:
+        return [self.get_id(entry) for entry in entries]
+
+    def entries(self) -> Iterator[tuple[str, PlanEntry]]:
+        """
+        :return: (hex id, entry) for every document in the catalog whose type this version of quoco knows
+        """
+        for row in range(len(self._types)):
+            entry_type = PLAN_TYPES_BY_NAME.get(self._type_names[self._types[row]])
+            if entry_type is None:
+                # Kept for saving, but there's no entry class to give back
+                continue
+            if self._ordinals[row] == _UNDATED_ORDINAL:
+                yield self._hex_id(row), entry_type()
+            else:
+                yield self._entry(entry_type, row)
 
-        self.order_cache[entry_type.type_name] = order
-        return order
+    def put(self, entry: PlanEntry, id: bytes):
+        row = self._insert(id, self._type_code(entry.type_name), _entry_ordinal(entry))
+        if row is not None:
+            self._pending.append(row)
 
     def get_nth(
         self, entry_type: Type[PlanEntryWithDate], n: int
     ) -> Optional[tuple[str, PlanEntryWithDate]]:
+        order = self._orders.get(self._type_codes.get(entry_type.type_name))
+        if order is None or n >= len(order[1]):
+            return None
 
-        order = self._order_for_date_type(entry_type)
+        return self._entry(entry_type, order[1][-1 - n])
+
+    def get_range(
+        self, entry_type: Type[PlanEntryWithDate], start: date, end: date
+    ) -> List[tuple[str, PlanEntryWithDate]]:
+        """
+        Entries of a type dated from `start` to `end`, inclusive
+        :param entry_type:
+        :param start:
+        :param end:
+        :return: (hex id, entry) pairs, oldest first
+        """
+        order = self._orders.get(self._type_codes.get(entry_type.type_name))
+        if order is None:
+            return []
+
+        ordinals, rows = order
+        low = bisect_left(ordinals, start.toordinal())
+        high = bisect_left(ordinals, end.toordinal() + 1, low)
+        return [self._entry(entry_type, row) for row in rows[low:high]]
+
+    @traced("Catalog.save")
+    def save(self, manager: QuocoFsManager):
+        """
+        Write entries put since the last save as a delta, compacting the log if it's full. Writes nothing if there
+        aren't any new entries.
+        :param manager:
+        :return:
+        """
+        if not self._pending:
+            return
+
+        if self._log_length >= PLAN_CATALOG_LOG_LENGTH:
+            self.compact(manager)
+            return
+
+        pending = {}
+        for row in self._pending:
+            hex_id = self._hex_id(row)
+            pending[hex_id] = self._serialize(row, hex_id)
+        delta = json.dumps(
+            {
+                PLAN_CATALOG_LOG_GENERATION_KEY: self._log_generation,
+                PLAN_CATALOG_ENTRIES_KEY: pending,
+            }
+        ).encode("utf-8")
+        slot_name = self._log_slot_name(self._log_length)
+        delta_id = manager.session.object_id_with_name(slot_name)
+        if delta_id:
+            manager.session.modify_object(delta_id, delta)
+        else:
+            delta_id = manager.session.create_object(delta)
+            manager.session.set_object_name(delta_id, slot_name)
+
+        self._log_length += 1
+        self._pending = []
+
+    def compact(self, manager: QuocoFsManager):
+        """
+        Write every entry into the catalog object and start a new, empty log
+        :param manager:
+        :return:
+        """
+        self._header[PLAN_CATALOG_LOG_GENERATION_KEY] = self._log_generation + 1
+        manager.session.modify_object(self.id, json.dumps(self.data).encode("utf-8"))
+        self._log_length = 0
+        self._pending = []
+
+
+def load_catalog(manager: QuocoFsManager):
+    """
+    Load the plan catalog with the engine selected by the `plan.catalog` config option
+    :param manager:
+    :return:
+    """
+    if manager.config["plan"]["catalog"] == "sqlite":
+        from .sqlite_catalog import SqliteCatalog
+
+        return SqliteCatalog.from_quocofs(manager)
+
+    if manager.config["plan"]["catalog"] == "partitioned":
+        from .partitioned_catalog import PartitionedCatalog
+
+        return PartitionedCatalog.from_quocofs(manager)
+
+    return Catalog.from_quocofs(manager)
 
-        if n >= len(order):
-            return None
 
-        id, entry_date = order[n]
+def _carried_forward_lines(text: str) -> Iterator[str]:
+    lines = iter(text.splitlines())
+    # The first line is the previous plan's title
+    next(lines, None)
+    for line in lines:
+        if line and not line.isspace():
+            previous = line.lstrip()
+            break
+    else:
+        return
+    for line in lines:
+        yield ";" + previous
+        previous = line
+    # Carry-forward used to join the lines and split them again, which drops a final empty line
+    if previous:
+        yield ";" + previous
+
+
+# Carry-forward content by (source object id, sha256 of the source's plaintext). Bounded because only the newest
+# document of each type is ever carried forward.
+_carry_forward_cache: Dict[Tuple[bytes, bytes], str] = {}
+_CARRY_FORWARD_CACHE_SIZE = 16
+
+
+@traced("carry_forward")
+def carry_forward_content(manager: QuocoFsManager, id: bytes) -> str:
+    """
+    Content of a previous plan to carry into a new one: everything but its title, with leading blank lines dropped and
+    each line commented out with `;`
+    :param manager:
+    :param id: Previous plan document id
+    :return:
+    """
+    content_hash = manager.content_hash(id)
+    if content_hash is not None and (id, content_hash) in _carry_forward_cache:
+        return _carry_forward_cache[(id, content_hash)]
+
+    data = manager.read_object(id)
+    content = "\n".join(_carried_forward_lines(data.decode("utf-8")))
+
+    if len(_carry_forward_cache) >= _CARRY_FORWARD_CACHE_SIZE:
+        del _carry_forward_cache[next(iter(_carry_forward_cache))]
+    _carry_forward_cache[(id, manager.content_hash(id))] = content
+    return content
+
+
+class PlanNotFoundError(LookupError):
+    pass
+
+
+@dataclass
+class PlanArgument:
+    """A single compiled plan argument, like `c+1` or `d~2`"""
+
+    entry_type: Type[PlanEntry]
+    # "+", "-" or "~" for dated types, None otherwise
+    operator: Optional[str] = None
+    value: int = 0
+
+    def entry(self, catalog, plan_date: datetime) -> PlanEntry:
+        """
+        :param catalog:
+        :param plan_date: Date the argument is relative to
+        :return:
+        """
+        if not issubclass(self.entry_type, PlanEntryWithDate):
+            return self.entry_type()
+
+        if self.operator == "~":
+            id_entry = catalog.get_nth(self.entry_type, self.value)
+            if id_entry is None:
+                raise PlanNotFoundError(
+                    f'Couldn\'t find last entry #{self.value} of type "{self.entry_type.type_name}"'
+                )
+            return id_entry[1]
 
         # noinspection PyArgumentList
-        return id, entry_type(entry_date)
+        entry = self.entry_type(plan_date)
+        if self.operator in ("+", "-"):
+            entry.plan_date = entry.date_add(
+                self.value if self.operator == "+" else -self.value
+            )
+        return entry
+
+
+def _expand_layouts(
+    plan_args: List[str], layouts: Dict[str, str], expanding: Tuple[str, ...] = ()
+) -> Iterator[str]:
+    for plan_arg in plan_args:
+        if plan_arg not in layouts:
+            yield plan_arg
+            continue
+
+        if plan_arg in expanding:
+            raise ValueError(f'layout "{plan_arg}" includes itself')
+        yield from _expand_layouts(
+            layouts[plan_arg].split(), layouts, expanding + (plan_arg,)
+        )
+
+
+def compile_layout(plan_args: str, layouts: Dict[str, str]) -> List[PlanArgument]:
+    """
+    Parse plan arguments like `k j~1 C`, expanding layouts, into the plans they refer to. Arguments that don't start
+    with a plan type's `char_name` are skipped.
+    :param plan_args:
+    :param layouts: Layout name -> plan arguments
+    :return:
+    """
+    compiled = []
+    for plan_arg in _expand_layouts(plan_args.split(), layouts):
+        entry_type = PLAN_TYPES_BY_CHAR.get(plan_arg[0])
+        if entry_type is None:
+            continue
+
+        argument = PlanArgument(entry_type)
+        if issubclass(entry_type, PlanEntryWithDate) and len(plan_arg) > 1:
+            operator = plan_arg[1]
+            value = abs(int(plan_arg[2:]))
+            if operator in ("+", "-", "~"):
+                argument.operator = operator
+                argument.value = value
+        compiled.append(argument)
+    return compiled
+
+
+def _create_plan_document(manager: QuocoFsManager, catalog, entry: PlanEntry) -> bytes:
+    default_content = entry.default_content()
+
+    if isinstance(entry, PlanEntryWithDate):
+        last_entry = catalog.get_nth(entry.__class__, 0)
+        if last_entry:
+            id, _ = last_entry
+            default_content += carry_forward_content(manager, bytes.fromhex(id))
+
+    document_id = manager.create_object(default_content.encode("utf-8"))
+    catalog.put(entry, document_id)
+    return document_id
+
+
+@traced("resolve_plan_documents")
+def resolve_plan_documents(
+    manager: QuocoFsManager, catalog, args: Optional[str] = None
+) -> List[bytes]:
+    """
+    Resolve plan arguments like `p d s c c+1 -- 03.05.2022` to document ids, creating documents that don't exist yet
+    :param manager:
+    :param catalog:
+    :param args:
+    :return:
+    """
+    layouts = {**LAYOUTS, **manager.config["layouts"]}
+    if args is None:
+        args = (
+            f"{DEFAULT_LAYOUT_NAME} -- {datetime.now().strftime(PLAN_ARGS_DATE_FORMAT)}"
+        )
+
+    plan_args, _, date_arg = args.partition(" -- ")
+    plan_date = (
+        datetime.strptime(date_arg, PLAN_ARGS_DATE_FORMAT)
+        if date_arg
+        else datetime.now()
+    )
+
+    entries = [
+        argument.entry(catalog, plan_date)
+        for argument in compile_layout(plan_args, layouts)
+    ]
+    document_ids = list(catalog.get_ids(entries))
+
+    # Documents are created in argument order so that each new plan carries forward the newest one before it
+    created: Dict[tuple, bytes] = {}
+    for i, entry in enumerate(entries):
+        if document_ids[i] is not None:
+            continue
+        key = entry.catalog_key()
+        if key not in created:
+            created[key] = _create_plan_document(manager, catalog, entry)
+        document_ids[i] = created[key]
+
+    return document_ids
 
 
-# TODO: Break this up
 def whats_the_plan(args: str = None) -> None:
     manager = QuocoFsManager(
         QuocoFsManager.default_data_path(),
@@ -481,103 +998,81 @@ def whats_the_plan(args: str = None) -> None:
         QuocoFsManager.DEFAULT_SALT,
     )
 
-    default_layout = "p d s c c+1"
-    cache_triad_layout = "c-1 c c+1"
-    telescope_layout = "d w m y l"
-    args = (
-        f"{default_layout} -- {datetime.now().strftime('%m.%d.%Y')}"
-        if args is None
-        else args
-    )
-
-    arg_parts = args.split(" -- ")
-    plan_args = arg_parts[0]
-
-    # Shortcut for default layout--redundant by itself but useful when
-    # comparing plans from past/future dates
-    if len(plan_args) > 0:
-        plan_args = plan_args.replace("k", default_layout)
-        plan_args = plan_args.replace("C", cache_triad_layout)
-        plan_args = plan_args.replace("t", telescope_layout)
+    with manager:
+        catalog = load_catalog(manager)
+        try:
+            document_ids = resolve_plan_documents(manager, catalog, args)
+        except PlanNotFoundError as e:
+            print(e, file=sys.stderr)
+            return
 
-    plan_args = plan_args.split(" ")
+        changed_ids = manager.edit_documents_vim(document_ids)
+        catalog.save(manager)
 
-    plan_date = (
-        datetime.strptime(arg_parts[1], "%m.%d.%Y")
-        if len(arg_parts) > 1
-        else datetime.now()
-    )
+        from .search import update_search_index
 
-    with manager:
-        catalog = Catalog.from_quocofs(manager)
-        names_to_open = []
+        update_search_index(manager, changed_ids)
 
-        for plan_arg in plan_args:
-            entry_type: Optional[Type[PlanEntry]] = None
-            for plan_type in PLAN_TYPES:
-                if plan_type.char_name == plan_arg[0]:
-                    entry_type = plan_type
-                    break
 
-            if not entry_type:
-                continue
+def write_plan_range(
+    manager: QuocoFsManager,
+    catalog,
+    entry_type: Type[PlanEntryWithDate],
+    start: date,
+    end: date,
+    output: BinaryIO,
+) -> int:
+    """
+    :param manager:
+    :param catalog:
+    :param entry_type:
+    :param start:
+    :param end:
+    :param output:
+    :return: Number of documents written
+    """
+    entries = catalog.get_range(entry_type, start, end)
+    for i, (hex_id, _) in enumerate(entries):
+        document = manager.session.object(bytes.fromhex(hex_id))
+        if i > 0:
+            output.write(b"\n")
+        output.write(document)
+        if not document.endswith(b"\n"):
+            output.write(b"\n")
+    return len(entries)
+
+
+def export_plan_range(type_char: str, start: str, end: str) -> None:
+    """
+    Write the plans of a type dated from `start` to `end` (inclusive, in `PLAN_ARGS_DATE_FORMAT`) to stdout, oldest
+    first. Documents are decrypted and written one at a time.
+    :param type_char: `char_name` of a dated plan type
+    :param start:
+    :param end:
+    :return:
+    """
+    entry_type = PLAN_TYPES_BY_CHAR.get(type_char)
+    if entry_type is None or not issubclass(entry_type, PlanEntryWithDate):
+        print(f'"{type_char}" isn\'t a dated plan type', file=sys.stderr)
+        return
 
-            if issubclass(entry_type, PlanEntryWithDate):
-                # noinspection PyArgumentList
-                entry = entry_type(plan_date)
-                if len(plan_arg) > 1:
-                    operator = plan_arg[1]
-                    value = abs(int(plan_arg[2:]))
-                    if operator in ["+", "-"]:
-                        # Yes eval is potentially dangerous, but both operator and value are checked and I can't think
-                        # of any specific vector for abuse here anyway.
-                        signed_difference = eval(f"{operator}{value}")
-                        entry.plan_date = entry.date_add(signed_difference)
-                    elif operator == "~":
-                        id_entry = catalog.get_nth(entry_type, value)
-                        if id_entry is None:
-                            print(
-                                f'Couldn\'t find last entry #{value} of type "{entry_type.type_name}"',
-                                file=sys.stderr,
-                            )
-                            return
-                        entry = id_entry[1]
-            else:
-                entry = entry_type()
-
-            document_id = catalog.get_id(entry)
-
-            if document_id is None:
-                default_content = entry.default_content()
-
-                if issubclass(entry_type, PlanEntryWithDate):
-                    last_entry = catalog.get_nth(entry.__class__, 0)
-                    if last_entry:
-                        id, _ = last_entry
-                        # TODO: This is inefficient but it might not really matter
-                        content = "\n".join(
-                            map(
-                                lambda s: ";" + s,
-                                "\n".join(
-                                    manager.session.object(bytes.fromhex(id))
-                                    .decode("utf-8")
-                                    .splitlines()[1:]
-                                )
-                                .lstrip()
-                                .splitlines(),
-                            )
-                        )
-                        if content:
-                            default_content += content
-
-                document_id = manager.session.create_object(
-                    default_content.encode("utf-8")
-                )
-                catalog.put(entry, document_id)
+    start_date = datetime.strptime(start, PLAN_ARGS_DATE_FORMAT)
+    end_date = datetime.strptime(end, PLAN_ARGS_DATE_FORMAT)
 
-            names_to_open.append(document_id)
+    manager = QuocoFsManager(
+        QuocoFsManager.default_data_path(),
+        QuocoFsManager.default_config_path(),
+        QuocoFsManager.DEFAULT_SALT,
+    )
 
-        manager.edit_documents_vim(names_to_open)
-        manager.session.modify_object(
-            catalog.id, json.dumps(catalog.data).encode("utf-8")
+    with manager:
+        catalog = load_catalog(manager)
+        write_plan_range(
+            manager,
+            catalog,
+            entry_type,
+            start_date,
+            end_date,
+            sys.stdout.buffer,
         )
+        sys.stdout.buffer.flush()
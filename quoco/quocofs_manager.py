@@ -1,26 +1,87 @@
+import hashlib
 import json
+import os
 import subprocess
 import sys
+import threading
+import time
 import copy
+import shutil
+import tempfile
 from base64 import b64decode
 from getpass import getpass
 from pathlib import Path
-from typing import List, Union, Dict, Any
+from typing import List, Union, Dict, Any, Optional, Tuple
 from xdg import xdg_data_home, xdg_config_home
 import tomli
 
 import quocofs
 
+from .key_agent import agent_key, agent_store_key
+from .remote import create_remote
 from .util.secure_term import add_lines, secure_print, clear_term
 from .util.fs import local_file_exists
+from .util.trace import span, traced
 
 DEFAULT_CONFIG = {
     "vim": {
         "path": "vim",
         "orientation": "horizontal",
-    }
+        # Print how long each document took to decrypt once the editor exits
+        "report": False,
+    },
+    "plan": {
+        # "json", "sqlite" or "partitioned"
+        "catalog": "json",
+    },
+    # Extra plan layouts, name -> plan arguments, e.g. `review = "w w-1 m"`. These can override the built-in "k", "C"
+    # and "t" layouts.
+    "layouts": {},
+    "remote": {
+        # Only "google" for now
+        "type": "google",
+        "bucket": "quocofs",
+    },
+    "agent": {
+        # Keep the derived key in a key agent process so that later launches skip the password prompt and the KDF
+        "enabled": False,
+        # Seconds without a request before the agent forgets the key and exits
+        "idle_timeout": 900,
+    },
+    "daemon": {
+        # Seconds without a request before `plan --daemon` closes its session and exits
+        "idle_timeout": 8
+        * 60
+        * 60,
+    },
 }
 CONFIG_FILENAME = "config.toml"
+# A small object encrypted with the key of the last session that opened, so that commands that don't open a session can
+# tell whether a password is right before caching the key
+KEY_CHECK_FILENAME = "key_check"
+
+
+def load_config(config_path: Union[str, Path]) -> Dict[str, Any]:
+    config_path = Path(config_path, CONFIG_FILENAME)
+
+    if not config_path.exists():
+        return DEFAULT_CONFIG
+
+    try:
+        with open(config_path, "rb") as config_file:
+            file_config = tomli.load(config_file)["config"]
+    except (tomli.TOMLDecodeError, KeyError):
+        print("couldn't parse config file, using default config", file=sys.stderr)
+        return DEFAULT_CONFIG
+
+    config = copy.deepcopy(DEFAULT_CONFIG)
+
+    # Dumb merge thing
+    for key in config:
+        if key in file_config:
+            config[key].update(file_config[key])
+
+    return config
 
 
 class QuocoFsManager:
@@ -29,6 +90,7 @@ class QuocoFsManager:
 
     session: quocofs.Session
     _config: Dict[str, Any]
+    _key: bytes
 
     def __init__(
         self, data_path: Union[str, Path], config_path: Union[str, Path], salt: bytes
@@ -36,7 +98,15 @@ class QuocoFsManager:
         self._data_path = data_path if data_path is Path else Path(data_path)
         self._config_path = config_path if config_path is Path else Path(config_path)
         self._salt = salt
-        self._config = self._load_config()
+        self._config = load_config(self._config_path)
+        self._remote = create_remote(self._config["remote"], self._config_path)
+        # sha256 of the plaintext of objects read or written through this manager, by object id
+        self._content_hashes: Dict[bytes, bytes] = {}
+        # (document id, seconds) for each document in the last `materialize_documents` call
+        self._materialize_timings: List[Tuple[bytes, float]] = []
+        # quocofs doesn't say whether a Session can be used from several threads, so every call into it goes through
+        # this lock and worker threads only do the work around it
+        self._session_lock = threading.Lock()
         self.initialize_session_interactive()
 
     def create_data_path(self):
@@ -57,36 +127,77 @@ class QuocoFsManager:
         # TODO(vinhowe): Make this work on Windows too
         return Path(xdg_config_home(), "quoco")
 
+    @property
+    def config(self) -> Dict[str, Any]:
+        return self._config
+
     def is_initialized(self):
         return self.session is not None
 
-    def _load_config(self):
-        config_path = Path(self._config_path, CONFIG_FILENAME)
+    def generate_key(self, password: str) -> bytes:
+        # TODO: Storing the hash this way is insecure and should be done a better way
+        #  (like storing generating the salt and storing it in plaintext in the fs)
+        salt = b64decode(self._salt)
+        with span("key_derivation"):
+            return quocofs.key(password, salt)
+
+    @staticmethod
+    def key_check_path(config_path: Union[str, Path]) -> Path:
+        return Path(config_path, KEY_CHECK_FILENAME)
 
-        if not config_path.exists():
-            return DEFAULT_CONFIG
+    @staticmethod
+    def read_key_check(config_path: Union[str, Path]) -> Optional[bytes]:
+        """
+        :param config_path:
+        :return: Known ciphertext to check keys against, if a session has written one
+        """
+        path = QuocoFsManager.key_check_path(config_path)
+        return path.read_bytes() if path.is_file() else None
 
+    @staticmethod
+    def key_decrypts(key: bytes, ciphertext: bytes) -> bool:
         try:
-            with open(config_path, "rb") as config_file:
-                file_config = tomli.load(config_file)["config"]
-        except (tomli.TOMLDecodeError, KeyError):
-            print("couldn't parse config file, using default config", file=sys.stderr)
-            return DEFAULT_CONFIG
+            quocofs.loads(ciphertext, key)
+        except quocofs.DecryptionError:
+            return False
+        return True
 
-        config = copy.deepcopy(DEFAULT_CONFIG)
+    @staticmethod
+    def key_interactive(
+        config: Dict[str, Any], salt: str, check: Optional[bytes] = None
+    ) -> bytes:
+        """
+        Get the key from the key agent if it's enabled and has one, otherwise prompt for the password and derive it.
+        A derived key is only handed to the agent once it has decrypted `check`, so a mistyped password isn't cached.
+        :param config:
+        :param salt:
+        :param check: Ciphertext encrypted with the right key, e.g. from `read_key_check`. Without it the password
+        can't be checked, so the key is used but not given to the agent.
+        :return:
+        """
+        agent_config = config["agent"]
+        if agent_config["enabled"]:
+            with span("agent_key"):
+                key = agent_key(salt)
+            if key is not None:
+                return key
 
-        # Dumb merge thing
-        for key in config:
-            if key in file_config:
-                config[key].update(file_config[key])
+        add_lines()
+        clear_term()
+        while True:
+            password = QuocoFsManager.prompt_password()
+            with span("key_derivation"):
+                key = quocofs.key(password, b64decode(salt))
+            if check is None:
+                return key
+            if QuocoFsManager.key_decrypts(key, check):
+                break
+            secure_print("password failed to decrypt, please try again")
+            secure_print()
 
-        return config
-
-    def generate_key(self, password: str) -> bytes:
-        # TODO: Storing the hash this way is insecure and should be done a better way
-        #  (like storing generating the salt and storing it in plaintext in the fs)
-        salt = b64decode(self._salt)
-        return quocofs.key(password, salt)
+        if agent_config["enabled"]:
+            agent_store_key(salt, key, agent_config["idle_timeout"])
+        return key
 
     @staticmethod
     def prompt_password(repeat=False):
@@ -109,51 +220,189 @@ class QuocoFsManager:
 
     def _create_remote_accessor(self):
         # TODO: Extend this once we add more remote accessors (S3, Azure, etc.)
-        google_service_account_path = Path(
-            self._config_path, "google-service-account.json"
-        )
-        # TODO: Raise custom exception when we can't find a key file.
-        #  We can have an offline mode once we actually handle conflicts instead of just overwriting from remote at the
-        #  beginning of every session.
+        #  For now every remote speaks the Google Storage protocol, see `remote.Remote`
         return quocofs.GoogleStorageAccessorConfig(
-            "quocofs", str(google_service_account_path)
+            self._remote.bucket_name, str(self._remote.start())
         )
 
     def initialize_session(self, password: str):
+        self.initialize_session_with_key(self.generate_key(password))
+
+    @traced("initialize_session")
+    def initialize_session_with_key(self, key: bytes):
         self.create_data_path()
         self.create_config_path()
 
-        self.session = quocofs.Session(
-            str(self._data_path),
-            self.generate_key(password),
-            self._create_remote_accessor(),
-        )
+        with span("quocofs.Session"):
+            self.session = quocofs.Session(
+                str(self._data_path),
+                key,
+                self._create_remote_accessor(),
+            )
+        self._key = key
+        self._write_key_check()
 
     def initialize_session_interactive(self):
+        agent_config = self._config["agent"]
+        if agent_config["enabled"]:
+            key = agent_key(self._salt)
+            if key is not None:
+                try:
+                    self.initialize_session_with_key(key)
+                    return
+                except quocofs.DecryptionError:
+                    # Stale key (the password changed), fall back to asking
+                    pass
+
         add_lines()
         clear_term()
         while True:
             password = self.prompt_password()
+            key = self.generate_key(password)
             try:
                 # TODO: This flow gives the user absolutely no indication whether it found remote data
-                self.initialize_session(password)
+                self.initialize_session_with_key(key)
             except quocofs.DecryptionError:
                 secure_print("password failed to decrypt, please try again")
                 secure_print()
                 continue
             break
 
-    def edit_documents_vim(self, ids: List[bytes]) -> None:
-        documents_read_info = []
-        for id in ids:
-            path = self.session.object_temp_file(id, "md")
-            documents_read_info.append(
-                {
-                    "path": path,
-                    "id": id,
-                }
-            )
+        if agent_config["enabled"]:
+            agent_store_key(self._salt, key, agent_config["idle_timeout"])
+
+    def _write_key_check(self):
+        """Record a ciphertext for `key_interactive` to check passwords against, now that the session proved the key"""
+        path = self.key_check_path(self._config_path)
+        if path.exists() and self.key_decrypts(self._key, path.read_bytes()):
+            return
+        path.write_bytes(self.encrypt(b"quoco key check"))
+
+    def encrypt(self, data: bytes) -> bytes:
+        """
+        Encrypt data outside of the store with the session's key, e.g. for backups
+        :param data:
+        :return:
+        """
+        return quocofs.dumps(data, self._key)
+
+    def decrypt(self, data: bytes) -> bytes:
+        return quocofs.loads(data, self._key)
+
+    def content_hash(self, id: bytes) -> Optional[bytes]:
+        """
+        :param id:
+        :return: sha256 of the object's plaintext, if it has been read or written through this manager
+        """
+        return self._content_hashes.get(bytes(id))
+
+    def read_object(self, id: bytes) -> bytes:
+        """
+        Safe to call from several threads
+        :param id:
+        :return:
+        """
+        with self._session_lock:
+            data = self.session.object(id)
+        self._content_hashes[bytes(id)] = hashlib.sha256(data).digest()
+        return data
+
+    def create_object(self, data: bytes) -> bytes:
+        with self._session_lock:
+            id = self.session.create_object(data)
+        self._content_hashes[bytes(id)] = hashlib.sha256(data).digest()
+        return id
+
+    def modify_object(self, id: bytes, data: bytes) -> None:
+        with span("modify_object", id=bytes(id).hex()), self._session_lock:
+            self.session.modify_object(id, data)
+        self._content_hashes[bytes(id)] = hashlib.sha256(data).digest()
+
+    def _materialize_document(self, id: bytes, directory: str) -> Tuple[str, float]:
+        start = time.perf_counter()
+        with span("read_object", id=bytes(id).hex()):
+            # Also hashes the plaintext as opened, so that `commit_documents` can skip documents that weren't changed
+            data = self.read_object(id)
+        path = os.path.join(directory, f"{bytes(id).hex()}.md")
+        with open(
+            os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb"
+        ) as document_file:
+            document_file.write(data)
+        return path, time.perf_counter() - start
+
+    @traced("materialize_documents")
+    def materialize_documents(self, ids: List[bytes]) -> List[str]:
+        """
+        Decrypt documents to temp files in a new private directory. A document that's in `ids` more than once, like the
+        day plan in a layout that lists it twice, gets a single file.
+        :param ids:
+        :return: Temp file paths, in the same order as `ids`
+        """
+        self._materialize_timings = []
+        if not ids:
+            return []
+
+        directory = tempfile.mkdtemp(prefix="quoco-")
+        paths: Dict[bytes, str] = {}
+        try:
+            # One at a time: decryption happens inside the session, which is only used from one thread at a time
+            for id in ids:
+                if bytes(id) in paths:
+                    continue
+                path, seconds = self._materialize_document(id, directory)
+                paths[bytes(id)] = path
+                self._materialize_timings.append((id, seconds))
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return [paths[bytes(id)] for id in ids]
+
+    def report_materialize_timings(self) -> None:
+        if not self._config["vim"]["report"]:
+            return
+
+        timings = ", ".join(
+            f"{bytes(id).hex()[:8]} {seconds * 1000:.1f}ms"
+            for id, seconds in self._materialize_timings
+        )
+        print(f"decrypted: {timings}", file=sys.stderr)
 
+    @staticmethod
+    def remove_documents(paths: List[str]) -> None:
+        """
+        Delete temp files from `materialize_documents`, and their directory
+        :param paths:
+        :return:
+        """
+        for path in paths:
+            Path(path).unlink(missing_ok=True)
+        if paths:
+            Path(paths[0]).parent.rmdir()
+
+    @traced("commit_documents")
+    def commit_documents(self, ids: List[bytes], paths: List[str]) -> List[bytes]:
+        """
+        Write edited temp files from `materialize_documents` back to their objects, skipping documents whose plaintext
+        hash hasn't changed since they were opened, then delete the temp files. The session never sees these files, so
+        this is the only place edits are written back.
+        :param ids:
+        :param paths:
+        :return: Ids of the documents that were written
+        """
+        changed_ids = []
+        try:
+            for id, path in zip(ids, paths):
+                with open(path, "rb") as document_file:
+                    data = document_file.read()
+                if hashlib.sha256(data).digest() == self.content_hash(id):
+                    continue
+                self.modify_object(id, data)
+                changed_ids.append(id)
+        finally:
+            self.remove_documents(paths)
+        return changed_ids
+
+    def vim_command(self, paths: List[str]) -> str:
         # https://vi.stackexchange.com/questions/6177/the-simplest-way-to-start-vim-in-private-mode
         # `set noswapfile` prevents vim from making a swap file for the session
         # `set viminfo=` prevents vim from outputting operations and commands in
@@ -174,21 +423,37 @@ class QuocoFsManager:
             list(map(lambda s: f"set {s}", vi_secure_settings))
         )
 
-        temp_paths = [v["path"] for v in documents_read_info]
-        files_argument = " ".join(temp_paths)
-        if len(documents_read_info) > 1:
+        files_argument = " ".join(paths)
+        if len(paths) > 1:
             split_switch = (
                 "o" if self._config["vim"]["orientation"] == "vertical" else "O"
             )
             files_argument = f"-{split_switch} {files_argument}"
-            # Account for Vim's "2 files to edit" output
-            add_lines()
 
         vim_path = self._config["vim"]["path"]
 
-        command = f'{vim_path} + "+{vi_secure_settings_string}" {files_argument}'
+        return f'{vim_path} + "+{vi_secure_settings_string}" {files_argument}'
 
-        subprocess.call(command, shell=True)
+    @traced("edit_documents_vim")
+    def edit_documents_vim(self, ids: List[bytes]) -> List[bytes]:
+        """
+        :param ids:
+        :return: Ids of the documents that were changed
+        """
+        temp_paths = self.materialize_documents(ids)
+
+        if len(temp_paths) > 1:
+            # Account for Vim's "2 files to edit" output
+            add_lines()
+
+        try:
+            with span("editor", waiting=True):
+                subprocess.call(self.vim_command(temp_paths), shell=True)
+        finally:
+            # Also deletes the plaintext temp files
+            changed_ids = self.commit_documents(ids, temp_paths)
+        self.report_materialize_timings()
+        return changed_ids
 
     def edit_document_vim(self, name: bytes) -> None:
         self.edit_documents_vim([name])
@@ -197,4 +462,5 @@ class QuocoFsManager:
         self.session.__enter__()
 
     def __exit__(self, *args):
-        self.session.__exit__(*args)
+        with span("session_exit"):
+            self.session.__exit__(*args)
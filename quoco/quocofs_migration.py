@@ -1,17 +1,27 @@
 import json
+import os
+import sys
 import warnings
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 from hashlib import sha256
 from pathlib import Path
 from glob import glob
-from typing import Callable, Optional, Type, Union
+from typing import Callable, Dict, List, Optional, Tuple, Type, Union
 
 from .plan import (
     PlanEntryWithDate,
     PlanEntry,
     PLAN_TYPES,
-    PLAN_CATALOG_ENTRIES_KEY,
-    Catalog,
+    entry_from_serialized,
+    load_catalog,
 )
+from .perc_catalog import PercReader, write_perc_catalog
+from .quocofs_manager import QuocoFsManager
 
 
 def apply_migration(service_name: str, migration: Callable, path: Union[str, Path]):
@@ -34,60 +44,114 @@ def update_field_names(catalog_data, **_):
         catalog_data["service"] = service_name
 
 
-def create_hashes(catalog_data: dict, migration_path: str) -> None:
-    for document_file_name in glob(str(Path(migration_path, "*.md"))):
-        with open(document_file_name, "rb") as document_file:
-            print(document_file_name)
-            document_hash = sha256(document_file.read()).hexdigest()
-            print(document_hash)
-            catalog_data["documents"][Path(document_file_name).stem][
-                "hash"
-            ] = document_hash
+HASH_CACHE_NAME = ".quoco-hash-cache"
+# Files are hashed in blocks of this many bytes so that big files aren't read into memory at once
+HASH_BLOCK_LENGTH = 1 << 20
+
+
+def hash_file(path: Union[str, Path]) -> str:
+    """
+    :param path:
+    :return: Hex sha256 of the file's content
+    """
+    document_hash = sha256()
+    with open(path, "rb") as document_file:
+        while block := document_file.read(HASH_BLOCK_LENGTH):
+            document_hash.update(block)
+    return document_hash.hexdigest()
+
+
+def hash_files(
+    paths: List[Path], cache_path: Optional[Path] = None, jobs: Optional[int] = None
+) -> Dict[Path, str]:
+    """
+    Hash files on a process pool. With a `cache_path`, hashes are cached by (path, size, mtime) so that only files
+    that changed since the last call are read again.
+    :param paths:
+    :param cache_path: JSON file for the cache, created if it doesn't exist
+    :param jobs: Worker count, defaults to the CPU count
+    :return: Path -> hex sha256
+    """
+    cache: Dict[str, list] = {}
+    if cache_path is not None and cache_path.exists():
+        try:
+            cache = json.loads(cache_path.read_text())
+        except ValueError:
+            pass
+
+    hashes: Dict[Path, str] = {}
+    stats = {}
+    to_hash = []
+    for path in paths:
+        stat = path.stat()
+        stats[path] = [stat.st_size, stat.st_mtime_ns]
+        cached = cache.get(str(path))
+        if cached is not None and cached[:2] == stats[path]:
+            hashes[path] = cached[2]
+        else:
+            to_hash.append(path)
+
+    if to_hash:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for path, document_hash in zip(
+                to_hash, executor.map(hash_file, to_hash, chunksize=16)
+            ):
+                hashes[path] = document_hash
+
+    if cache_path is not None and to_hash:
+        cache.update({str(path): stats[path] + [hashes[path]] for path in to_hash})
+        cache_path.write_text(json.dumps(cache))
+
+    return hashes
+
+
+def create_hashes(
+    catalog_data: dict, migration_path: str, verbose: bool = False
+) -> None:
+    """
+    :param catalog_data:
+    :param migration_path:
+    :param verbose: List each document and its hash on stderr
+    :return:
+    """
+    document_paths = [
+        Path(document_file_name)
+        for document_file_name in glob(str(Path(migration_path, "*.md")))
+    ]
+    hashes = hash_files(document_paths, Path(migration_path, HASH_CACHE_NAME))
+    for document_path in document_paths:
+        if verbose:
+            print(f"{document_path} {hashes[document_path]}", file=sys.stderr)
+        catalog_data["documents"][document_path.stem]["hash"] = hashes[document_path]
 
 
 def _debug_catalog(catalog_path: str):
     warnings.warn("Deprecated", DeprecationWarning)
-    catalog_header = b"perc\0"
-    with open(catalog_path, "rb") as catalog_file:
-        header_bytes = catalog_file.read(5)
-        if header_bytes != catalog_header:
-            header_bytes_formatted = bytes.hex(header_bytes, sep=" ", bytes_per_sep=1)
-            correct_bytes_formatted = bytes.hex(
-                catalog_header, sep=" ", bytes_per_sep=1
-            )
-            print(
-                f"invalid catalog! first 4 bytes: {header_bytes_formatted} (expected {correct_bytes_formatted})"
-            )
-            return
-
-        print("valid catalog, reading...")
+    try:
+        reader = PercReader(catalog_path)
+        reader.validate()
+    except ValueError as e:
+        print(f"invalid catalog! {e}")
+        return
 
-        while True:
-            document_name_bytes = catalog_file.read(16)
+    print("valid catalog, reading...")
 
-            if not document_name_bytes:
-                # Check if read worked before continuing
-                break
-
-            document_name = document_name_bytes.hex()
-            # second parameter 1 means seek relative to current position
-            catalog_file.seek(1, 1)
-            document_hash = catalog_file.read(32).hex()
-            print(f"{document_name} {document_hash}")
+    with reader:
+        for document_name, document_hash in reader:
+            print(f"{document_name.hex()} {document_hash.hex()}")
+            document_name.release()
+            document_hash.release()
 
 
 def migrate_json_to_binary(catalog_data: dict, migration_path: str):
     # Note: I want to get rid of the service distinction and have everything under the same index
-    with open(Path(migration_path, "catalog"), "wb") as binary_catalog_file:
-        # TODO: Use this code to actually write the file in the future
-
-        file_content = b"perc\0"
-
-        for document in catalog_data["documents"].values():
-            hex_name_bytes = bytes.fromhex(document["obfuscatedName"])
-            hex_hash_bytes = bytes.fromhex(document["hash"])
-            file_content += hex_name_bytes + b"\0" + hex_hash_bytes
-        binary_catalog_file.write(file_content)
+    write_perc_catalog(
+        Path(migration_path, "catalog"),
+        (
+            (bytes.fromhex(document["obfuscatedName"]), bytes.fromhex(document["hash"]))
+            for document in catalog_data["documents"].values()
+        ),
+    )
 
 
 def plan_from_legacy_name(legacy_name: str) -> Optional[PlanEntry]:
@@ -108,30 +172,171 @@ def plan_from_legacy_name(legacy_name: str) -> Optional[PlanEntry]:
     return entry
 
 
-def migrate_plan_data_to_new_format(old_catalog: dict, migration_path: str):
-    catalog = Catalog.from_quocofs()
+INGEST_CHECKPOINT_NAME = ".quoco-ingest-checkpoint"
 
-    with catalog.manager:
-        for document in old_catalog["documents"].values():
-            plan_name = document["name"]
-            plan_instance = plan_from_legacy_name(plan_name)
 
-            if plan_instance is None:
-                continue
+def _load_ingest_checkpoint(checkpoint_path: Path) -> Dict[str, dict]:
+    """
+    :param checkpoint_path:
+    :return: Source path -> {"id": <hex id>, "entry": <serialized entry>} for files ingested before an interruption
+    """
+    if not checkpoint_path.exists():
+        return {}
 
-            # document_id = document["obfuscatedName"]
-            with open(Path(migration_path, f"{plan_name}.md"), "rb") as document_file:
-                document_id = bytes.hex(
-                    bytes(catalog.manager.session.create_object(document_file.read()))
-                )
+    ingested = {}
+    with open(checkpoint_path) as checkpoint_file:
+        for line in checkpoint_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Torn last line from an interrupted write
+                continue
+            ingested[record["path"]] = record
+    return ingested
+
+
+def ingest_documents(
+    manager: QuocoFsManager,
+    catalog,
+    paths: List[Path],
+    checkpoint_path: Path,
+    jobs: Optional[int] = None,
+) -> Tuple[int, int]:
+    """
+    Create plan documents from markdown files named like `PlanEntry.name()` (which is also the legacy naming scheme),
+    reading and encrypting them concurrently. Every created document is recorded in a checkpoint file right away, so an
+    interrupted ingest picks up where it stopped instead of creating duplicate objects. The catalog is only put to;
+    saving it is up to the caller.
+    :param manager:
+    :param catalog:
+    :param paths:
+    :param checkpoint_path:
+    :param jobs: Worker count, defaults to the CPU count
+    :return: (documents ingested, files skipped because they aren't plans or the plan already exists, files that
+    couldn't be read or stored, which are reported on stderr)
+    """
+    checkpoint = _load_ingest_checkpoint(checkpoint_path)
+    for record in checkpoint.values():
+        catalog.put(entry_from_serialized(record["entry"]), bytes.fromhex(record["id"]))
+
+    to_ingest: List[Tuple[Path, PlanEntry]] = []
+    skipped = 0
+    claimed = set()
+    for path in paths:
+        if str(path) in checkpoint:
+            continue
+        try:
+            entry = plan_from_legacy_name(path.stem)
+        except (ValueError, NotImplementedError):
+            # Starts like a plan type but the date doesn't parse, or names a semester/term that doesn't exist
+            entry = None
+        if (
+            entry is None
+            or entry.catalog_key() in claimed
+            or catalog.get_id(entry) is not None
+        ):
+            skipped += 1
+            continue
+        claimed.add(entry.catalog_key())
+        to_ingest.append((path, entry))
+
+    def ingest(path: Path) -> bytes:
+        return manager.create_object(path.read_bytes())
+
+    jobs = jobs or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=jobs) as executor, open(
+        checkpoint_path, "ab+"
+    ) as checkpoint_file:
+        # Start a fresh line after a torn one
+        if checkpoint_file.tell() > 0:
+            checkpoint_file.seek(-1, os.SEEK_END)
+            if checkpoint_file.read(1) != b"\n":
+                checkpoint_file.write(b"\n")
+        futures = {
+            executor.submit(ingest, path): (path, entry) for path, entry in to_ingest
+        }
+        pending = set(futures)
+        failed = 0
+
+        def record(future, put: bool = True):
+            nonlocal failed
+            pending.discard(future)
+            path, entry = futures[future]
+            try:
+                document_id = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"couldn't ingest {path}: {e}", file=sys.stderr)
+                return
+            checkpoint_file.write(
+                json.dumps(
+                    {
+                        "path": str(path),
+                        "id": document_id.hex(),
+                        "entry": entry.serialize(),
+                    }
+                ).encode("utf-8")
+                + b"\n"
+            )
+            checkpoint_file.flush()
+            if put:
+                catalog.put(entry, document_id)
+
+        try:
+            for future in as_completed(futures):
+                record(future)
+        finally:
+            # When interrupted, don't start any more files, but checkpoint every document that did get created so
+            # that the next run doesn't create it again. The catalog won't be saved, and the next run puts everything
+            # in the checkpoint anyway.
+            for future in pending:
+                future.cancel()
+            for future in list(pending):
+                if not future.cancelled():
+                    wait([future])
+                    record(future, put=False)
+
+    return len(checkpoint) + len(to_ingest) - failed, skipped, failed
+
+
+def ingest_plans(paths: List[Path], checkpoint_path: Path, jobs: Optional[int] = None):
+    manager = QuocoFsManager(
+        QuocoFsManager.default_data_path(),
+        QuocoFsManager.default_config_path(),
+        QuocoFsManager.DEFAULT_SALT,
+    )
+
+    with manager:
+        catalog = load_catalog(manager)
+        ingested, skipped, failed = ingest_documents(
+            manager, catalog, paths, checkpoint_path, jobs
+        )
+        catalog.save(manager)
+    # Only once the catalog is saved are the ingested documents safe to forget about
+    checkpoint_path.unlink(missing_ok=True)
+    print(
+        f"ingested {ingested} documents, skipped {skipped} files, {failed} failed",
+        file=sys.stderr,
+    )
+
+
+def ingest_directory(path: Union[str, Path], jobs: Optional[int] = None):
+    """
+    Ingest every markdown file under a directory
+    :param path:
+    :param jobs:
+    :return:
+    """
+    path = Path(path)
+    ingest_plans(sorted(path.rglob("*.md")), Path(path, INGEST_CHECKPOINT_NAME), jobs)
 
-            catalog.data[PLAN_CATALOG_ENTRIES_KEY][
-                document_id
-            ] = plan_instance.serialize() | {"id": document_id}
 
-        catalog.manager.session.modify_object(
-            catalog.id, json.dumps(catalog.data).encode("utf-8")
-        )
+def migrate_plan_data_to_new_format(old_catalog: dict, migration_path: str):
+    paths = [
+        Path(migration_path, f"{document['name']}.md")
+        for document in old_catalog["documents"].values()
+    ]
+    ingest_plans(paths, Path(migration_path, INGEST_CHECKPOINT_NAME))
 
 
 def migrate_plan(path):
@@ -0,0 +1,46 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Union
+
+
+class Remote(ABC):
+    """
+    Where session objects are stored. quocofs always talks to remotes through its Google Storage accessor, so every
+    remote provides a bucket name and a service account file for it.
+    """
+
+    bucket_name: str
+
+    @abstractmethod
+    def start(self) -> Path:
+        """
+        Get the remote ready for a session. Safe to call more than once.
+        :return: Path of the service account file to give the accessor
+        """
+
+
+class GoogleStorageRemote(Remote):
+    def __init__(self, bucket_name: str, service_account_path: Union[str, Path]):
+        self.bucket_name = bucket_name
+        self._service_account_path = Path(service_account_path)
+
+    def start(self) -> Path:
+        # TODO: Raise custom exception when we can't find a key file.
+        return self._service_account_path
+
+
+def create_remote(remote_config: dict, config_path: Union[str, Path]) -> Remote:
+    """
+    Create the remote described by the `remote` config section
+    :param remote_config:
+    :param config_path:
+    :return:
+    """
+    remote_type = remote_config["type"]
+
+    if remote_type == "google":
+        return GoogleStorageRemote(
+            remote_config["bucket"], Path(config_path, "google-service-account.json")
+        )
+
+    raise ValueError(f"unknown remote type '{remote_type}'")
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import math
+import re
+import sys
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from .plan import PlanEntry, PlanEntryWithDate, load_catalog
+from .quocofs_manager import QuocoFsManager
+from .util.trace import traced
+
+SEARCH_INDEX_NAME = "plan_search_index"
+SEARCH_INDEX_VERSION = 2
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+_SNIPPET_LENGTH = 80
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return [token.lower() for token in _TOKEN_PATTERN.findall(text)]
+
+
+@dataclass
+class SearchResult:
+    hex_id: str
+    score: float
+    entry: Optional[PlanEntry] = None
+    snippet: str = ""
+
+
+class SearchIndex:
+    """
+    Inverted index over plan documents, stored as a single encrypted quocofs object. Documents are only re-tokenized
+    when the sha256 of their plaintext differs from the one recorded when they were last indexed.
+
+    Stored as JSON:
+        {"version": 2,
+         "documents": {<hex id>: {"hash": <hex sha256>, "length": <token count>}},
+         "postings": {<term>: {<hex id>: <count>}}}
+    Which terms a document has is only needed to remove it, so that's rebuilt from the postings the first time a
+    document is re-tokenized rather than stored a second time.
+    """
+
+    def __init__(self, data: dict, id: Optional[bytes]):
+        self.data = data
+        self.id = id
+        self._dirty = False
+        # Hex id -> terms, inverted from the postings when first needed
+        self._document_terms: Optional[Dict[str, List[str]]] = None
+
+    @property
+    def _documents(self) -> Dict[str, dict]:
+        return self.data["documents"]
+
+    @property
+    def _postings(self) -> Dict[str, Dict[str, int]]:
+        return self.data["postings"]
+
+    @staticmethod
+    def empty() -> "SearchIndex":
+        return SearchIndex(
+            {"version": SEARCH_INDEX_VERSION, "documents": {}, "postings": {}}, None
+        )
+
+    @staticmethod
+    def from_quocofs(manager: QuocoFsManager) -> Optional["SearchIndex"]:
+        """
+        :param manager:
+        :return: The stored index, or None if the store hasn't been indexed yet
+        """
+        index_id = manager.session.object_id_with_name(SEARCH_INDEX_NAME)
+        if not index_id:
+            return None
+
+        data = json.loads(manager.session.object(index_id))
+        if data.get("version") != SEARCH_INDEX_VERSION:
+            # Rebuilt from scratch on the next `plan --reindex`
+            return SearchIndex(SearchIndex.empty().data, index_id)
+        return SearchIndex(data, index_id)
+
+    def _terms(self) -> Dict[str, List[str]]:
+        if self._document_terms is None:
+            self._document_terms = {}
+            for term, postings in self._postings.items():
+                for hex_id in postings:
+                    self._document_terms.setdefault(hex_id, []).append(term)
+        return self._document_terms
+
+    def _remove(self, hex_id: str):
+        if self._documents.pop(hex_id, None) is None:
+            return
+        for term in self._terms().pop(hex_id, []):
+            postings = self._postings[term]
+            del postings[hex_id]
+            if not postings:
+                del self._postings[term]
+
+    def update(self, hex_id: str, data: bytes) -> bool:
+        """
+        :param hex_id:
+        :param data: Document plaintext
+        :return: Whether the document had to be re-tokenized
+        """
+        content_hash = hashlib.sha256(data).hexdigest()
+        document = self._documents.get(hex_id)
+        if document is not None and document["hash"] == content_hash:
+            return False
+
+        self._remove(hex_id)
+        terms = Counter(tokenize(data.decode("utf-8", errors="replace")))
+        self._documents[hex_id] = {
+            "hash": content_hash,
+            "length": sum(terms.values()),
+        }
+        for term, count in terms.items():
+            self._postings.setdefault(term, {})[hex_id] = count
+        if self._document_terms is not None:
+            self._document_terms[hex_id] = list(terms)
+        self._dirty = True
+        return True
+
+    def retain(self, hex_ids: Iterable[str]):
+        """
+        Drop documents that aren't in `hex_ids`
+        :param hex_ids:
+        :return:
+        """
+        keep = set(hex_ids)
+        for hex_id in [hex_id for hex_id in self._documents if hex_id not in keep]:
+            self._remove(hex_id)
+            self._dirty = True
+
+    def search(self, query: str, limit: int = 10) -> List[SearchResult]:
+        """
+        Rank documents against `query` with BM25
+        :param query:
+        :param limit:
+        :return: Best matches first
+        """
+        document_count = len(self._documents)
+        if not document_count:
+            return []
+
+        average_length = max(
+            sum(document["length"] for document in self._documents.values())
+            / document_count,
+            1,
+        )
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term, {})
+            idf = math.log(
+                1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for hex_id, count in postings.items():
+                relative_length = self._documents[hex_id]["length"] / average_length
+                saturation = count + _K1 * (1 - _B + _B * relative_length)
+                scores[hex_id] = (
+                    scores.get(hex_id, 0) + idf * count * (_K1 + 1) / saturation
+                )
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [SearchResult(hex_id, score) for hex_id, score in ranked[:limit]]
+
+    def save(self, manager: QuocoFsManager):
+        if not self._dirty:
+            return
+
+        data = json.dumps(self.data, separators=(",", ":")).encode("utf-8")
+        if self.id is None:
+            self.id = manager.session.create_object(data)
+            manager.session.set_object_name(self.id, SEARCH_INDEX_NAME)
+        else:
+            manager.session.modify_object(self.id, data)
+        self._dirty = False
+
+
+def snippet(text: str, query: str) -> str:
+    """
+    :param text:
+    :param query:
+    :return: The first line of `text` containing a query term, trimmed around the match
+    """
+    terms = set(tokenize(query))
+    for line in text.splitlines():
+        for match in _TOKEN_PATTERN.finditer(line):
+            if match.group().lower() in terms:
+                start = max(0, match.start() - _SNIPPET_LENGTH // 4)
+                return line[start : start + _SNIPPET_LENGTH].strip()
+    return ""
+
+
+@traced("update_search_index")
+def update_search_index(manager: QuocoFsManager, ids: List[bytes]) -> None:
+    """
+    Re-index edited documents, if the store has a search index
+    :param manager:
+    :param ids:
+    :return:
+    """
+    if not ids:
+        return
+
+    index = SearchIndex.from_quocofs(manager)
+    if index is None:
+        return
+
+    for id in ids:
+        index.update(id.hex(), manager.read_object(id))
+    index.save(manager)
+
+
+def reindex(manager: QuocoFsManager, catalog) -> int:
+    """
+    Bring the search index up to date with every document in the catalog, creating it if needed
+    :param manager:
+    :param catalog:
+    :return: Number of documents that were re-tokenized
+    """
+    index = SearchIndex.from_quocofs(manager) or SearchIndex.empty()
+    hex_ids = [hex_id for hex_id, _ in catalog.entries()]
+
+    updated = sum(
+        index.update(hex_id, manager.read_object(bytes.fromhex(hex_id)))
+        for hex_id in hex_ids
+    )
+    index.retain(hex_ids)
+    index.save(manager)
+    return updated
+
+
+def search(manager: QuocoFsManager, catalog, query: str, limit: int = 10):
+    """
+    Search the index, then decrypt only the matching documents for snippets
+    :param manager:
+    :param catalog:
+    :param query:
+    :param limit:
+    :return:
+    """
+    index = SearchIndex.from_quocofs(manager)
+    if index is None:
+        return None
+
+    entries = dict(catalog.entries())
+    results = index.search(query, limit)
+    for result in results:
+        result.entry = entries.get(result.hex_id)
+        result.snippet = snippet(
+            manager.read_object(bytes.fromhex(result.hex_id)).decode(
+                "utf-8", errors="replace"
+            ),
+            query,
+        )
+    return results
+
+
+def _format_result(result: SearchResult) -> str:
+    entry = result.entry
+    if entry is None:
+        label = result.hex_id
+    elif isinstance(entry, PlanEntryWithDate):
+        label = f"{entry.type_name} {entry.plan_date.strftime('%Y-%m-%d')}"
+    else:
+        label = entry.type_name
+    return f"{label}\t{result.snippet}"
+
+
+def _default_manager() -> QuocoFsManager:
+    return QuocoFsManager(
+        QuocoFsManager.default_data_path(),
+        QuocoFsManager.default_config_path(),
+        QuocoFsManager.DEFAULT_SALT,
+    )
+
+
+def search_plans(query: str) -> None:
+    manager = _default_manager()
+    with manager:
+        results = search(manager, load_catalog(manager), query)
+
+    if results is None:
+        print("no search index yet, run plan --reindex first", file=sys.stderr)
+        return
+
+    for result in results:
+        print(_format_result(result))
+
+
+def reindex_plans() -> None:
+    manager = _default_manager()
+    with manager:
+        updated = reindex(manager, load_catalog(manager))
+    print(f"indexed {updated} changed documents", file=sys.stderr)
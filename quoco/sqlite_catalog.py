@@ -0,0 +1,250 @@
+import sqlite3
+import tempfile
+from contextlib import closing
+from datetime import date, datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Type
+
+from .plan import (
+    PLAN_CATALOG_ENTRIES_KEY,
+    PLAN_CATALOG_NAME,
+    PLAN_DATE_FORMAT,
+    PLAN_TYPES_BY_NAME,
+    Catalog,
+    PlanEntry,
+    PlanEntryWithDate,
+)
+from .quocofs_manager import QuocoFsManager
+from .util.trace import traced
+
+PLAN_CATALOG_SQLITE_NAME = "plan_catalog_sqlite"
+# Undated plans (like `LifePlan`) are stored with this date so that (type, date) stays unique; real date ordinals
+# start at 1
+_UNDATED_ORDINAL = 0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id BLOB PRIMARY KEY,
+    type TEXT NOT NULL,
+    date INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS entries_type_date ON entries (type, date);
+"""
+
+
+def _entry_ordinal(entry: PlanEntry) -> int:
+    if isinstance(entry, PlanEntryWithDate):
+        return entry.plan_date_from_date().toordinal()
+    return _UNDATED_ORDINAL
+
+
+def _dump_database(connection: sqlite3.Connection) -> bytes:
+    # Connection.serialize is only available from Python 3.11
+    if hasattr(connection, "serialize"):
+        return connection.serialize()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_path = Path(temp_dir, "catalog.sqlite3")
+        with closing(sqlite3.connect(database_path)) as file_connection:
+            connection.backup(file_connection)
+        return database_path.read_bytes()
+
+
+def _load_database(data: bytes) -> sqlite3.Connection:
+    connection = sqlite3.connect(":memory:")
+    if hasattr(connection, "deserialize"):
+        connection.deserialize(data)
+        return connection
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_path = Path(temp_dir, "catalog.sqlite3")
+        database_path.write_bytes(data)
+        with closing(sqlite3.connect(database_path)) as file_connection:
+            file_connection.backup(connection)
+    return connection
+
+
+class SqliteCatalog:
+    """
+    Catalog engine backed by an in-memory SQLite database, stored as a single encrypted quocofs object.
+
+    Has the same API as `plan.Catalog`.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, id: Optional[bytes]):
+        self.connection = connection
+        self.connection.executescript(_SCHEMA)
+        self.id = id
+        self._dirty = False
+
+    @staticmethod
+    def from_json_data(data: dict, id: Optional[bytes] = None) -> "SqliteCatalog":
+        """
+        Build a catalog from version 3 JSON catalog data
+        :param data:
+        :param id:
+        :return:
+        """
+        catalog = SqliteCatalog(sqlite3.connect(":memory:"), id)
+        catalog.merge_json_data(data)
+        catalog._dirty = True
+        return catalog
+
+    def merge_json_data(self, data: dict) -> int:
+        """
+        Add the entries of version 3 JSON catalog data that this catalog doesn't have yet. Entries already here win,
+        like in `plan.Catalog`.
+        :param data:
+        :return: Number of entries added
+        """
+        if data.get("version") != 3:
+            raise ValueError(
+                f"can't convert JSON catalog version {data.get('version')}, expected 3"
+            )
+
+        rows = (
+            (
+                bytes.fromhex(hex_id),
+                serialized["type"],
+                datetime.strptime(serialized["date"], PLAN_DATE_FORMAT).toordinal()
+                if "date" in serialized
+                else _UNDATED_ORDINAL,
+            )
+            for hex_id, serialized in data[PLAN_CATALOG_ENTRIES_KEY].items()
+        )
+        changes = self.connection.total_changes
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO entries (id, type, date) VALUES (?, ?, ?)", rows
+            )
+        added = self.connection.total_changes - changes
+        if added:
+            self._dirty = True
+        return added
+
+    @staticmethod
+    @traced("SqliteCatalog.from_quocofs")
+    def from_quocofs(manager: QuocoFsManager) -> "SqliteCatalog":
+        catalog_id = manager.session.object_id_with_name(PLAN_CATALOG_SQLITE_NAME)
+        if catalog_id:
+            return SqliteCatalog(
+                _load_database(manager.session.object(catalog_id)), catalog_id
+            )
+
+        return convert_json_catalog(manager)
+
+    def get_id(self, entry: PlanEntry) -> Optional[bytes]:
+        row = self.connection.execute(
+            "SELECT id FROM entries WHERE type = ? AND date = ?",
+            (entry.type_name, _entry_ordinal(entry)),
+        ).fetchone()
+        return bytes(row[0]) if row is not None else None
+
+    def get_ids(self, entries: List[PlanEntry]) -> List[Optional[bytes]]:
+        if not entries:
+            return []
+
+        keys = [(entry.type_name, _entry_ordinal(entry)) for entry in entries]
+        rows = self.connection.execute(
+            "SELECT type, date, id FROM entries WHERE (type, date) IN (VALUES "
+            + ", ".join(["(?, ?)"] * len(keys))
+            + ")",
+            [value for key in keys for value in key],
+        )
+        ids = {(type, date): bytes(id) for type, date, id in rows}
+        return [ids.get(key) for key in keys]
+
+    def entries(self) -> Iterator[tuple[str, PlanEntry]]:
+        """
+        :return: (hex id, entry) for every document in the catalog whose type this version of quoco knows
+        """
+        rows = self.connection.execute("SELECT id, type, date FROM entries")
+        for id, type_name, ordinal in rows:
+            entry_type = PLAN_TYPES_BY_NAME.get(type_name)
+            if entry_type is None:
+                # Kept in the database, but there's no entry class to give back
+                continue
+            # noinspection PyArgumentList
+            entry = (
+                entry_type()
+                if ordinal == _UNDATED_ORDINAL
+                else entry_type(datetime.fromordinal(ordinal))
+            )
+            yield bytes(id).hex(), entry
+
+    def put(self, entry: PlanEntry, id: bytes):
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO entries (id, type, date) VALUES (?, ?, ?)",
+                (bytes(id), entry.type_name, _entry_ordinal(entry)),
+            )
+        self._dirty = self._dirty or cursor.rowcount > 0
+
+    def get_nth(
+        self, entry_type: Type[PlanEntryWithDate], n: int
+    ) -> Optional[tuple[str, PlanEntryWithDate]]:
+        row = self.connection.execute(
+            "SELECT id, date FROM entries WHERE type = ? ORDER BY date DESC LIMIT 1 OFFSET ?",
+            (entry_type.type_name, n),
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        id, ordinal = row
+
+        # noinspection PyArgumentList
+        return bytes(id).hex(), entry_type(datetime.fromordinal(ordinal))
+
+    def get_range(
+        self, entry_type: Type[PlanEntryWithDate], start: date, end: date
+    ) -> List[tuple[str, PlanEntryWithDate]]:
+        rows = self.connection.execute(
+            "SELECT id, date FROM entries WHERE type = ? AND date BETWEEN ? AND ? ORDER BY date",
+            (entry_type.type_name, start.toordinal(), end.toordinal()),
+        )
+
+        # noinspection PyArgumentList
+        return [
+            (bytes(id).hex(), entry_type(datetime.fromordinal(ordinal)))
+            for id, ordinal in rows
+        ]
+
+    @traced("SqliteCatalog.save")
+    def save(self, manager: QuocoFsManager):
+        if not self._dirty:
+            return
+
+        data = _dump_database(self.connection)
+        if self.id is None:
+            self.id = manager.session.create_object(data)
+            manager.session.set_object_name(self.id, PLAN_CATALOG_SQLITE_NAME)
+        else:
+            manager.session.modify_object(self.id, data)
+        self._dirty = False
+
+
+def convert_json_catalog(manager: QuocoFsManager) -> SqliteCatalog:
+    """
+    Convert the version 3 JSON catalog, including its delta log, into the SQLite catalog object. If there already is a
+    SQLite catalog, JSON entries it doesn't have are merged into it, so entries added through the SQLite engine since
+    an earlier conversion are kept. The JSON catalog is left untouched.
+    :param manager:
+    :return:
+    """
+    json_data = (
+        Catalog.from_quocofs(manager).data
+        if manager.session.object_id_with_name(PLAN_CATALOG_NAME)
+        else {"version": 3, PLAN_CATALOG_ENTRIES_KEY: {}}
+    )
+
+    catalog_id = manager.session.object_id_with_name(PLAN_CATALOG_SQLITE_NAME)
+    if catalog_id:
+        catalog = SqliteCatalog(
+            _load_database(manager.session.object(catalog_id)), catalog_id
+        )
+        catalog.merge_json_data(json_data)
+    else:
+        catalog = SqliteCatalog.from_json_data(json_data)
+    catalog.save(manager)
+    return catalog
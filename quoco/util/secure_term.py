@@ -1,18 +1,30 @@
+import sys
+
 # TODO: Destroy this global state once and for all
 lines_written = 0
 
 
+def _terminal():
+    """
+    Prompts and terminal control go to stdout, unless stdout is carrying data like `plan --export -` or `plan --range`
+    output, in which case they go to stderr
+    """
+    return sys.stdout if sys.stdout.isatty() else sys.stderr
+
+
 def clear_term() -> None:
     global lines_written
     if lines_written == 0:
         return
-    print(f"\u001b[{lines_written}A", end="")
-    print("\u001b[0J", end="")
+    terminal = _terminal()
+    if terminal.isatty():
+        print(f"\u001b[{lines_written}A", end="", file=terminal)
+        print("\u001b[0J", end="", file=terminal)
     lines_written = 0
 
 
 def secure_print(*args, sep=" ", end="\n") -> None:
-    print(*args, sep=sep, end=end)
+    print(*args, sep=sep, end=end, file=_terminal())
     new_lines = end.count("\n")
     for arg in args:
         if arg is str:
@@ -0,0 +1,74 @@
+import os
+import socket
+import struct
+import tempfile
+from pathlib import Path
+
+# Linux only; elsewhere the socket's permissions are the only check
+_SO_PEERCRED = getattr(socket, "SO_PEERCRED", None)
+
+
+def is_private_dir(path: Path) -> bool:
+    """Check that nobody else could have put (or can reach) a socket in `path`"""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return False
+    return stat.st_uid == os.getuid() and stat.st_mode & 0o077 == 0
+
+
+def peer_is_same_user(connection: socket.socket) -> bool:
+    if _SO_PEERCRED is None:
+        return True
+    credentials = connection.getsockopt(
+        socket.SOL_SOCKET, _SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", credentials)
+    return uid == os.getuid()
+
+
+def listen_private_socket(socket_path: Path) -> socket.socket:
+    """
+    Listen on a Unix socket that only the current user can connect to
+    :param socket_path:
+    :return:
+    """
+    socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if not is_private_dir(socket_path.parent):
+        raise PermissionError(
+            f"{socket_path.parent} must be owned by you and inaccessible to others"
+        )
+    socket_path.unlink(missing_ok=True)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Create the socket with restricted permissions from the start rather than chmod-ing it after the fact
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(str(socket_path))
+    finally:
+        os.umask(old_umask)
+    server.listen()
+    return server
+
+
+def connect_private_socket(socket_path: Path, timeout: float) -> socket.socket:
+    """
+    :raises OSError: If the socket can't be connected to, or if it isn't in a private directory
+    """
+    if not is_private_dir(socket_path.parent):
+        raise PermissionError(f"{socket_path.parent} isn't private")
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(timeout)
+        client.connect(str(socket_path))
+    except OSError:
+        client.close()
+        raise
+    return client
+
+
+def runtime_socket_path(name: str) -> Path:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir, "quoco", name)
+    return Path(tempfile.gettempdir(), f"quoco-{os.getuid()}", name)
@@ -0,0 +1,139 @@
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, List, Optional, Union
+
+# Phase timing for `plan --profile` (or QUOCO_PROFILE=<path>, or QUOCO_PROFILE=1 for a default path). Spans are
+# written as Chrome trace "complete" events, which chrome://tracing and https://ui.perfetto.dev can open. Tracing is
+# off by default, and `span` is close to free then.
+PROFILE_ENV_VAR = "QUOCO_PROFILE"
+
+_events: Optional[List[dict]] = None
+_output_path: Optional[Path] = None
+_local = threading.local()
+_lock = threading.Lock()
+
+
+def default_trace_path() -> Path:
+    return Path(tempfile.gettempdir(), f"quoco-trace-{os.getpid()}.json")
+
+
+def enable(path: Optional[Union[str, Path]] = None):
+    global _events, _output_path
+    _events = []
+    _output_path = Path(path) if path else default_trace_path()
+
+
+def enable_from_env(always: bool = False):
+    """
+    Enable tracing if `PROFILE_ENV_VAR` is set, writing the trace to the path it holds, or a temp file if it's 1
+    :param always: Enable even if it isn't set
+    :return:
+    """
+    value = os.environ.get(PROFILE_ENV_VAR)
+    if value or always:
+        enable(None if not value or value == "1" else value)
+
+
+def is_enabled() -> bool:
+    return _events is not None
+
+
+@contextmanager
+def span(name: str, **args):
+    """
+    Time a phase. Spans can nest, including across threads.
+    :param name:
+    :param args: Extra details to show with the span
+    :return:
+    """
+    if _events is None:
+        yield
+        return
+
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        _local.depth = depth
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": duration * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        if depth == 0 and threading.current_thread() is threading.main_thread():
+            event["args"] = {**args, "top_level": True}
+        with _lock:
+            _events.append(event)
+
+
+def traced(name: str) -> Callable:
+    """Decorator version of `span`"""
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def summary() -> str:
+    """
+    :return: Top-level spans on the main thread, not counting time spent in spans marked `waiting` (like the editor)
+    """
+    events = _events or []
+    waiting = [event for event in events if event["args"].get("waiting", False)]
+
+    def active_duration(event: dict) -> float:
+        end = event["ts"] + event["dur"]
+        return event["dur"] - sum(
+            inner["dur"]
+            for inner in waiting
+            if inner["tid"] == event["tid"]
+            and event["ts"] <= inner["ts"]
+            and inner["ts"] + inner["dur"] <= end
+        )
+
+    top_level = sorted(
+        (event for event in events if event["args"].get("top_level", False)),
+        key=lambda event: event["ts"],
+    )
+    phases = ", ".join(
+        f"{event['name']} {active_duration(event) / 1000:.0f}ms" for event in top_level
+    )
+    total = sum(active_duration(event) for event in top_level) / 1000
+    waited = sum(event["dur"] for event in waiting) / 1000
+    return f"{total:.0f}ms (+{waited:.0f}ms waiting): {phases}"
+
+
+def finish():
+    """
+    Write the trace and print a one-line summary to stderr, if tracing is enabled
+    :return:
+    """
+    global _events
+    if _events is None:
+        return
+
+    _output_path.write_text(
+        json.dumps({"traceEvents": _events, "displayTimeUnit": "ms"})
+    )
+    print(f"profile: {summary()} (trace in {_output_path})", file=sys.stderr)
+    _events = None
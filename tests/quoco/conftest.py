@@ -0,0 +1,87 @@
+import threading
+import uuid
+from base64 import b64decode
+
+import pytest
+import quocofs
+
+from quoco.quocofs_manager import DEFAULT_CONFIG, QuocoFsManager
+
+
+class MemorySession:
+    """In-memory stand-in for the parts of `quocofs.Session` that the catalog uses."""
+
+    def __init__(self):
+        self.objects = {}
+        self.names = {}
+        self.writes = 0
+
+    def object_id_with_name(self, name):
+        return self.names.get(name)
+
+    def set_object_name(self, id, name):
+        self.names[name] = id
+
+    def object(self, id):
+        return self.objects[id]
+
+    def create_object(self, data):
+        id = uuid.uuid4().bytes
+        self.objects[id] = data
+        self.writes += 1
+        return id
+
+    def modify_object(self, id, data):
+        self.objects[id] = data
+        self.writes += 1
+
+
+class MemoryManager(QuocoFsManager):
+    """`QuocoFsManager` over a `MemorySession`, without a remote or a password prompt."""
+
+    def __init__(self):
+        self.session = MemorySession()
+        self._config = {
+            section: dict(values) for section, values in DEFAULT_CONFIG.items()
+        }
+        self._key = bytes(32)
+        self._content_hashes = {}
+        self._materialize_timings = []
+        self._session_lock = threading.Lock()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+@pytest.fixture
+def manager():
+    return MemoryManager()
+
+
+@pytest.fixture
+def prompting_manager_class(manager, monkeypatch):
+    """
+    Stand-in for `QuocoFsManager` in commands that open their own session. Constructing it goes through the password
+    prompt like a real session would, with a wrong password first, and gives back `manager`.
+    """
+    passwords = iter(["wrong", "right"])
+    monkeypatch.setattr(
+        QuocoFsManager, "prompt_password", lambda repeat=False: next(passwords)
+    )
+    check = quocofs.dumps(
+        b"check", quocofs.key("right", b64decode(QuocoFsManager.DEFAULT_SALT))
+    )
+
+    class PromptingManager(QuocoFsManager):
+        def __new__(cls, *args):
+            QuocoFsManager.key_interactive(
+                {"agent": {**DEFAULT_CONFIG["agent"], "enabled": False}},
+                QuocoFsManager.DEFAULT_SALT,
+                check,
+            )
+            return manager
+
+    return PromptingManager
@@ -0,0 +1,106 @@
+import sys
+
+import pytest
+import quocofs
+
+from quoco import app
+from quoco.util import trace
+
+_KEY = bytes(range(32))
+
+
+def test_batch_reports_unwritable_files(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(app, "_key", lambda check=None: _KEY)
+    for name in ["a", "b"]:
+        (tmp_path / name).write_bytes(quocofs.dumps(name.encode("utf-8"), _KEY))
+    # Something in the way of b's output
+    (tmp_path / f"b{app.DECRYPTED_SUFFIX}").mkdir()
+
+    app.decrypt(str(tmp_path / "[ab]"), 2)
+
+    assert (tmp_path / f"a{app.DECRYPTED_SUFFIX}").read_bytes() == b"a"
+    stderr = capsys.readouterr().err
+    assert f"couldn't decrypt {tmp_path / 'b'}: " in stderr
+    assert "decrypted 1 of 2 files" in stderr
+
+
+def test_decrypt_to_output_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "_key", lambda check=None: _KEY)
+    for name in ["a", "sub/b"]:
+        (tmp_path / "in" / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / "in" / name).write_bytes(quocofs.dumps(b"plan", _KEY))
+
+    app.decrypt(str(tmp_path / "in"), 1, str(tmp_path / "out"))
+
+    assert (tmp_path / "out" / f"a{app.DECRYPTED_SUFFIX}").read_bytes() == b"plan"
+    assert (tmp_path / "out" / "sub" / f"b{app.DECRYPTED_SUFFIX}").exists()
+    assert not (tmp_path / "in" / f"a{app.DECRYPTED_SUFFIX}").exists()
+
+
+@pytest.mark.parametrize("output_dir", [None, "objects"])
+def test_decrypt_refuses_to_write_into_data_directory(
+    tmp_path, monkeypatch, output_dir
+):
+    from quoco.quocofs_manager import QuocoFsManager
+
+    monkeypatch.setattr(QuocoFsManager, "default_data_path", lambda: tmp_path)
+    monkeypatch.setattr(app, "_key", lambda check=None: pytest.fail("asked for key"))
+    (tmp_path / "a").write_bytes(quocofs.dumps(b"plan", _KEY))
+
+    with pytest.raises(SystemExit):
+        app.decrypt(str(tmp_path), 1, output_dir and str(tmp_path / output_dir))
+    assert list(tmp_path.iterdir()) == [tmp_path / "a"]
+
+
+@pytest.mark.parametrize("corrupt, forgotten", [(["b"], False), (["a", "b"], True)])
+def test_decrypt_only_forgets_key_when_every_file_fails(
+    tmp_path, monkeypatch, corrupt, forgotten
+):
+    monkeypatch.setattr(app, "_key", lambda check=None: _KEY)
+    forgets = []
+    monkeypatch.setattr(app, "_forget_key", lambda: forgets.append(1))
+    for name in ["a", "b"]:
+        data = b"corrupt" if name in corrupt else quocofs.dumps(b"plan", _KEY)
+        (tmp_path / name).write_bytes(data)
+
+    app.decrypt(str(tmp_path / "[ab]"), 1)
+
+    assert bool(forgets) == forgotten
+
+
+def test_stale_agent_key_is_forgotten(tmp_path, monkeypatch):
+    from quoco.quocofs_manager import QuocoFsManager
+
+    monkeypatch.setattr(QuocoFsManager, "default_config_path", lambda: tmp_path)
+    keys = [bytes(32), _KEY]
+    monkeypatch.setattr(QuocoFsManager, "key_interactive", lambda *args: keys.pop(0))
+    forgets = []
+    monkeypatch.setattr(app, "_forget_key", lambda: forgets.append(1))
+
+    assert app._key(quocofs.dumps(b"check", _KEY)) == _KEY
+    assert forgets == [1]
+
+
+@pytest.mark.parametrize(
+    "argv, env, trace_name",
+    [
+        (["--profile", "d"], None, "default.json"),
+        (["--profile", "d"], "env.json", "env.json"),
+        (["d", "--profile-output", "out.json"], "env.json", "out.json"),
+    ],
+)
+def test_profile_keeps_plan_arguments(tmp_path, monkeypatch, argv, env, trace_name):
+    if env:
+        monkeypatch.setenv(trace.PROFILE_ENV_VAR, str(tmp_path / env))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(trace, "default_trace_path", lambda: tmp_path / "default.json")
+    monkeypatch.setattr(sys, "argv", ["plan", *argv])
+    runs = []
+    monkeypatch.setattr(
+        app, "_run", lambda args, unknown: runs.append((unknown, trace.is_enabled()))
+    )
+
+    app.main()
+
+    assert runs == [(["d"], True)]
+    assert (tmp_path / trace_name).exists()
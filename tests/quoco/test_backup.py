@@ -0,0 +1,75 @@
+import io
+import tarfile
+from datetime import datetime
+
+import pytest
+
+from quoco.backup import export_store, read_backup, write_backup
+from quoco.plan import Catalog, DayPlan, LifePlan, WeekPlan
+
+
+def _populated_catalog(manager):
+    catalog = Catalog.from_quocofs(manager)
+    catalog.put(DayPlan(datetime(2022, 3, 5)), manager.create_object(b"# day"))
+    catalog.put(LifePlan(), manager.create_object(b"# life"))
+    return catalog
+
+
+@pytest.mark.parametrize("encrypted", [False, True])
+def test_backup_round_trip(manager, encrypted):
+    archive = io.BytesIO()
+    assert (
+        write_backup(manager, _populated_catalog(manager), archive, encrypted, 2) == 2
+    )
+
+    with tarfile.open(fileobj=io.BytesIO(archive.getvalue())) as tar:
+        names = tar.getnames()
+        assert names[0].startswith("manifest.json")
+        assert all(name.endswith(".quoco") == encrypted for name in names)
+        if not encrypted:
+            assert tar.extractfile("plans/life.md").read() == b"# life"
+
+    restore_manager = type(manager)()
+    restore_catalog = Catalog.from_quocofs(restore_manager)
+    archive.seek(0)
+    assert read_backup(restore_manager, restore_catalog, archive) == (2, 0)
+
+    life_id = restore_catalog.get_id(LifePlan())
+    assert restore_manager.session.object(life_id) == b"# life"
+    day_id = restore_catalog.get_id(DayPlan(datetime(2022, 3, 5)))
+    assert restore_manager.session.object(day_id) == b"# day"
+
+
+def test_import_skips_existing_plans(manager):
+    catalog = _populated_catalog(manager)
+    archive = io.BytesIO()
+    write_backup(manager, catalog, archive)
+
+    catalog.put(WeekPlan(datetime(2022, 3, 7)), manager.create_object(b"# week"))
+    archive.seek(0)
+    assert read_backup(manager, catalog, archive) == (0, 2)
+
+
+def test_export_to_stdout_is_a_clean_archive(
+    manager, prompting_manager_class, monkeypatch, capsysbinary
+):
+    _populated_catalog(manager).save(manager)
+    monkeypatch.setattr("quoco.backup.QuocoFsManager", prompting_manager_class)
+
+    export_store("-")
+
+    captured = capsysbinary.readouterr()
+    with tarfile.open(fileobj=io.BytesIO(captured.out)) as tar:
+        assert tar.extractfile("plans/life.md").read() == b"# life"
+    assert b"password failed" in captured.err
+
+
+def test_export_file_is_private(
+    manager, prompting_manager_class, monkeypatch, tmp_path
+):
+    _populated_catalog(manager).save(manager)
+    monkeypatch.setattr("quoco.backup.QuocoFsManager", prompting_manager_class)
+
+    export_store(str(tmp_path / "backup.tar"))
+
+    assert (tmp_path / "backup.tar").stat().st_mode & 0o777 == 0o600
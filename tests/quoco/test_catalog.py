@@ -0,0 +1,211 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from quoco.plan import (
+    Catalog,
+    DayPlan,
+    LifePlan,
+    MonthPlan,
+    PLAN_CATALOG_ENTRIES_KEY,
+    PLAN_CATALOG_LOG_LENGTH,
+    YearPlan,
+)
+
+_CATALOG_ID = bytes(16)
+_DAY_ID = b"\x01" * 16
+_MONTH_ID = b"\x02" * 16
+_LIFE_ID = b"\x03" * 16
+
+
+def _catalog_data():
+    return {
+        "version": 3,
+        PLAN_CATALOG_ENTRIES_KEY: {
+            _DAY_ID.hex(): {"type": "day", "date": "05-03-2022", "id": _DAY_ID.hex()},
+            _MONTH_ID.hex(): {
+                "type": "month",
+                "date": "01-03-2022",
+                "id": _MONTH_ID.hex(),
+            },
+            _LIFE_ID.hex(): {"type": "life", "id": _LIFE_ID.hex()},
+        },
+    }
+
+
+def test_get_id_existing_entries():
+    """Look up dated and undated entries loaded from catalog data."""
+    catalog = Catalog(_catalog_data(), _CATALOG_ID)
+    assert catalog.get_id(DayPlan(datetime(2022, 3, 5))) == _DAY_ID
+    # Month plans are normalized to the first of the month
+    assert catalog.get_id(MonthPlan(datetime(2022, 3, 17))) == _MONTH_ID
+    assert catalog.get_id(LifePlan()) == _LIFE_ID
+
+
+def test_get_id_missing_entry():
+    """Look up an entry that isn't in the catalog."""
+    catalog = Catalog(_catalog_data(), _CATALOG_ID)
+    assert catalog.get_id(DayPlan(datetime(2022, 3, 6))) is None
+
+
+def test_put_updates_index_and_entries():
+    """Put a new entry and check that it can be found and that it's serialized into the catalog data."""
+    catalog = Catalog(_catalog_data(), _CATALOG_ID)
+    new_id = b"\x04" * 16
+    entry = DayPlan(datetime(2022, 3, 6))
+    catalog.put(entry, new_id)
+
+    assert catalog.get_id(entry) == new_id
+    assert catalog.data[PLAN_CATALOG_ENTRIES_KEY][new_id.hex()] == {
+        "type": "day",
+        "date": "06-03-2022",
+        "id": new_id.hex(),
+    }
+
+
+def test_put_duplicate_is_ignored():
+    """Put an entry that already exists under a different id."""
+    catalog = Catalog(_catalog_data(), _CATALOG_ID)
+    catalog.put(DayPlan(datetime(2022, 3, 5)), b"\x05" * 16)
+
+    assert catalog.get_id(DayPlan(datetime(2022, 3, 5))) == _DAY_ID
+    assert (b"\x05" * 16).hex() not in catalog.data[PLAN_CATALOG_ENTRIES_KEY]
+
+
+def test_get_nth():
+    """Get entries of a type from newest to oldest."""
+    data = _catalog_data()
+    older_day_id = b"\x06" * 16
+    data[PLAN_CATALOG_ENTRIES_KEY][older_day_id.hex()] = {
+        "type": "day",
+        "date": "28-02-2022",
+        "id": older_day_id.hex(),
+    }
+    catalog = Catalog(data, _CATALOG_ID)
+
+    assert catalog.get_nth(DayPlan, 0) == (_DAY_ID.hex(), DayPlan(datetime(2022, 3, 5)))
+    assert catalog.get_nth(DayPlan, 1) == (
+        older_day_id.hex(),
+        DayPlan(datetime(2022, 2, 28)),
+    )
+    assert catalog.get_nth(DayPlan, 2) is None
+    assert catalog.get_nth(MonthPlan, 0)[0] == _MONTH_ID.hex()
+
+
+def test_get_nth_after_put():
+    """Check that entries put after the catalog was loaded show up in the date ordering."""
+    catalog = Catalog(_catalog_data(), _CATALOG_ID)
+    assert catalog.get_nth(DayPlan, 0)[0] == _DAY_ID.hex()
+
+    newer_id = b"\x07" * 16
+    older_id = b"\x08" * 16
+    catalog.put(DayPlan(datetime(2022, 3, 6)), newer_id)
+    catalog.put(DayPlan(datetime(2022, 1, 1)), older_id)
+
+    assert catalog.get_nth(DayPlan, 0)[0] == newer_id.hex()
+    assert catalog.get_nth(DayPlan, 1)[0] == _DAY_ID.hex()
+    assert catalog.get_nth(DayPlan, 2)[0] == older_id.hex()
+
+
+def test_save_unchanged_writes_nothing(manager):
+    """Load and save a catalog without putting anything."""
+    Catalog.from_quocofs(manager)
+    writes = manager.session.writes
+
+    Catalog.from_quocofs(manager).save(manager)
+    assert manager.session.writes == writes
+
+
+def test_save_appends_to_log(manager):
+    """Save new entries as deltas and check that they're loaded back without rewriting the catalog object."""
+    catalog = Catalog.from_quocofs(manager)
+    snapshot = manager.session.object(catalog.id)
+
+    first_id = b"\x09" * 16
+    catalog.put(DayPlan(datetime(2022, 3, 5)), first_id)
+    catalog.save(manager)
+    second_id = b"\x0a" * 16
+    catalog.put(DayPlan(datetime(2022, 3, 6)), second_id)
+    catalog.save(manager)
+
+    assert manager.session.object(catalog.id) == snapshot
+    loaded = Catalog.from_quocofs(manager)
+    assert loaded.get_id(DayPlan(datetime(2022, 3, 5))) == first_id
+    assert loaded.get_nth(DayPlan, 0)[0] == second_id.hex()
+
+
+def test_save_compacts_full_log(manager):
+    """Fill every log slot and check that the next save compacts the log into the catalog object."""
+    catalog = Catalog.from_quocofs(manager)
+    for day in range(1, PLAN_CATALOG_LOG_LENGTH + 2):
+        catalog.put(
+            DayPlan(datetime(2022, 1, 1) + timedelta(days=day)), bytes([day]) * 16
+        )
+        catalog.save(manager)
+
+    loaded = Catalog.from_quocofs(manager)
+    assert loaded._log_length == 0
+    assert len(loaded.data[PLAN_CATALOG_ENTRIES_KEY]) == PLAN_CATALOG_LOG_LENGTH + 1
+
+    # Stale deltas from the previous generation are ignored and their slots are reused
+    catalog.put(DayPlan(datetime(2023, 1, 1)), b"\xff" * 16)
+    catalog.save(manager)
+    loaded = Catalog.from_quocofs(manager)
+    assert loaded._log_length == 1
+    assert len(loaded.data[PLAN_CATALOG_ENTRIES_KEY]) == PLAN_CATALOG_LOG_LENGTH + 2
+
+
+def test_get_range():
+    catalog = Catalog(_catalog_data(), _CATALOG_ID)
+    older_day_id = b"\x04" * 16
+    catalog.put(DayPlan(datetime(2022, 2, 28)), older_day_id)
+
+    assert catalog.get_range(DayPlan, date(2022, 2, 28), date(2022, 3, 5)) == [
+        (older_day_id.hex(), DayPlan(datetime(2022, 2, 28))),
+        (_DAY_ID.hex(), DayPlan(datetime(2022, 3, 5))),
+    ]
+    assert catalog.get_range(DayPlan, date(2022, 3, 1), date(2022, 3, 31)) == [
+        (_DAY_ID.hex(), DayPlan(datetime(2022, 3, 5)))
+    ]
+    assert catalog.get_range(DayPlan, date(2022, 3, 6), date(2022, 3, 31)) == []
+    assert catalog.get_range(YearPlan, date(2000, 1, 1), date(2030, 1, 1)) == []
+
+
+def test_data_round_trips():
+    """Rebuild the JSON data from the compact representation, keeping the header and unknown types."""
+    data = _catalog_data()
+    data["log_generation"] = 2
+    data[PLAN_CATALOG_ENTRIES_KEY][(b"\x04" * 16).hex()] = {
+        "type": "someday",
+        "id": (b"\x04" * 16).hex(),
+    }
+    catalog = Catalog(data, _CATALOG_ID)
+
+    assert catalog.data == data
+    assert len(catalog) == 4
+    assert (b"\x04" * 16).hex() not in dict(catalog.entries())
+    assert len(list(catalog.entries())) == 3
+
+
+def test_duplicate_entries_keep_the_first():
+    """An entry that's in the catalog twice is found under its first id but still saved."""
+    data = _catalog_data()
+    duplicate_id = b"\x04" * 16
+    data[PLAN_CATALOG_ENTRIES_KEY][duplicate_id.hex()] = {
+        "type": "day",
+        "date": "05-03-2022",
+        "id": duplicate_id.hex(),
+    }
+    catalog = Catalog(data, _CATALOG_ID)
+
+    assert catalog.get_id(DayPlan(datetime(2022, 3, 5))) == _DAY_ID
+    assert catalog.get_nth(DayPlan, 1) is None
+    assert duplicate_id.hex() in catalog.data[PLAN_CATALOG_ENTRIES_KEY]
+
+
+def test_invalid_id_is_rejected():
+    data = _catalog_data()
+    data[PLAN_CATALOG_ENTRIES_KEY]["abcd"] = {"type": "life", "id": "abcd"}
+
+    with pytest.raises(ValueError):
+        Catalog(data, _CATALOG_ID)
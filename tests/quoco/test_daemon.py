@@ -0,0 +1,83 @@
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from quoco.daemon import _serve, run_daemon
+from quoco.plan import DayPlan, load_catalog
+from quoco.quocofs_manager import QuocoFsManager
+
+
+def _request(manager, *messages):
+    """Send a client's messages up front, run the daemon's side of the connection and return its responses"""
+    client, daemon = socket.socketpair()
+    with client:
+        with daemon:
+            for message in messages:
+                client.sendall(json.dumps(message).encode("utf-8") + b"\n")
+            _serve(manager, daemon)
+        with client.makefile("r") as client_file:
+            return [json.loads(line) for line in client_file]
+
+
+def _edit(manager, args):
+    return _request(manager, {"op": "open", "args": args}, {"op": "done"})
+
+
+def test_bad_arguments_are_reported(manager):
+    for args in ["c+x", "d -- not a date", "d~5"]:
+        [response] = _edit(manager, args)
+        assert "error" in response
+
+    assert "command" in _edit(manager, "d -- 03.05.2022")[0]
+
+
+def test_edits_keep_changes_made_outside_the_daemon(manager):
+    _edit(manager, "d -- 03.05.2022")
+
+    # Like a `plan --ingest` run while the daemon is up
+    outside = load_catalog(manager)
+    outside.put(DayPlan(datetime(2022, 3, 4)), b"\x01" * 16)
+    outside.save(manager)
+
+    _edit(manager, "d -- 03.06.2022")
+    catalog = load_catalog(manager)
+    for day in [4, 5, 6]:
+        assert catalog.get_id(DayPlan(datetime(2022, 3, day))) is not None
+
+
+def test_requests_that_arent_objects_are_rejected(manager):
+    for request in [[], "open", None]:
+        assert _request(manager, request) == [{"error": "unknown request"}]
+
+
+def test_sigterm_closes_the_session(manager, tmp_path, monkeypatch):
+    """Closing the terminal shouldn't skip pushing the day's edits"""
+    socket_path = tmp_path / "daemon.sock"
+    exits = []
+
+    class OpenManager(QuocoFsManager):
+        def __new__(cls, *args):
+            return manager
+
+    monkeypatch.setattr(type(manager), "__exit__", lambda self, *args: exits.append(1))
+    monkeypatch.setattr("quoco.quocofs_manager.QuocoFsManager", OpenManager)
+
+    def terminate():
+        deadline = time.monotonic() + 5
+        while not socket_path.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if socket_path.exists():
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    threading.Thread(target=terminate, daemon=True).start()
+    with pytest.raises(SystemExit):
+        run_daemon(socket_path)
+    assert exits == [1]
+    assert not socket_path.exists()
+    assert signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
@@ -0,0 +1,81 @@
+from hashlib import sha256
+
+import quocofs
+
+from quoco.hashes_diff import diff_hashes, load_hashes, print_hashes_diff
+from quoco.perc_catalog import PERC_HEADER, write_perc_catalog
+
+_KEY = bytes(32)
+
+
+def _id(i):
+    return bytes([i]) * 16
+
+
+def test_diff_hashes():
+    left = [(_id(1), b"a"), (_id(2), b"b"), (_id(4), b"d"), (_id(6), b"f")]
+    right = [(_id(2), b"b"), (_id(3), b"c"), (_id(4), b"x"), (_id(7), b"g")]
+
+    diff = diff_hashes(left, right)
+    assert diff.only_left == [_id(1), _id(6)]
+    assert diff.only_right == [_id(3), _id(7)]
+    assert diff.mismatched == [_id(4)]
+    assert not diff_hashes(left, left)
+
+
+def test_load_hashes_from_each_source(tmp_path):
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+    for i in (2, 1):
+        (data_path / _id(i).hex()).write_bytes(quocofs.dumps(bytes([i]), _KEY))
+    (data_path / "not-an-object").write_bytes(b"")
+    expected = [(_id(i), sha256(bytes([i])).digest()) for i in (1, 2)]
+
+    assert load_hashes(data_path, lambda: _KEY, 1) == expected
+
+    perc_path = tmp_path / "catalog"
+    write_perc_catalog(perc_path, expected)
+    assert list(load_hashes(perc_path, None)) == expected
+
+    # Written before perc catalogs were sorted
+    perc_path.write_bytes(
+        PERC_HEADER + b"".join(id + b"\0" + hash for id, hash in reversed(expected))
+    )
+    assert list(load_hashes(perc_path, None)) == expected
+
+    hashes_path = tmp_path / "hashes"
+    hashes_path.write_bytes(quocofs.hashes.dumps(dict(expected), _KEY))
+    assert load_hashes(hashes_path, lambda: _KEY) == expected
+
+
+def test_print_hashes_diff(tmp_path, capsys):
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+    (data_path / _id(1).hex()).write_bytes(quocofs.dumps(b"changed", _KEY))
+    (data_path / _id(2).hex()).write_bytes(b"corrupted")
+    perc_path = tmp_path / "catalog"
+    write_perc_catalog(
+        perc_path,
+        [(_id(1), sha256(b"object").digest()), (_id(2), sha256(b"object").digest())],
+    )
+
+    assert not print_hashes_diff(str(perc_path), str(data_path), lambda: _KEY, 1)
+    assert capsys.readouterr().out.startswith(f"~ {_id(1).hex()}\n~ {_id(2).hex()}\n")
+
+
+def test_print_hashes_diff_against_a_data_directory(tmp_path, capsys):
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+    recorded = {}
+    for i in (1, 2):
+        plaintext = f"object {i}".encode("utf-8")
+        (data_path / _id(i).hex()).write_bytes(quocofs.dumps(plaintext, _KEY))
+        recorded[_id(i)] = sha256(plaintext).digest()
+    hashes_path = tmp_path / "hashes"
+    hashes_path.write_bytes(quocofs.hashes.dumps(recorded, _KEY))
+
+    assert print_hashes_diff(str(hashes_path), str(data_path), lambda: _KEY, 1)
+
+    (data_path / _id(2).hex()).write_bytes(quocofs.dumps(b"changed", _KEY))
+    assert not print_hashes_diff(str(hashes_path), str(data_path), lambda: _KEY, 1)
+    assert f"~ {_id(2).hex()}\n" in capsys.readouterr().out
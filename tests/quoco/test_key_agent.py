@@ -0,0 +1,64 @@
+import time
+from base64 import b64decode
+
+import quocofs
+
+from quoco.key_agent import agent_forget_key, agent_key, agent_store_key, stop_agent
+from quoco.quocofs_manager import DEFAULT_CONFIG, QuocoFsManager
+
+_SALT = "LCzJKR9jSyc42WHBrTaUMg=="
+_KEY = bytes(range(32))
+
+
+def test_store_get_stop(tmp_path):
+    """Start the agent by storing a key, read it back, then stop the agent."""
+    socket_path = tmp_path / "agent.sock"
+    assert agent_key(_SALT, socket_path) is None
+
+    assert agent_store_key(_SALT, _KEY, 60, socket_path)
+    try:
+        assert agent_key(_SALT, socket_path) == _KEY
+        assert agent_key("other-salt", socket_path) is None
+    finally:
+        assert stop_agent(socket_path)
+
+    assert agent_key(_SALT, socket_path) is None
+
+
+def test_idle_timeout(tmp_path):
+    """Check that the agent forgets its keys and exits once it's been idle for too long."""
+    socket_path = tmp_path / "agent.sock"
+    assert agent_store_key(_SALT, _KEY, 0.5, socket_path)
+    time.sleep(1)
+    assert agent_key(_SALT, socket_path) is None
+    assert not socket_path.exists()
+
+
+def test_forget(tmp_path):
+    socket_path = tmp_path / "agent.sock"
+    assert not agent_forget_key(_SALT, socket_path)
+
+    assert agent_store_key(_SALT, _KEY, 60, socket_path)
+    try:
+        assert agent_forget_key(_SALT, socket_path)
+        assert agent_key(_SALT, socket_path) is None
+    finally:
+        assert stop_agent(socket_path)
+
+
+def test_key_interactive_stores_only_checked_keys(tmp_path, monkeypatch):
+    """A mistyped password is asked for again instead of being handed to the agent."""
+    socket_path = tmp_path / "agent.sock"
+    monkeypatch.setattr("quoco.key_agent.default_socket_path", lambda: socket_path)
+    passwords = iter(["wrong", "right"])
+    monkeypatch.setattr(QuocoFsManager, "prompt_password", lambda: next(passwords))
+    config = {"agent": {**DEFAULT_CONFIG["agent"], "enabled": True}}
+    salt = QuocoFsManager.DEFAULT_SALT
+    right_key = quocofs.key("right", b64decode(salt))
+    check = quocofs.dumps(b"check", right_key)
+
+    try:
+        assert QuocoFsManager.key_interactive(config, salt, check) == right_key
+        assert agent_key(salt, socket_path) == right_key
+    finally:
+        stop_agent(socket_path)
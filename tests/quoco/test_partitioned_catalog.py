@@ -0,0 +1,171 @@
+import json
+from datetime import date, datetime
+
+import pytest
+
+from quoco.partitioned_catalog import (
+    PLAN_CATALOG_PARTITIONED_NAME,
+    PartitionedCatalog,
+    convert_json_catalog,
+)
+from quoco.plan import (
+    PLAN_CATALOG_ENTRIES_KEY,
+    PLAN_CATALOG_NAME,
+    DayPlan,
+    LifePlan,
+    MonthPlan,
+    YearPlan,
+)
+
+_DAY_ID = b"\x01" * 16
+_OLDER_DAY_ID = b"\x02" * 16
+_MONTH_ID = b"\x03" * 16
+_LIFE_ID = b"\x04" * 16
+
+
+def _json_catalog_data():
+    return {
+        "version": 3,
+        PLAN_CATALOG_ENTRIES_KEY: {
+            _DAY_ID.hex(): {"type": "day", "date": "05-03-2022", "id": _DAY_ID.hex()},
+            _OLDER_DAY_ID.hex(): {
+                "type": "day",
+                "date": "28-12-2021",
+                "id": _OLDER_DAY_ID.hex(),
+            },
+            _MONTH_ID.hex(): {
+                "type": "month",
+                "date": "01-03-2022",
+                "id": _MONTH_ID.hex(),
+            },
+            _LIFE_ID.hex(): {"type": "life", "id": _LIFE_ID.hex()},
+        },
+    }
+
+
+class CountingSession:
+    """Counts reads so tests can check which partitions were decrypted"""
+
+    def __init__(self, session):
+        self._session = session
+        self.reads = []
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def object(self, id):
+        self.reads.append(id)
+        return self._session.object(id)
+
+
+@pytest.fixture
+def saved_manager(manager):
+    catalog_id = manager.session.create_object(
+        json.dumps(_json_catalog_data()).encode("utf-8")
+    )
+    manager.session.set_object_name(catalog_id, PLAN_CATALOG_NAME)
+    convert_json_catalog(manager)
+    manager.session = CountingSession(manager.session)
+    return manager
+
+
+def test_convert_json_catalog_partitions_by_type_and_year(saved_manager):
+    catalog = PartitionedCatalog.from_quocofs(saved_manager)
+
+    assert sorted(catalog.manifest["partitions"]) == [
+        "day/2021",
+        "day/2022",
+        "life",
+        "month/2022",
+    ]
+    assert catalog.get_id(DayPlan(datetime(2022, 3, 5))) == _DAY_ID
+    assert catalog.get_id(DayPlan(datetime(2021, 12, 28))) == _OLDER_DAY_ID
+    assert catalog.get_id(MonthPlan(datetime(2022, 3, 17))) == _MONTH_ID
+    assert catalog.get_id(LifePlan()) == _LIFE_ID
+
+
+def test_only_needed_partitions_are_decrypted(saved_manager):
+    catalog = PartitionedCatalog.from_quocofs(saved_manager)
+    # Just the manifest
+    assert len(saved_manager.session.reads) == 1
+
+    assert catalog.get_ids([DayPlan(datetime(2022, 3, 5)), LifePlan()]) == [
+        _DAY_ID,
+        _LIFE_ID,
+    ]
+    assert catalog.get_id(DayPlan(datetime(2020, 1, 1))) is None
+    assert catalog.get_nth(DayPlan, 0)[0] == _DAY_ID.hex()
+    assert len(saved_manager.session.reads) == 3
+
+    assert catalog.get_nth(DayPlan, 1) == (
+        _OLDER_DAY_ID.hex(),
+        DayPlan(datetime(2021, 12, 28)),
+    )
+    assert catalog.get_nth(DayPlan, 2) is None
+    assert len(saved_manager.session.reads) == 4
+
+
+def test_put_and_save(saved_manager):
+    catalog = PartitionedCatalog.from_quocofs(saved_manager)
+    newest_id = b"\x05" * 16
+    catalog.put(DayPlan(datetime(2023, 1, 2)), newest_id)
+    catalog.put(DayPlan(datetime(2022, 3, 5)), b"\x06" * 16)
+    catalog.save(saved_manager)
+
+    loaded = PartitionedCatalog.from_quocofs(saved_manager)
+    assert loaded.get_nth(DayPlan, 0)[0] == newest_id.hex()
+    assert loaded.get_id(DayPlan(datetime(2022, 3, 5))) == _DAY_ID
+    assert loaded.manifest["partitions"]["day/2022"]["count"] == 1
+
+
+def test_convert_again_keeps_partitioned_entries(saved_manager):
+    catalog = PartitionedCatalog.from_quocofs(saved_manager)
+    newer_id = b"\x05" * 16
+    catalog.put(DayPlan(datetime(2022, 3, 6)), newer_id)
+    catalog.save(saved_manager)
+
+    # The JSON catalog gained an entry too, e.g. from an older quoco
+    json_catalog_id = saved_manager.session.object_id_with_name(PLAN_CATALOG_NAME)
+    json_data = _json_catalog_data()
+    year_id = b"\x06" * 16
+    json_data[PLAN_CATALOG_ENTRIES_KEY][year_id.hex()] = {
+        "type": "year",
+        "date": "01-01-2020",
+        "id": year_id.hex(),
+    }
+    # From a newer quoco
+    json_data[PLAN_CATALOG_ENTRIES_KEY]["07" * 16] = {"type": "decade", "id": "07" * 16}
+    saved_manager.session.modify_object(
+        json_catalog_id, json.dumps(json_data).encode("utf-8")
+    )
+
+    assert convert_json_catalog(saved_manager).id == catalog.id
+    loaded = PartitionedCatalog.from_quocofs(saved_manager)
+    assert loaded.get_id(DayPlan(datetime(2022, 3, 6))) == newer_id
+    assert loaded.get_id(DayPlan(datetime(2022, 3, 5))) == _DAY_ID
+    assert loaded.get_id(YearPlan(datetime(2020, 1, 1))) == year_id
+    assert loaded.manifest["partitions"]["day/2022"]["count"] == 2
+
+
+def test_get_range_across_years(saved_manager):
+    catalog = PartitionedCatalog.from_quocofs(saved_manager)
+
+    assert catalog.get_range(DayPlan, date(2021, 12, 1), date(2022, 3, 5)) == [
+        (_OLDER_DAY_ID.hex(), DayPlan(datetime(2021, 12, 28))),
+        (_DAY_ID.hex(), DayPlan(datetime(2022, 3, 5))),
+    ]
+    assert catalog.get_range(DayPlan, date(2022, 3, 6), date(2022, 3, 31)) == []
+
+
+def test_entries_and_empty_store(manager):
+    catalog = PartitionedCatalog.from_quocofs(manager)
+    assert list(catalog.entries()) == []
+    assert manager.session.object_id_with_name(PLAN_CATALOG_PARTITIONED_NAME)
+
+    catalog = PartitionedCatalog.from_json_data(manager, _json_catalog_data())
+    assert dict(catalog.entries()) == {
+        _DAY_ID.hex(): DayPlan(datetime(2022, 3, 5)),
+        _OLDER_DAY_ID.hex(): DayPlan(datetime(2021, 12, 28)),
+        _MONTH_ID.hex(): MonthPlan(datetime(2022, 3, 1)),
+        _LIFE_ID.hex(): LifePlan(),
+    }
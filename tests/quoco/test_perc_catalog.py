@@ -0,0 +1,99 @@
+import pytest
+
+from quoco.perc_catalog import (
+    PERC_HEADER,
+    RECORD_LENGTH,
+    PercReader,
+    PercWriter,
+    sort_perc_catalog,
+    write_perc_catalog,
+)
+from quoco.quocofs_migration import _debug_catalog
+
+
+def _records(count):
+    return [(bytes([i]) * 16, bytes([255 - i]) * 32) for i in range(count)]
+
+
+def test_write_and_read(tmp_path):
+    path = tmp_path / "catalog"
+    records = _records(50)
+    assert write_perc_catalog(path, reversed(records)) == 50
+    assert path.stat().st_size == len(PERC_HEADER) + 50 * RECORD_LENGTH
+
+    with PercReader(path) as reader:
+        reader.validate()
+        assert reader.is_sorted()
+        assert len(reader) == 50
+        assert [(bytes(id), bytes(hash)) for id, hash in reader] == records
+        assert bytes(reader.get(records[17][0])) == records[17][1]
+        assert reader.index(records[0][0]) == 0
+        assert reader.index(records[-1][0]) == 49
+        assert reader.get(b"\xff" * 16) is None
+
+
+def test_empty_catalog(tmp_path):
+    path = tmp_path / "catalog"
+    write_perc_catalog(path, [])
+
+    with PercReader(path) as reader:
+        reader.validate()
+        assert len(reader) == 0
+        assert reader.get(bytes(16)) is None
+
+
+def test_writer_rejects_unsorted(tmp_path):
+    with open(tmp_path / "catalog", "wb") as perc_file:
+        writer = PercWriter(perc_file)
+        writer.write(b"\x02" * 16, bytes(32))
+        with pytest.raises(ValueError, match="out of order"):
+            writer.write(b"\x01" * 16, bytes(32))
+
+
+def test_reader_rejects_invalid_files(tmp_path):
+    path = tmp_path / "catalog"
+    path.write_bytes(b"nope\0")
+    with pytest.raises(ValueError, match="isn't a perc catalog"):
+        PercReader(path)
+
+    path.write_bytes(PERC_HEADER + bytes(RECORD_LENGTH - 1))
+    with pytest.raises(ValueError, match="partial record"):
+        PercReader(path)
+
+    path.write_bytes(PERC_HEADER + b"\x02" * 49 + b"\x01" * 49)
+    with PercReader(path) as reader, pytest.raises(ValueError, match="separator"):
+        reader.validate()
+
+
+def test_unsorted_legacy_catalog(tmp_path):
+    path = tmp_path / "catalog"
+    records = _records(3)
+    path.write_bytes(
+        PERC_HEADER + b"".join(id + b"\0" + hash for id, hash in reversed(records))
+    )
+
+    with PercReader(path) as reader:
+        reader.validate()
+        assert not reader.is_sorted()
+        assert [(bytes(id), bytes(hash)) for id, hash in reader] == records[::-1]
+        with pytest.raises(ValueError, match="sort_perc_catalog"):
+            reader.get(records[0][0])
+
+    assert sort_perc_catalog(path) == 3
+    with PercReader(path) as reader:
+        assert reader.is_sorted()
+        assert bytes(reader.get(records[0][0])) == records[0][1]
+
+
+def test_debug_catalog_lists_unsorted_catalogs(tmp_path, capsys):
+    path = tmp_path / "catalog"
+    records = _records(2)
+    path.write_bytes(
+        PERC_HEADER + b"".join(id + b"\0" + hash for id, hash in reversed(records))
+    )
+
+    with pytest.warns(DeprecationWarning):
+        _debug_catalog(str(path))
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "valid catalog, reading..."
+    assert lines[1:] == [f"{id.hex()} {hash.hex()}" for id, hash in reversed(records)]
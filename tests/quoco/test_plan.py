@@ -0,0 +1,153 @@
+import io
+from datetime import date, datetime
+
+import pytest
+
+from quoco.plan import (
+    LAYOUTS,
+    CachePlan,
+    Catalog,
+    ClutterPlan,
+    DayPlan,
+    DecisionStreamPlan,
+    LifePlan,
+    MonthPlan,
+    PlanArgument,
+    WeekPlan,
+    YearPlan,
+    _dispatch_table,
+    carry_forward_content,
+    compile_layout,
+    export_plan_range,
+    resolve_plan_documents,
+    write_plan_range,
+)
+
+
+def _old_carry_forward(text):
+    return "\n".join(
+        map(lambda s: ";" + s, "\n".join(text.splitlines()[1:]).lstrip().splitlines())
+    )
+
+
+def test_carry_forward_matches_previous_behavior(manager):
+    texts = [
+        "# Title\n\n\n  first\n  second\n\nthird\n",
+        "# Title\n \t\n",
+        "# Title",
+        "",
+        "# Title\r\nline\r\n\r\nlast",
+        "# t\n\nfoo\n\n\n",
+        "# t\nfoo\n\n",
+        "# t\nfoo\n \n",
+    ]
+    for text in texts:
+        id = manager.create_object(text.encode("utf-8"))
+        assert carry_forward_content(manager, id) == _old_carry_forward(text)
+
+
+def test_carry_forward_cached_until_modified(manager):
+    id = manager.create_object(b"# Title\nfirst")
+    assert carry_forward_content(manager, id) == ";first"
+
+    reads = []
+    manager.session.object = lambda id: reads.append(id) or manager.session.objects[id]
+    assert carry_forward_content(manager, id) == ";first"
+    assert reads == []
+
+    manager.modify_object(id, b"# Title\nsecond")
+    assert carry_forward_content(manager, id) == ";second"
+    assert reads == [id]
+
+
+def test_new_plan_carries_forward_previous(manager):
+    catalog = Catalog.from_quocofs(manager)
+    (first_id,) = resolve_plan_documents(manager, catalog, "d -- 03.01.2022")
+    manager.modify_object(first_id, b"# Title\n\ntodo")
+
+    (second_id,) = resolve_plan_documents(manager, catalog, "d -- 03.02.2022")
+    content = manager.session.object(second_id).decode("utf-8")
+    assert content.startswith(DayPlan(datetime(2022, 3, 2)).default_content())
+    assert content.endswith(";todo")
+
+
+def test_dispatch_table_rejects_shared_char_name():
+    with pytest.raises(ValueError, match="both use"):
+        _dispatch_table(
+            [ClutterPlan, type("OtherPlan", (LifePlan,), {"char_name": "x"})]
+        )
+
+
+def test_compile_layout():
+    assert compile_layout("t c~2 l+1 q", LAYOUTS) == [
+        PlanArgument(DayPlan),
+        PlanArgument(WeekPlan),
+        PlanArgument(MonthPlan),
+        PlanArgument(YearPlan),
+        PlanArgument(LifePlan),
+        PlanArgument(CachePlan, "~", 2),
+        PlanArgument(LifePlan),
+    ]
+    # Layouts only expand as whole arguments
+    assert compile_layout("t+1", LAYOUTS) == [PlanArgument(DecisionStreamPlan, "+", 1)]
+
+
+def test_compile_user_layout():
+    layouts = {**LAYOUTS, "review": "w w-1 C"}
+    assert compile_layout("review", layouts) == [
+        PlanArgument(WeekPlan),
+        PlanArgument(WeekPlan, "-", 1),
+        PlanArgument(CachePlan, "-", 1),
+        PlanArgument(CachePlan),
+        PlanArgument(CachePlan, "+", 1),
+    ]
+
+    with pytest.raises(ValueError, match="includes itself"):
+        compile_layout("a", {"a": "d b", "b": "a"})
+
+
+def test_resolve_creates_repeated_plan_once(manager):
+    catalog = Catalog.from_quocofs(manager)
+    manager.config["layouts"]["twice"] = "d d-0"
+
+    first, second = resolve_plan_documents(manager, catalog, "twice -- 03.01.2022")
+    assert first == second
+    assert catalog.get_id(DayPlan(datetime(2022, 3, 1))) == first
+    assert resolve_plan_documents(manager, catalog, "d -- 03.01.2022") == [first]
+
+
+def test_write_plan_range(manager):
+    catalog = Catalog.from_quocofs(manager)
+    for day in (1, 2, 3):
+        manager.session.modify_object(
+            resolve_plan_documents(manager, catalog, f"d -- 03.0{day}.2022")[0],
+            f"# {day}".encode("utf-8"),
+        )
+
+    output = io.BytesIO()
+    assert (
+        write_plan_range(
+            manager, catalog, DayPlan, date(2022, 3, 2), date(2022, 3, 3), output
+        )
+        == 2
+    )
+    assert output.getvalue() == b"# 2\n\n# 3\n"
+
+
+def test_export_plan_range_writes_only_plans_to_stdout(
+    manager, prompting_manager_class, monkeypatch, capsysbinary
+):
+    catalog = Catalog.from_quocofs(manager)
+    for day in (1, 2):
+        manager.session.modify_object(
+            resolve_plan_documents(manager, catalog, f"d -- 03.0{day}.2022")[0],
+            f"# {day}".encode("utf-8"),
+        )
+    catalog.save(manager)
+    monkeypatch.setattr("quoco.plan.QuocoFsManager", prompting_manager_class)
+
+    export_plan_range("d", "03.01.2022", "03.02.2022")
+
+    captured = capsysbinary.readouterr()
+    assert captured.out == b"# 1\n\n# 2\n"
+    assert b"password failed" in captured.err
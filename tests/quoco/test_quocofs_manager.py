@@ -0,0 +1,100 @@
+import os
+import stat
+import tempfile
+
+import pytest
+
+
+def test_materialize_documents_keeps_order(manager):
+    ids = [manager.create_object(f"document {i}".encode("utf-8")) for i in range(5)]
+
+    paths = manager.materialize_documents(ids)
+    try:
+        assert [open(path, "rb").read() for path in paths] == [
+            f"document {i}".encode("utf-8") for i in range(5)
+        ]
+    finally:
+        manager.remove_documents(paths)
+
+
+def test_materialize_documents_private_files(manager):
+    ids = [manager.create_object(b"document") for _ in range(3)]
+
+    paths = manager.materialize_documents(ids)
+    try:
+        assert len({os.path.dirname(path) for path in paths}) == 1
+        for path in paths:
+            assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        assert stat.S_IMODE(os.stat(os.path.dirname(paths[0])).st_mode) == 0o700
+    finally:
+        manager.remove_documents(paths)
+
+
+def test_materialize_documents_opens_repeated_documents_once(manager):
+    """Layouts like `k t` both include the day plan"""
+    day_id, week_id = [manager.create_object(name) for name in (b"day", b"week")]
+    writes = manager.session.writes
+
+    paths = manager.materialize_documents([day_id, week_id, day_id])
+    assert paths[0] == paths[2] != paths[1]
+    with open(paths[2], "ab") as document_file:
+        document_file.write(b" edited")
+
+    assert manager.commit_documents([day_id, week_id, day_id], paths) == [day_id]
+    assert manager.session.writes == writes + 1
+    assert manager.session.object(day_id) == b"day edited"
+    assert not os.path.exists(os.path.dirname(paths[0]))
+
+
+def test_materialize_documents_cleans_up_after_failure(manager, monkeypatch):
+    ids = [manager.create_object(b"document"), b"\x00" * 16]
+    directories = []
+    mkdtemp = tempfile.mkdtemp
+    monkeypatch.setattr(
+        tempfile,
+        "mkdtemp",
+        lambda **kwargs: directories.append(mkdtemp(**kwargs)) or directories[-1],
+    )
+
+    with pytest.raises(KeyError):
+        manager.materialize_documents(ids)
+    assert not os.path.exists(directories[0])
+
+
+def test_report_materialize_timings(manager, capsys):
+    ids = [manager.create_object(b"document")]
+    manager.remove_documents(manager.materialize_documents(ids))
+
+    manager.report_materialize_timings()
+    assert capsys.readouterr().err == ""
+
+    manager.config["vim"]["report"] = True
+    manager.report_materialize_timings()
+    assert capsys.readouterr().err.startswith(f"decrypted: {ids[0].hex()[:8]} ")
+
+
+def test_commit_documents_skips_unchanged(manager):
+    ids = [manager.create_object(f"document {i}".encode("utf-8")) for i in range(3)]
+    paths = manager.materialize_documents(ids)
+    with open(paths[1], "ab") as document_file:
+        document_file.write(b" edited")
+    writes = manager.session.writes
+
+    assert manager.commit_documents(ids, paths) == [ids[1]]
+    assert manager.session.writes == writes + 1
+    assert manager.session.object(ids[1]) == b"document 1 edited"
+    assert not os.path.exists(os.path.dirname(paths[0]))
+
+
+def test_edit_documents_vim_cleans_up_when_the_editor_fails(manager, monkeypatch):
+    ids = [manager.create_object(b"document")]
+    opened = []
+
+    def failing_call(command, shell):
+        opened.append(command.split()[-1])
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr("subprocess.call", failing_call)
+    with pytest.raises(KeyboardInterrupt):
+        manager.edit_documents_vim(ids)
+    assert not os.path.exists(opened[0])
@@ -0,0 +1,149 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from hashlib import sha256
+
+import pytest
+
+from quoco import quocofs_migration
+
+from quoco.plan import Catalog, DayPlan, LifePlan, MonthPlan
+from quoco.quocofs_migration import (
+    HASH_BLOCK_LENGTH,
+    INGEST_CHECKPOINT_NAME,
+    _load_ingest_checkpoint,
+    create_hashes,
+    hash_files,
+    ingest_documents,
+)
+
+
+def _write_plans(directory):
+    files = {
+        "day_5_3_2022.md": b"# day",
+        "month_3_2022.md": b"# month",
+        "life.md": b"# life",
+        "day_notes.md": b"not a plan",
+        "semester_foo_2022.md": b"not a semester",
+        "shopping.md": b"not a plan either",
+    }
+    for name, content in files.items():
+        (directory / name).write_bytes(content)
+    return sorted(directory.glob("*.md"))
+
+
+def test_ingest_documents(manager, tmp_path):
+    paths = _write_plans(tmp_path)
+    catalog = Catalog.from_quocofs(manager)
+    catalog.put(LifePlan(), manager.create_object(b"# existing life"))
+    checkpoint_path = tmp_path / INGEST_CHECKPOINT_NAME
+
+    assert ingest_documents(manager, catalog, paths, checkpoint_path, 2) == (2, 4, 0)
+
+    day_id = catalog.get_id(DayPlan(datetime(2022, 3, 5)))
+    assert manager.session.object(day_id) == b"# day"
+    month_id = catalog.get_id(MonthPlan(datetime(2022, 3, 1)))
+    assert manager.session.object(month_id) == b"# month"
+    assert manager.session.object(catalog.get_id(LifePlan())) == b"# existing life"
+    assert len(checkpoint_path.read_text().splitlines()) == 2
+
+
+def test_ingest_documents_resumes_from_checkpoint(manager, tmp_path):
+    paths = _write_plans(tmp_path)
+    checkpoint_path = tmp_path / INGEST_CHECKPOINT_NAME
+    # An earlier run created the day plan, then stopped before saving the catalog
+    day_id = manager.create_object(b"# day")
+    checkpoint_path.write_text(
+        json.dumps(
+            {
+                "path": str(tmp_path / "day_5_3_2022.md"),
+                "id": day_id.hex(),
+                "entry": DayPlan(datetime(2022, 3, 5)).serialize(),
+            }
+        )
+        + "\n"
+        + '{"path": "torn'
+    )
+    writes = manager.session.writes
+
+    catalog = Catalog.from_quocofs(manager)
+    assert ingest_documents(manager, catalog, paths, checkpoint_path) == (3, 3, 0)
+
+    assert catalog.get_id(DayPlan(datetime(2022, 3, 5))) == day_id
+    # Catalog creation, plus only the month and life plans
+    assert manager.session.writes == writes + 3
+    assert len(_load_ingest_checkpoint(checkpoint_path)) == 3
+
+
+def test_ingest_documents_keeps_going_after_a_failure(manager, tmp_path, capsys):
+    paths = _write_plans(tmp_path)
+    unreadable = tmp_path / "day_2_3_2022.md"
+    unreadable.mkdir()
+    paths.append(unreadable)
+    checkpoint_path = tmp_path / INGEST_CHECKPOINT_NAME
+    catalog = Catalog.from_quocofs(manager)
+
+    assert ingest_documents(manager, catalog, paths, checkpoint_path, 2) == (3, 3, 1)
+    assert f"couldn't ingest {unreadable}" in capsys.readouterr().err
+    assert len(_load_ingest_checkpoint(checkpoint_path)) == 3
+    assert catalog.get_id(DayPlan(datetime(2022, 3, 2))) is None
+
+
+def test_interrupted_ingest_checkpoints_every_created_document(
+    manager, tmp_path, monkeypatch
+):
+    paths = _write_plans(tmp_path)
+    checkpoint_path = tmp_path / INGEST_CHECKPOINT_NAME
+    catalog = Catalog.from_quocofs(manager)
+    writes = manager.session.writes
+
+    def interrupted_put(entry, id):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(catalog, "put", interrupted_put)
+    with pytest.raises(KeyboardInterrupt):
+        ingest_documents(manager, catalog, paths, checkpoint_path, 1)
+
+    created = manager.session.writes - writes
+    assert created >= 1
+    assert len(_load_ingest_checkpoint(checkpoint_path)) == created
+
+
+def test_hash_files_uses_cache(tmp_path, monkeypatch):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"{i}.md"
+        path.write_bytes(bytes([i]) * (HASH_BLOCK_LENGTH + i))
+        paths.append(path)
+    cache_path = tmp_path / "cache"
+
+    hashes = hash_files(paths, cache_path, 2)
+    assert hashes == {path: sha256(path.read_bytes()).hexdigest() for path in paths}
+
+    os.utime(paths[1], ns=(0, 0))
+    hashed = []
+    monkeypatch.setattr(
+        quocofs_migration,
+        "ProcessPoolExecutor",
+        lambda max_workers: ThreadPoolExecutor(max_workers),
+    )
+    monkeypatch.setattr(
+        quocofs_migration, "hash_file", lambda path: hashed.append(path) or "changed"
+    )
+    assert hash_files(paths, cache_path)[paths[1]] == "changed"
+    assert hashed == [paths[1]]
+
+
+def test_create_hashes_is_quiet_unless_verbose(tmp_path, capsys):
+    (tmp_path / "abc.md").write_bytes(b"# day")
+    catalog_data = {"documents": {"abc": {}}}
+
+    create_hashes(catalog_data, str(tmp_path))
+    assert catalog_data["documents"]["abc"]["hash"] == sha256(b"# day").hexdigest()
+    assert capsys.readouterr() == ("", "")
+
+    create_hashes(catalog_data, str(tmp_path), verbose=True)
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert sha256(b"# day").hexdigest() in captured.err
@@ -0,0 +1,21 @@
+import pytest
+
+from quoco.remote import Remote, create_remote
+
+
+def test_create_google_remote(tmp_path):
+    """The Google remote hands the accessor the service account file from the config directory."""
+    remote = create_remote({"type": "google", "bucket": "plans"}, tmp_path)
+    assert remote.bucket_name == "plans"
+    assert remote.start() == tmp_path / "google-service-account.json"
+
+
+def test_fail_create_unknown_remote(tmp_path):
+    """Refuse to create a remote with an unknown type."""
+    with pytest.raises(ValueError):
+        create_remote({"type": "s3", "bucket": "quocofs"}, tmp_path)
+
+
+def test_remote_needs_start():
+    with pytest.raises(TypeError):
+        Remote()
@@ -0,0 +1,84 @@
+import json
+from datetime import datetime
+
+from quoco.plan import Catalog, DayPlan, LifePlan
+from quoco.search import (
+    SearchIndex,
+    reindex,
+    search,
+    snippet,
+    update_search_index,
+)
+
+
+def test_index_search_ranks_matches():
+    index = SearchIndex.empty()
+    index.update("a", b"# day\nbuy milk\nbuy eggs")
+    index.update("b", b"# day\nmilk")
+    index.update("c", b"# life\nsomething else entirely, at some length")
+
+    assert [result.hex_id for result in index.search("milk")] == ["b", "a"]
+    assert [result.hex_id for result in index.search("eggs milk")][0] == "a"
+    assert index.search("nothing") == []
+
+
+def test_index_update_only_retokenizes_changes():
+    index = SearchIndex.empty()
+    assert index.update("a", b"old words")
+    assert not index.update("a", b"old words")
+    assert index.update("a", b"new words")
+
+    assert index.search("old") == []
+    assert [result.hex_id for result in index.search("new")] == ["a"]
+
+    index.retain([])
+    assert index.search("words") == []
+
+
+def test_index_stores_terms_once():
+    index = SearchIndex.empty()
+    index.update("a", b"old words")
+    index.update("b", b"other words")
+
+    # Like loading it again
+    index = SearchIndex(json.loads(json.dumps(index.data)), None)
+    assert "terms" not in index.data["documents"]["a"]
+    assert index.update("a", b"new")
+
+    assert index.data["postings"] == {
+        "new": {"a": 1},
+        "other": {"b": 1},
+        "words": {"b": 1},
+    }
+
+
+def test_snippet():
+    assert snippet("# day\n\n- call the dentist\n", "Dentist") == "- call the dentist"
+    assert snippet("# day", "dentist") == ""
+
+
+def test_reindex_and_search(manager):
+    catalog = Catalog.from_quocofs(manager)
+    day_id = manager.create_object(b"# day\ncall the dentist")
+    life_id = manager.create_object(b"# life\nlearn the cello")
+    catalog.put(DayPlan(datetime(2022, 3, 5)), day_id)
+    catalog.put(LifePlan(), life_id)
+
+    # Edits aren't indexed until the index exists
+    update_search_index(manager, [day_id])
+    assert search(manager, catalog, "dentist") is None
+
+    assert reindex(manager, catalog) == 2
+    assert reindex(manager, catalog) == 0
+
+    manager.modify_object(life_id, b"# life\nlearn the dentist's cello")
+    update_search_index(manager, [life_id])
+
+    results = search(manager, catalog, "cello")
+    assert [(result.entry, result.snippet) for result in results] == [
+        (LifePlan(), "learn the dentist's cello")
+    ]
+    assert [result.entry for result in search(manager, catalog, "dentist")] == [
+        DayPlan(datetime(2022, 3, 5)),
+        LifePlan(),
+    ]
@@ -0,0 +1,136 @@
+import json
+from datetime import date, datetime
+
+import pytest
+
+from quoco.plan import (
+    DayPlan,
+    LifePlan,
+    MonthPlan,
+    PLAN_CATALOG_ENTRIES_KEY,
+    PLAN_CATALOG_NAME,
+)
+from quoco.sqlite_catalog import (
+    SqliteCatalog,
+    _dump_database,
+    _load_database,
+    convert_json_catalog,
+)
+
+_DAY_ID = b"\x01" * 16
+_OLDER_DAY_ID = b"\x02" * 16
+_MONTH_ID = b"\x03" * 16
+_LIFE_ID = b"\x04" * 16
+
+
+def _json_catalog_data():
+    return {
+        "version": 3,
+        PLAN_CATALOG_ENTRIES_KEY: {
+            _DAY_ID.hex(): {"type": "day", "date": "05-03-2022", "id": _DAY_ID.hex()},
+            _OLDER_DAY_ID.hex(): {
+                "type": "day",
+                "date": "28-02-2022",
+                "id": _OLDER_DAY_ID.hex(),
+            },
+            _MONTH_ID.hex(): {
+                "type": "month",
+                "date": "01-03-2022",
+                "id": _MONTH_ID.hex(),
+            },
+            _LIFE_ID.hex(): {"type": "life", "id": _LIFE_ID.hex()},
+        },
+    }
+
+
+def test_convert_json_catalog():
+    """Convert version 3 JSON catalog data and look up every entry."""
+    catalog = SqliteCatalog.from_json_data(_json_catalog_data())
+    assert catalog.get_id(DayPlan(datetime(2022, 3, 5))) == _DAY_ID
+    assert catalog.get_id(DayPlan(datetime(2022, 2, 28))) == _OLDER_DAY_ID
+    assert catalog.get_id(MonthPlan(datetime(2022, 3, 17))) == _MONTH_ID
+    assert catalog.get_id(LifePlan()) == _LIFE_ID
+
+
+def test_fail_convert_unknown_version():
+    """Refuse to convert JSON catalog data that isn't version 3."""
+    with pytest.raises(ValueError):
+        SqliteCatalog.from_json_data({"version": 2, PLAN_CATALOG_ENTRIES_KEY: {}})
+
+
+def test_get_nth_and_put():
+    """Check date ordering, including an entry put after the catalog was built."""
+    catalog = SqliteCatalog.from_json_data(_json_catalog_data())
+    assert catalog.get_nth(DayPlan, 0) == (_DAY_ID.hex(), DayPlan(datetime(2022, 3, 5)))
+    assert catalog.get_nth(DayPlan, 2) is None
+
+    newest_id = b"\x05" * 16
+    catalog.put(DayPlan(datetime(2022, 3, 6)), newest_id)
+    assert catalog.get_nth(DayPlan, 0)[0] == newest_id.hex()
+    assert catalog.get_nth(DayPlan, 2)[0] == _OLDER_DAY_ID.hex()
+
+
+def test_dump_load_database():
+    """Dump a catalog database to bytes and load it back."""
+    catalog = SqliteCatalog.from_json_data(_json_catalog_data())
+    loaded = SqliteCatalog(_load_database(_dump_database(catalog.connection)), None)
+    assert loaded.get_id(DayPlan(datetime(2022, 3, 5))) == _DAY_ID
+    assert loaded.get_id(LifePlan()) == _LIFE_ID
+
+
+def test_get_ids():
+    catalog = SqliteCatalog.from_json_data(_json_catalog_data())
+
+    assert catalog.get_ids([]) == []
+    assert catalog.get_ids(
+        [
+            LifePlan(),
+            DayPlan(datetime(2022, 3, 6)),
+            DayPlan(datetime(2022, 3, 5)),
+            LifePlan(),
+        ]
+    ) == [_LIFE_ID, None, _DAY_ID, _LIFE_ID]
+
+
+def test_get_range():
+    catalog = SqliteCatalog.from_json_data(_json_catalog_data())
+
+    assert catalog.get_range(DayPlan, date(2022, 2, 1), date(2022, 3, 5)) == [
+        (_OLDER_DAY_ID.hex(), DayPlan(datetime(2022, 2, 28))),
+        (_DAY_ID.hex(), DayPlan(datetime(2022, 3, 5))),
+    ]
+    assert catalog.get_range(DayPlan, date(2022, 3, 6), date(2022, 3, 31)) == []
+
+
+def test_entries():
+    data = _json_catalog_data()
+    # From a newer quoco
+    data[PLAN_CATALOG_ENTRIES_KEY]["05" * 16] = {"type": "decade", "id": "05" * 16}
+    catalog = SqliteCatalog.from_json_data(data)
+
+    assert dict(catalog.entries()) == {
+        _DAY_ID.hex(): DayPlan(datetime(2022, 3, 5)),
+        _OLDER_DAY_ID.hex(): DayPlan(datetime(2022, 2, 28)),
+        _MONTH_ID.hex(): MonthPlan(datetime(2022, 3, 1)),
+        _LIFE_ID.hex(): LifePlan(),
+    }
+
+
+def test_convert_again_keeps_sqlite_entries(manager):
+    """Re-running the conversion merges instead of replacing entries added through the SQLite engine."""
+    json_id = manager.session.create_object(
+        json.dumps(_json_catalog_data()).encode("utf-8")
+    )
+    manager.session.set_object_name(json_id, PLAN_CATALOG_NAME)
+    catalog = convert_json_catalog(manager)
+    newest_id = b"\x05" * 16
+    catalog.put(DayPlan(datetime(2022, 3, 6)), newest_id)
+    catalog.save(manager)
+
+    converted = convert_json_catalog(manager)
+    assert converted.id == catalog.id
+    assert (
+        SqliteCatalog.from_quocofs(manager).get_id(DayPlan(datetime(2022, 3, 6)))
+        == newest_id
+    )
+    assert converted.get_id(LifePlan()) == _LIFE_ID
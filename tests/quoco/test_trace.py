@@ -0,0 +1,67 @@
+import json
+import threading
+
+import pytest
+
+from quoco.plan import Catalog
+from quoco.util import trace
+
+
+@pytest.fixture
+def trace_path(tmp_path):
+    path = tmp_path / "trace.json"
+    trace.enable(path)
+    yield path
+    trace.finish()
+
+
+def _events(path):
+    trace.finish()
+    return json.loads(path.read_text())["traceEvents"]
+
+
+def _worker():
+    with trace.span("worker"):
+        pass
+
+
+def test_span_is_a_no_op_when_disabled():
+    assert not trace.is_enabled()
+    with trace.span("nothing"):
+        pass
+    trace.finish()
+
+
+def test_spans_nest_and_only_outer_main_thread_spans_are_top_level(trace_path):
+    with trace.span("outer", detail=1):
+        with trace.span("inner"):
+            pass
+        worker = threading.Thread(target=_worker)
+        worker.start()
+        worker.join()
+
+    events = {event["name"]: event for event in _events(trace_path)}
+    assert events["outer"]["args"] == {"detail": 1, "top_level": True}
+    assert events["inner"]["args"] == {}
+    assert events["worker"]["args"] == {}
+    assert events["outer"]["ts"] <= events["inner"]["ts"]
+    assert all(event["ph"] == "X" for event in events.values())
+
+
+def test_summary_leaves_out_waiting_time(trace_path, capsys):
+    with trace.span("edit"):
+        with trace.span("editor", waiting=True):
+            pass
+
+    summary = trace.summary()
+    assert "(+" in summary and "waiting): edit " in summary
+    trace.finish()
+    assert f"trace in {trace_path}" in capsys.readouterr().err
+
+
+def test_catalog_load_is_traced(trace_path, manager):
+    Catalog.from_quocofs(manager)
+
+    names = [event["name"] for event in _events(trace_path)]
+    assert "Catalog.from_quocofs" in names
+    assert "index_catalog" in names
@@ -1,6 +1,6 @@
 import itertools
 import random
-from typing import Optional
+from typing import List, Optional
 
 import pytest
 
@@ -15,25 +15,34 @@ _ENCRYPT_RANDOM_BYTES_SEED = 6_283185307
 _ENCRYPT_RANDOM_BYTES_SIZE = 8192
 
 
-def _encrypt_random_bytes_params():
-    """Generate random test data around chunk boundaries."""
-    # TODO(vinhowe): Is there any reason why it would be better to use file data for this?
-    random.seed(_ENCRYPT_RANDOM_BYTES_SEED)
-    return [
-        pytest.param(random.randbytes(n), id=f"{n} bytes")
-        for n in itertools.chain.from_iterable(
+def chunk_boundary_sizes(
+    chunk_count: int = _ENCRYPT_RANDOM_BYTES_PARAMETER_CHUNK_COUNT,
+    padding: int = _ENCRYPT_RANDOM_BYTES_PARAMETER_CHUNK_PADDING,
+) -> List[int]:
+    """Data sizes within `padding` bytes of the first `chunk_count` chunk boundaries. Also used by the benchmarks."""
+    return list(
+        itertools.chain.from_iterable(
             range(
                 max(
                     0,
-                    chunk_boundary - _ENCRYPT_RANDOM_BYTES_PARAMETER_CHUNK_PADDING,
+                    chunk_boundary - padding,
                 ),
-                chunk_boundary + _ENCRYPT_RANDOM_BYTES_PARAMETER_CHUNK_PADDING,
+                chunk_boundary + padding,
             )
             for chunk_boundary in [
-                chunk_i * quocofs.CHUNK_LENGTH
-                for chunk_i in range(_ENCRYPT_RANDOM_BYTES_PARAMETER_CHUNK_COUNT)
+                chunk_i * quocofs.CHUNK_LENGTH for chunk_i in range(chunk_count)
             ]
         )
+    )
+
+
+def _encrypt_random_bytes_params():
+    """Generate random test data around chunk boundaries."""
+    # TODO(vinhowe): Is there any reason why it would be better to use file data for this?
+    random.seed(_ENCRYPT_RANDOM_BYTES_SEED)
+    return [
+        pytest.param(random.randbytes(n), id=f"{n} bytes")
+        for n in chunk_boundary_sizes()
     ]
 
 